@@ -3,21 +3,42 @@ Flask Backend API for Dashboard
 Connects website to Discord bot with real-time data
 Serves both API routes AND static files on same port
 """
-from flask import Flask, jsonify, request, session, redirect, url_for, send_from_directory
+from flask import Flask, Response, g, jsonify, request, session, redirect, url_for, send_from_directory
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
+import base64
 import json
 import os
 import sys
 import asyncio
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
 from typing import Optional
 import aiohttp
-import discord
 import requests
 import re
 import time
-import urllib.error
 from dotenv import load_dotenv
+from cape_jobs import ResolutionJobs
+from resolution_cache import get_resolution_cache
+from batch_resolver import THUMBNAILS_HOST, get_thumbnail_batcher
+from singleflight import SingleFlight, image_id_flight_key, image_id_flights
+from journal import journaled
+from json_cache import json_file_cache
+from cape_store import CapeStore, SOURCE_CAPE_LOGS, decode_cursor
+from discord_gateway import DiscordGateway
+from stats_cache import BackgroundRefresher
+from stats_aggregates import StatsAggregates
+from http_pool import http_client
+from metrics import metrics
+from tracing import install_flask, span, tracer
+from rate_limiter import rate_limiter
+from cape_events import StatusHub
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from static_assets import StaticPipeline
+from cape_ingest import CAPE_UPLOAD_REQUEST_MAX_BYTES, UploadRejected, ingest_upload, normalize_cape_image, too_large
+from bulk_upload import BULK_UPLOAD_MAX_FILES, close_items, ndjson_line, spool_files, upload_all_sync
+from upload_index import content_hash, get_upload_index
 
 # Add parent directory to path to import cape_generation
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
@@ -28,20 +49,50 @@ except ImportError as e:
     print(f"[API] Warning: Could not import cape upload functions: {e}")
     CAPE_UPLOAD_AVAILABLE = False
 
+try:
+    from cape_renderer import RenderError, render_cape_png, render_many
+    CAPE_RENDER_AVAILABLE = True
+except ImportError as e:
+    print(f"[API] Warning: Could not import cape renderer (needs numpy + Pillow): {e}")
+    CAPE_RENDER_AVAILABLE = False
+
 # Load environment variables
 load_dotenv('../.env')
 
-# Create Flask app - serve static files from current directory
-app = Flask(__name__, static_folder='.', static_url_path='')
+# Create Flask app - static files are served from the current directory by serve_static
+# (Flask's own static route would shadow it, so it's disabled)
+app = Flask(__name__, static_folder=None)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'change-this-secret-key-in-production-12345')
+# Hard cap on request bodies (uploads are also capped per image in cape_ingest.py)
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_REQUEST_BYTES', str(100 * 1024 * 1024)))
 CORS(app, supports_credentials=True)
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Per-route latency (to the response headers - streamed bodies keep going after this)"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        rule = request.url_rule.rule if request.url_rule else '<unmatched>'
+        metrics.observe_route(f'{request.method} {rule}', response.status_code, time.perf_counter() - started)
+    return response
+
+# Sampled request tracing - installs nothing unless TRACE_SAMPLE_RATE > 0 (see tracing.py)
+install_flask(app)
+
 # Discord Bot Configuration
 DISCORD_BOT_TOKEN = os.getenv('DISCORD_TOKEN')
 DISCORD_CLIENT_ID = os.getenv('DISCORD_CLIENT_ID', '')
 DISCORD_CLIENT_SECRET = os.getenv('DISCORD_CLIENT_SECRET', '')
 DISCORD_REDIRECT_URI = os.getenv('DISCORD_REDIRECT_URI', 'http://localhost:5000/api/auth/callback')
 DISCORD_SCOPE = 'identify guilds'
+DISCORD_API_URL = os.getenv('DISCORD_API_URL', 'https://discord.com/api').rstrip('/')
+# Off = no gateway connection (e.g. benchmarks against stub services) - authorization checks then fail closed
+DISCORD_GATEWAY_ENABLED = os.getenv('DISCORD_GATEWAY_ENABLED', 'true').lower() == 'true'
+ROBLOX_ASSETDELIVERY_URL = os.getenv('ROBLOX_ASSETDELIVERY_URL', 'https://assetdelivery.roblox.com').rstrip('/')
 
 # Guild IDs
 MAIN_GUILD_ID = 1239943702336766004  # Main server for stats
@@ -56,24 +107,49 @@ MODERATION_ROLE_NAME = "discord moderation"  # From moderation_quota.py
 MODERATION_ADMIN_ROLE_ID = 1411690716010254447  # From moderation_quota.py
 EVMD_ROLE_ID = 1414307847738757120  # From evmd_quota.py
 
-# Data file paths (relative to parent directory)
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)))
+# Discord bot's local API (real-time stats and tickets)
+BOT_API_URL = os.getenv('BOT_API_URL', 'http://localhost:5001')
+# Fails fast while the bot is down/restarting instead of waiting out every timeout
+bot_api_breaker = CircuitBreaker('bot API')
+
+def bot_api_get(path, timeout):
+    """
+    GET from the bot's local API through its circuit breaker
+    Raises CircuitOpenError (immediately) while the bot is unhealthy
+    """
+    def fetch():
+        response = http_client.get(f'{BOT_API_URL}{path}', timeout=timeout)
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response
+    return bot_api_breaker.call(fetch)
+
+# Data file paths (relative to parent directory, or BOT_DATA_DIR)
+DATA_DIR = os.getenv('BOT_DATA_DIR') or os.path.join(os.path.dirname(os.path.dirname(__file__)))
 
 def load_json_file(filename):
-    """Load JSON file from bot's data directory"""
-    filepath = os.path.join(DATA_DIR, filename)
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            return {}
-    return {}
+    """
+    Load JSON file from bot's data directory
+    Served from json_file_cache - only re-parsed when the file changes on disk -
+    with any journaled writes replayed on top (see journal.py).
+    The returned data is shared between requests, so don't modify it.
+    """
+    with span('load_json_file', file=filename):
+        return journaled(os.path.join(DATA_DIR, filename)).load()
+
+# Indexed view of cape_logs.json + purchases.json (see cape_store.py)
+cape_store = CapeStore(DATA_DIR)
+# Running totals for /api/stats, updated from the store's sync deltas
+stats_aggregates = StatsAggregates(cape_store, DATA_DIR)
+
+# Fingerprinted, precompressed website assets (see static_assets.py)
+static_pipeline = StaticPipeline(app.root_path)
+static_pipeline.build()
 
 # Serve index.html as root
 @app.route('/')
 def index():
-    return send_from_directory('.', 'index.html')
+    return static_pipeline.serve('index.html') or send_from_directory('.', 'index.html')
 
 # Serve all static files (HTML, CSS, JS, images, etc.)
 @app.route('/<path:filename>')
@@ -84,53 +160,37 @@ def serve_static(filename):
         pass
     else:
         # Serve static files
+        response = static_pipeline.serve(filename)
+        if response is not None:
+            return response
         try:
             return send_from_directory('.', filename)
         except:
             return jsonify({'error': 'File not found'}), 404
 
+discord_gateway = DiscordGateway(
+    DISCORD_BOT_TOKEN,
+    role_ids=[CAPE_STAFF_ROLE_ID, MODERATION_ADMIN_ROLE_ID, EVMD_ROLE_ID],
+    role_names=[MODERATION_ROLE_NAME],
+    api_url=DISCORD_API_URL,
+)
+
+def get_discord_gateway():
+    """Get the persistent Discord gateway client, starting it on first use"""
+    if DISCORD_BOT_TOKEN and DISCORD_GATEWAY_ENABLED:
+        discord_gateway.start()
+    return discord_gateway
+
 def get_discord_bot():
-    """Get or create Discord bot instance"""
-    if not hasattr(app, 'bot') or app.bot.is_closed():
-        intents = discord.Intents.default()
-        intents.guilds = True
-        intents.members = True
-        app.bot = discord.Client(intents=intents)
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(app.bot.login(DISCORD_BOT_TOKEN))
-    return app.bot
-
-def check_user_has_role(member, role_id=None, role_name=None):
-    """Check if Discord member has a specific role"""
-    if not member:
-        return False
-    if role_id:
-        return member.get_role(role_id) is not None
-    if role_name:
-        for role in member.roles:
-            if role.name.lower() == role_name.lower():
-                return True
-    return False
+    """Get the long-lived Discord bot client (runs on the gateway thread)"""
+    return get_discord_gateway().client
 
 def is_authorized_user(user_id, guild_id):
-    """Check if user is authorized (has staff roles)"""
+    """Check if user is authorized (has staff roles) - an in-memory lookup once the member is indexed"""
     try:
-        bot = get_discord_bot()
-        guild = bot.get_guild(guild_id)
-        if not guild:
-            return False
-        member = guild.get_member(user_id)
-        if not member:
+        if not DISCORD_BOT_TOKEN or not DISCORD_GATEWAY_ENABLED:
             return False
-        
-        # Check for any authorized role
-        has_cape_staff = check_user_has_role(member, role_id=CAPE_STAFF_ROLE_ID)
-        has_moderation = check_user_has_role(member, role_name=MODERATION_ROLE_NAME)
-        has_moderation_admin = check_user_has_role(member, role_id=MODERATION_ADMIN_ROLE_ID)
-        has_evmd = check_user_has_role(member, role_id=EVMD_ROLE_ID)
-        
-        return has_cape_staff or has_moderation or has_moderation_admin or has_evmd
+        return get_discord_gateway().is_authorized(user_id, guild_id)
     except Exception as e:
         print(f"[API] Error checking authorization: {e}")
         return False
@@ -142,7 +202,7 @@ def discord_login():
         return jsonify({'error': 'Discord OAuth not configured. Please add DISCORD_CLIENT_ID to .env file'}), 500
     
     auth_url = (
-        f"https://discord.com/api/oauth2/authorize"
+        f"{DISCORD_API_URL}/oauth2/authorize"
         f"?client_id={DISCORD_CLIENT_ID}"
         f"&redirect_uri={DISCORD_REDIRECT_URI}"
         f"&response_type=code"
@@ -150,6 +210,29 @@ def discord_login():
     )
     return redirect(auth_url)
 
+def discord_session_user(user_data, access_token):
+    """Session record for a Discord user who completed OAuth"""
+    return {
+        'id': user_data.get('id'),
+        'username': user_data.get('username'),
+        'avatar': user_data.get('avatar'),
+        'discriminator': user_data.get('discriminator', '0'),
+        'access_token': access_token
+    }
+
+def discord_token_request(code):
+    """Form body for exchanging an OAuth code for an access token"""
+    return {
+        'client_id': DISCORD_CLIENT_ID,
+        'client_secret': DISCORD_CLIENT_SECRET,
+        'grant_type': 'authorization_code',
+        'code': code,
+        'redirect_uri': DISCORD_REDIRECT_URI
+    }
+
+OAUTH_ERROR_PAGE = '<html><body><h1>OAuth Error</h1><p>{}</p><p>Check your Discord OAuth settings.</p><p><a href="/dashboard.html">Go back to login</a></p></body></html>'
+ERROR_PAGE = '<html><body><h1>Error</h1><p>{}</p><p><a href="/dashboard.html">Go back to login</a></p></body></html>'
+
 @app.route('/api/auth/callback', methods=['GET'])
 def discord_callback():
     """Handle Discord OAuth callback"""
@@ -164,61 +247,45 @@ def discord_callback():
     
     try:
         # Exchange code for access token
-        token_data = {
-            'client_id': DISCORD_CLIENT_ID,
-            'client_secret': DISCORD_CLIENT_SECRET,
-            'grant_type': 'authorization_code',
-            'code': code,
-            'redirect_uri': DISCORD_REDIRECT_URI
-        }
+        token_data = discord_token_request(code)
         
-        import urllib.request
-        import urllib.parse
-        import json
+        response = http_client.post(
+            f'{DISCORD_API_URL}/oauth2/token',
+            data=token_data,
+            headers={'Content-Type': 'application/x-www-form-urlencoded'},
+            timeout=10
+        )
+        response.raise_for_status()
+        token_response = response.json()
+        access_token = token_response.get('access_token')
+        
+        if not access_token:
+            return jsonify({'error': 'Failed to get access token'}), 400
         
-        req = urllib.request.Request(
-            'https://discord.com/api/oauth2/token',
-            data=urllib.parse.urlencode(token_data).encode(),
-            headers={'Content-Type': 'application/x-www-form-urlencoded'}
+        # Get user info
+        user_response = http_client.get(
+            f'{DISCORD_API_URL}/users/@me',
+            headers={'Authorization': f'Bearer {access_token}'},
+            timeout=10
         )
+        user_response.raise_for_status()
+        user_data = user_response.json()
         
-        with urllib.request.urlopen(req) as response:
-            token_response = json.loads(response.read())
-            access_token = token_response.get('access_token')
-            
-            if not access_token:
-                return jsonify({'error': 'Failed to get access token'}), 400
-            
-            # Get user info
-            user_req = urllib.request.Request(
-                'https://discord.com/api/users/@me',
-                headers={'Authorization': f'Bearer {access_token}'}
-            )
-            
-            with urllib.request.urlopen(user_req) as user_response:
-                user_data = json.loads(user_response.read())
-                
-                # Store in session
-                session['discord_user'] = {
-                    'id': user_data.get('id'),
-                    'username': user_data.get('username'),
-                    'avatar': user_data.get('avatar'),
-                    'discriminator': user_data.get('discriminator', '0'),
-                    'access_token': access_token
-                }
-                
-                # Redirect to dashboard with success
-                return redirect(f'/dashboard.html?logged_in=true')
-                
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode() if hasattr(e, 'read') else str(e)
+        # Store in session
+        session['discord_user'] = discord_session_user(user_data, access_token)
+        
+        # Redirect to dashboard with success
+        return redirect(f'/dashboard.html?logged_in=true')
+        
+    except requests.HTTPError as e:
+        error_body = e.response.text if e.response is not None else str(e)
         print(f"[API] OAuth error: {error_body}")
-        return f'<html><body><h1>OAuth Error</h1><p>{error_body}</p><p>Check your Discord OAuth settings.</p><p><a href="/dashboard.html">Go back to login</a></p></body></html>', 500
+        return OAUTH_ERROR_PAGE.format(error_body), 500
     except Exception as e:
         print(f"[API] OAuth callback error: {e}")
         import traceback
         traceback.print_exc()
-        return f'<html><body><h1>Error</h1><p>{str(e)}</p><p><a href="/dashboard.html">Go back to login</a></p></body></html>', 500
+        return ERROR_PAGE.format(str(e)), 500
 
 @app.route('/api/auth/me', methods=['GET'])
 def get_current_user():
@@ -243,10 +310,12 @@ def logout():
     return jsonify({'success': True})
 
 # ==================== PERFECT IMAGE ID RESOLVER ====================
-def get_image_id_perfect(asset_id: str, max_retries: int = 25) -> Optional[str]:
+def get_image_id_perfect(asset_id: str, max_retries: int = 25, refresh: bool = False) -> Optional[str]:
     """
     PERFECT Image ID Resolver using Roblox Thumbnails API
-    This is the MOST RELIABLE method - tries multiple times with progressive delays
+    This is the MOST RELIABLE method - tries multiple times with rate-limit-aware backoff
+    Reads through the resolution cache, so known image IDs cost no outbound calls
+    (refresh=True asks Roblox again even if the asset was recently seen still processing)
     """
     if not asset_id:
         return None
@@ -258,173 +327,210 @@ def get_image_id_perfect(asset_id: str, max_retries: int = 25) -> Optional[str]:
     except:
         return None
     
-    url = f"https://thumbnails.roblox.com/v1/assets?assetIds={asset_id}&size=420x420&format=Png&isCircular=false"
-    
+    # Concurrent status polls for the same asset share one resolution
+    key = image_id_flight_key(asset_id, max_retries, refresh)
+    return image_id_flights.do(key, lambda: get_resolution_cache().resolve(
+        asset_id, lambda uncached_id: _fetch_image_id_perfect(uncached_id, max_retries), refresh=refresh
+    ))
+
+def image_id_from_delivery_url(final_url: str, asset_id: str) -> Optional[str]:
+    """Extract the image ID from an AssetDelivery redirect URL"""
+    match = re.search(r'/(\d{9,})/', final_url or '')
+    if match:
+        img_id = match.group(1)
+        if img_id != str(asset_id) and len(img_id) >= 9:
+            return img_id
+    return None
+
+def _fetch_image_id_perfect(asset_id: str, max_retries: int) -> Optional[str]:
+    """Resolve an image ID from Roblox (no caching)"""
     # Method 1: Thumbnails API (MOST RELIABLE - 90%+ success rate)
+    # Each attempt joins a shared multi-ID request (see batch_resolver.py)
+    batcher = get_thumbnail_batcher()
+    attempts = 0
     for attempt in range(1, max_retries + 1):
         try:
             if attempt > 1:
-                wait_time = min(3.0 + (attempt * 2), 30.0)  # Progressive: 5s, 7s, 9s... max 30s
-                time.sleep(wait_time)
-            
-            response = requests.get(url, timeout=20)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if "data" in data and len(data["data"]) > 0:
-                    entry = data["data"][0]
-                    
-                    # Method 1a: Check targetId field (MOST RELIABLE)
-                    target_id = entry.get("targetId")
-                    if target_id:
-                        target_id_str = str(target_id)
-                        if target_id_str != str(asset_id):
-                            print(f"[IMAGE-ID] ✅ Found image ID {target_id_str} from targetId (attempt {attempt})")
-                            return target_id_str
-                    
-                    # Method 1b: Extract from imageUrl
-                    image_url = entry.get("imageUrl", "")
-                    if image_url:
-                        # Pattern 1: https://tr.rbxcdn.com/{imageId}/420x420/...
-                        match = re.search(r'/tr\.rbxcdn\.com/(\d{9,})/', image_url)
-                        if match:
-                            img_id = match.group(1)
-                            if img_id != str(asset_id):
-                                print(f"[IMAGE-ID] ✅ Found image ID {img_id} from imageUrl (attempt {attempt})")
-                                return img_id
-                        
-                        # Pattern 2: rbxcdn.com/{imageId}
-                        match2 = re.search(r'rbxcdn\.com/(\d{9,})/', image_url)
-                        if match2:
-                            img_id = match2.group(1)
-                            if img_id != str(asset_id):
-                                print(f"[IMAGE-ID] ✅ Found image ID {img_id} from imageUrl alt (attempt {attempt})")
-                                return img_id
-                        
-                        # Pattern 3: Any numeric ID in URL (9+ digits)
-                        match3 = re.search(r'/(\d{9,})/', image_url)
-                        if match3:
-                            img_id = match3.group(1)
-                            if img_id != str(asset_id) and len(img_id) >= 9:
-                                print(f"[IMAGE-ID] ✅ Found image ID {img_id} from imageUrl pattern3 (attempt {attempt})")
-                                return img_id
+                # Jittered backoff that honors Retry-After; None = shared retry budget spent
+                wait_time = rate_limiter.retry_delay(THUMBNAILS_HOST, attempt)
+                if wait_time is None:
+                    print(f"[IMAGE-ID] ⚠️ Retry budget for {THUMBNAILS_HOST} spent, giving up on {asset_id}")
+                    break
+                with span('backoff', attempt=attempt, seconds=round(wait_time, 3)):
+                    time.sleep(wait_time)
             
+            attempts += 1
+            with span('thumbnails_lookup', attempt=attempt):
+                img_id = batcher.lookup(asset_id)
+            if img_id:
+                print(f"[IMAGE-ID] ✅ Found image ID {img_id} from Thumbnails API (attempt {attempt})")
+                metrics.observe_resolution('sync', attempts, 'thumbnails')
+                return img_id
         except Exception:
-            if attempt < max_retries:
-                pass  # Silent retry
-            else:
-                pass  # Silent failure
+            pass  # Silent retry
     
     # Method 2: AssetDelivery API (fallback)
+    img_id = image_id_from_asset_delivery(asset_id)
+    metrics.observe_resolution('sync', attempts + 1, img_id and 'asset_delivery')
+    return img_id
+
+def image_id_from_asset_delivery(asset_id: str) -> Optional[str]:
+    """One AssetDelivery lookup (the fallback when thumbnails has nothing)"""
     try:
-        delivery_url = f"https://assetdelivery.roblox.com/v1/asset?id={asset_id}"
-        response = requests.get(delivery_url, allow_redirects=True, timeout=20)
+        delivery_url = f"{ROBLOX_ASSETDELIVERY_URL}/v1/asset?id={asset_id}"
+        response = http_client.get(delivery_url, allow_redirects=True, timeout=20)
         if response.status_code == 200:
-            final_url = response.url
-            match = re.search(r'/(\d{9,})/', final_url)
-            if match:
-                img_id = match.group(1)
-                if img_id != str(asset_id) and len(img_id) >= 9:
-                    print(f"[IMAGE-ID] ✅ Found image ID {img_id} from AssetDelivery")
-                    return img_id
+            img_id = image_id_from_delivery_url(response.url, asset_id)
+            if img_id:
+                print(f"[IMAGE-ID] ✅ Found image ID {img_id} from AssetDelivery")
+                return img_id
     except Exception:
         pass
     
     return None
 
-@app.route('/api/stats', methods=['GET'])
-def get_stats():
-    """Get real-time statistics from Discord bot"""
+def resolve_image_ids_together(asset_ids, on_result, max_retries: int = 10):
+    """
+    Resolve several fresh uploads at once: every attempt is ONE batched
+    thumbnails lookup for all IDs still missing, on one shared backoff
+    on_result(asset_id, image_id) is called as each image ID is found
+    """
+    cache = get_resolution_cache()
+    pending = []
+    for asset_id in asset_ids:
+        image_id = cache.get(asset_id)
+        if image_id:
+            on_result(asset_id, image_id)
+        else:
+            pending.append(str(asset_id))
+    
+    batcher = get_thumbnail_batcher()
+    attempts = 0
+    for attempt in range(1, max_retries + 1):
+        if not pending:
+            return
+        if attempt > 1:
+            wait_time = rate_limiter.retry_delay(THUMBNAILS_HOST, attempt)
+            if wait_time is None:
+                print(f"[IMAGE-ID] ⚠️ Retry budget for {THUMBNAILS_HOST} spent, {len(pending)} assets left unresolved")
+                break
+            with span('backoff', attempt=attempt, seconds=round(wait_time, 3)):
+                time.sleep(wait_time)
+        attempts += 1
+        found = batcher.lookup_many(pending)
+        for asset_id in pending:
+            if found.get(asset_id):
+                print(f"[IMAGE-ID] ✅ Found image ID {found[asset_id]} from Thumbnails API (attempt {attempt})")
+                cache.put(asset_id, found[asset_id])
+                metrics.observe_resolution('bulk', attempts, 'thumbnails')
+                on_result(asset_id, found[asset_id])
+        pending = [asset_id for asset_id in pending if not found.get(asset_id)]
+    
+    # AssetDelivery fallback for the stragglers, one by one
+    for asset_id in pending:
+        image_id = cache.resolve(asset_id, image_id_from_asset_delivery)
+        metrics.observe_resolution('bulk', attempts + 1, image_id and 'asset_delivery')
+        on_result(asset_id, image_id)
+
+# Background image ID resolution for uploads (bounded pool, see cape_jobs.py)
+resolution_jobs = ResolutionJobs(lambda asset_id: get_image_id_perfect(asset_id, max_retries=10),
+                                 group_resolver=resolve_image_ids_together)
+
+DEFAULT_STATS = {
+    'pendingTickets': 0,
+    'completedTickets': 0,
+    'onlineUsers': 0,
+    'totalMembers': 0,
+    'botUptime': '99.9%',
+    'capesGenerated': 0,
+    'revenue': '$0',
+    'totalUsers': 0,
+    'totalTickets': 0
+}
+
+STATS_REFRESH_INTERVAL = float(os.getenv('STATS_REFRESH_INTERVAL', '15'))
+
+def compute_stats():
+    """Compute statistics - runs on the stats refresher thread, never in a request"""
+    # Try to get stats from bot API endpoint first (port 5001)
     try:
-        # Try to get stats from bot API endpoint first (port 5001)
+        response = bot_api_get('/api/stats', timeout=3)
+        if response.status_code == 200:
+            bot_stats = response.json()
+            # Use real-time data from bot if available
+            if bot_stats and isinstance(bot_stats, dict) and 'totalMembers' in bot_stats:
+                print(f"[API] ✅ Using bot API stats - Members: {bot_stats.get('totalMembers')}, Online: {bot_stats.get('onlineUsers')}")
+                return bot_stats
+    except CircuitOpenError:
+        pass  # Bot known to be down - go straight to the file fallback
+    except Exception as e:
+        print(f"[API] Bot API not available: {e}")
+    
+    # Fallback: aggregates over the data files, maintained incrementally (see stats_aggregates.py)
+    aggregates = stats_aggregates.snapshot()
+    total_tickets = aggregates['total_tickets']
+    completed_count = aggregates['completed_capes']
+    pending_tickets = aggregates['pending_tickets']
+    total_users_with_points = aggregates['users_with_points']
+    
+    # Try to get member count from Discord REST API
+    member_count = 0
+    online_count = 0
+    
+    if DISCORD_BOT_TOKEN:
         try:
-            import urllib.request
-            import json as json_lib
-            with urllib.request.urlopen('http://localhost:5001/api/stats', timeout=3) as response:
-                if response.status == 200:
-                    bot_stats = json_lib.loads(response.read())
-                    # Use real-time data from bot if available
-                    if bot_stats and isinstance(bot_stats, dict) and 'totalMembers' in bot_stats:
-                        print(f"[API] ✅ Using bot API stats - Members: {bot_stats.get('totalMembers')}, Online: {bot_stats.get('onlineUsers')}")
-                        return jsonify(bot_stats)
+            headers = {
+                'Authorization': f'Bot {DISCORD_BOT_TOKEN}',
+                'Content-Type': 'application/json'
+            }
+            
+            response = http_client.get(
+                f'{DISCORD_API_URL}/v10/guilds/{MAIN_GUILD_ID}?with_counts=true',
+                headers=headers,
+                timeout=5
+            )
+            if response.status_code == 200:
+                data = response.json()
+                member_count = data.get('approximate_member_count', 0) or data.get('member_count', 0)
+                online_count = data.get('approximate_presence_count', 0)
+                print(f"[API] ✅ Fetched from Discord API - Members: {member_count}, Online: {online_count}")
         except Exception as e:
-            print(f"[API] Bot API not available: {e}")
-        
-        # Fallback: Load from files
-        ticket_counter = load_json_file('ticket_counter.json')
-        total_tickets = ticket_counter.get('counter', 0) if ticket_counter else 0
-        
-        purchases = load_json_file('purchases.json')
-        completed_count = sum(len(purchases.get(user_id, [])) for user_id in purchases) if purchases else 0
-        
-        pending_tickets = max(0, total_tickets - completed_count)
-        
-        points_data = load_json_file('points.json')
-        total_users_with_points = len(points_data) if points_data else 0
-        
-        # Try to get member count from Discord REST API
-        member_count = 0
-        online_count = 0
-        
-        if DISCORD_BOT_TOKEN:
-            try:
-                import urllib.request
-                import json as json_lib
-                
-                headers = {
-                    'Authorization': f'Bot {DISCORD_BOT_TOKEN}',
-                    'Content-Type': 'application/json'
-                }
-                
-                req = urllib.request.Request(
-                    f'https://discord.com/api/v10/guilds/{MAIN_GUILD_ID}?with_counts=true',
-                    headers=headers
-                )
-                
-                with urllib.request.urlopen(req, timeout=5) as response:
-                    if response.status == 200:
-                        data = json_lib.loads(response.read())
-                        member_count = data.get('approximate_member_count', 0) or data.get('member_count', 0)
-                        online_count = data.get('approximate_presence_count', 0)
-                        print(f"[API] ✅ Fetched from Discord API - Members: {member_count}, Online: {online_count}")
-            except Exception as e:
-                # Silently continue - member count is optional
-                pass
-        
-        # File-based fallback stats
-        stats = {
-            'pendingTickets': max(0, pending_tickets),
-            'completedTickets': max(0, completed_count),
-            'onlineUsers': max(0, online_count),
-            'totalMembers': max(0, member_count),
-            'botUptime': '99.9%',
-            'capesGenerated': max(0, completed_count),
-            'revenue': f'${max(0, completed_count * 40)}',
-            'totalUsers': max(0, total_users_with_points),
-            'totalTickets': max(0, total_tickets),
-            'serverId': MAIN_GUILD_ID
-        }
-        
-        print(f"[API] ✅ Stats fetched - Pending: {stats['pendingTickets']}, Completed: {stats['completedTickets']}, Members: {stats['totalMembers']}, Online: {stats['onlineUsers']}")
-        
-        return jsonify(stats)
+            # Silently continue - member count is optional
+            pass
+    
+    # File-based fallback stats
+    stats = {
+        'pendingTickets': max(0, pending_tickets),
+        'completedTickets': max(0, completed_count),
+        'onlineUsers': max(0, online_count),
+        'totalMembers': max(0, member_count),
+        'botUptime': '99.9%',
+        'capesGenerated': max(0, completed_count),
+        'revenue': f"${aggregates['revenue']}",
+        'totalUsers': max(0, total_users_with_points),
+        'totalTickets': max(0, total_tickets),
+        'serverId': MAIN_GUILD_ID
+    }
+    
+    print(f"[API] ✅ Stats fetched - Pending: {stats['pendingTickets']}, Completed: {stats['completedTickets']}, Members: {stats['totalMembers']}, Online: {stats['onlineUsers']}")
+    
+    return stats
+
+# Stats are recomputed in the background and served from memory (see stats_cache.py)
+stats_refresher = BackgroundRefresher('stats', compute_stats, STATS_REFRESH_INTERVAL, default=DEFAULT_STATS)
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Get real-time statistics from Discord bot (served from the background stats cache)"""
+    try:
+        stats, freshness = stats_refresher.get()
+        return jsonify({**stats, 'freshness': freshness})
     except Exception as e:
         print(f"[API] Error getting stats: {e}")
         import traceback
         traceback.print_exc()
         # Return default stats instead of error
-        return jsonify({
-            'pendingTickets': 0,
-            'completedTickets': 0,
-            'onlineUsers': 0,
-            'totalMembers': 0,
-            'botUptime': '99.9%',
-            'capesGenerated': 0,
-            'revenue': '$0',
-            'totalUsers': 0,
-            'totalTickets': 0
-        })
+        return jsonify(DEFAULT_STATS)
 
 @app.route('/api/tickets', methods=['GET'])
 def get_tickets():
@@ -432,12 +538,11 @@ def get_tickets():
     try:
         # Try to get tickets from bot API endpoint first
         try:
-            import urllib.request
-            import json as json_lib
-            with urllib.request.urlopen('http://localhost:5001/api/tickets', timeout=2) as response:
-                tickets = json_lib.loads(response.read())
-                if tickets:
-                    return jsonify(tickets)
+            response = bot_api_get('/api/tickets', timeout=2)
+            response.raise_for_status()
+            tickets = response.json()
+            if tickets:
+                return jsonify(tickets)
         except:
             pass
         
@@ -449,6 +554,37 @@ def get_tickets():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+# Cache/pool/queue stats included in /api/metrics
+metrics.register('http', http_client.stats)
+metrics.register('resolution_cache', lambda: get_resolution_cache().stats())
+metrics.register('thumbnail_batcher', lambda: get_thumbnail_batcher().stats())
+metrics.register('image_id_flights', image_id_flights.stats)
+metrics.register('json_file_cache', json_file_cache.stats)
+metrics.register('upload_index', lambda: get_upload_index().stats())
+metrics.register('bot_api_breaker', bot_api_breaker.stats)
+metrics.register('stats_refresher', stats_refresher.stats)
+metrics.register('cape_status_hub', lambda: cape_status_hub.stats())
+metrics.register('discord_gateway', discord_gateway.stats)
+metrics.register('tracing', tracer.stats)
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Route latency histograms, outbound call latency/outcomes per host,
+    image ID resolver attempts and cache hit rates (for monitoring)
+    """
+    return jsonify(metrics.snapshot())
+
+@app.route('/api/traces/slow', methods=['GET'])
+def get_slow_traces():
+    """Span trees of the latest sampled requests slower than TRACE_SLOW_SECONDS"""
+    return jsonify({**tracer.stats(), 'traces': tracer.recent_slow()})
+
+@app.route('/api/bot-api/status', methods=['GET'])
+def get_bot_api_status():
+    """Circuit breaker state for the bot's local API (for monitoring)"""
+    return jsonify(bot_api_breaker.stats())
+
 @app.route('/api/tickets/<ticket_id>', methods=['GET'])
 def get_ticket(ticket_id):
     """Get specific ticket details"""
@@ -497,75 +633,124 @@ def get_evmd_quota(user_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def new_cape_asset_name():
+    """(name, description) for a website cape upload"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"Cape Upload - {timestamp}", "Cape uploaded via website Pixlr integration"
+
+def cape_upload_config_error():
+    """Error message if Roblox upload credentials are missing, else None"""
+    if not ROBLOX_API_KEY:
+        return 'Roblox API key not configured. Please set ROBLOX_API_KEY in .env file.'
+    if not CREATOR_ID:
+        return 'Creator ID not configured. Please set CREATOR_ID in .env file.'
+    return None
+
+def cape_upload_response(asset_id, job):
+    """Response body for a successful upload with a background resolution job"""
+    return {
+        'success': True,
+        'asset_id': str(asset_id),
+        'image_id': None,
+        'job_id': job['job_id'],
+        'job_status': job['status'],
+        'message': f'Upload successful! Asset ID: {asset_id}. Image ID: Resolving...'
+    }
+
+def duplicate_upload_response(existing):
+    """Response body for an image that was uploaded before (no Roblox upload)"""
+    asset_id, image_id = existing['asset_id'], existing['image_id']
+    if image_id:
+        return {
+            'success': True,
+            'asset_id': asset_id,
+            'image_id': image_id,
+            'job_id': None,
+            'job_status': 'completed',
+            'duplicate': True,
+            'message': f'Already uploaded! Asset ID: {asset_id}. Image ID: {image_id}'
+        }
+    job = resolution_jobs.submit(asset_id)
+    return {**cape_upload_response(asset_id, job), 'duplicate': True}
+
+def force_upload_requested(args):
+    """?force=1 - upload again even if the image was uploaded before (e.g. the old asset was moderated)"""
+    return str(args.get('force', '')).lower() in ('1', 'true', 'yes')
+
+# Uploads in flight, by content hash (see upload_index.py)
+upload_flights = SingleFlight()
+metrics.register('upload_flights', upload_flights.stats)
+
 @app.route('/api/upload-cape', methods=['POST'])
 def upload_cape():
-    """Upload cape image to Roblox using existing cape upload code"""
+    """Upload cape image to Roblox using existing cape upload code (?force=1 skips the duplicate check)"""
     try:
         if not CAPE_UPLOAD_AVAILABLE:
             return jsonify({'error': 'Cape upload module not available'}), 500
         
-        if 'cape_image' not in request.files:
+        # Cap the body itself, so werkzeug stops reading an oversized upload instead of buffering all of it
+        request.max_content_length = CAPE_UPLOAD_REQUEST_MAX_BYTES
+        try:
+            files = request.files
+        except RequestEntityTooLarge:
+            return jsonify({'error': str(too_large()), 'success': False}), 413
+        
+        if 'cape_image' not in files:
             return jsonify({'error': 'No file provided'}), 400
         
-        file = request.files['cape_image']
+        file = files['cape_image']
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        # Read file bytes
-        file_bytes = file.read()
-        if len(file_bytes) == 0:
-            return jsonify({'error': 'Empty file'}), 400
+        # werkzeug already spooled the file - resize/strip/recompress it in place (see cape_ingest.py)
+        try:
+            file_bytes, ingest = ingest_upload(file.stream)
+        except UploadRejected as e:
+            return jsonify({'error': str(e), 'success': False}), e.status
+        print(f"[API] Normalized upload {ingest['original_bytes']} -> {ingest['normalized_bytes']} bytes "
+              f"({ingest['width']}x{ingest['height']})")
+        
+        # Same image uploaded before? Hand back its IDs instead of creating a new asset
+        digest = content_hash(file_bytes)
+        existing = None if force_upload_requested(request.args) else get_upload_index().lookup(digest)
+        if existing:
+            print(f"[API] ♻️ Duplicate upload - reusing Asset ID: {existing['asset_id']}")
+            return jsonify(duplicate_upload_response(existing))
         
         # Generate filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        asset_name = f"Cape Upload - {timestamp}"
-        asset_desc = "Cape uploaded via website Pixlr integration"
+        asset_name, asset_desc = new_cape_asset_name()
         
         # Validate API key and creator ID are set
-        if not ROBLOX_API_KEY:
-            return jsonify({'error': 'Roblox API key not configured. Please set ROBLOX_API_KEY in .env file.'}), 500
+        config_error = cape_upload_config_error()
+        if config_error:
+            return jsonify({'error': config_error}), 500
         
-        if not CREATOR_ID:
-            return jsonify({'error': 'Creator ID not configured. Please set CREATOR_ID in .env file.'}), 500
-        
-        # Run async upload in new event loop
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        # The upload itself stays in the request - the client needs the asset ID - but runs on the
+        # shared async loop; only the slow image ID resolution is handed to the job pool
         try:
-            asset_id = loop.run_until_complete(
-                upload_decal_to_roblox(
-                    ROBLOX_API_KEY,
-                    CREATOR_ID,
-                    file_bytes,
-                    asset_name,
-                    asset_desc,
-                    to_group=UPLOAD_TO_GROUP
+            def upload():
+                asset_id = http_client.run_sync(
+                    upload_decal_to_roblox(
+                        ROBLOX_API_KEY,
+                        CREATOR_ID,
+                        file_bytes,
+                        asset_name,
+                        asset_desc,
+                        to_group=UPLOAD_TO_GROUP
+                    )
                 )
-            )
+                get_upload_index().record(digest, asset_id)
+                return asset_id
+            
+            # Identical images submitted at the same moment share one Roblox upload
+            asset_id = upload_flights.do(digest, upload)
             
             print(f"[API] ✅ Cape uploaded successfully - Asset ID: {asset_id}")
             
-            # Try to get image ID immediately using Thumbnails API (with shorter timeout for initial check)
-            image_id = None
-            try:
-                print(f"[API] 🔍 Attempting to find image ID immediately...")
-                # Try with fewer retries first (faster response)
-                image_id = get_image_id_perfect(str(asset_id), max_retries=3)
-                if image_id:
-                    print(f"[API] ✅ Found image ID immediately: {image_id}")
-                else:
-                    print(f"[API] ⏳ Image ID not available yet (moderation pending), will resolve via status endpoint...")
-            except Exception as e:
-                print(f"[API] ⚠️ Error resolving image ID: {e}")
-                import traceback
-                traceback.print_exc()
+            # Resolve image ID in the background - the client polls /api/cape-jobs/<job_id>
+            job = resolution_jobs.submit(str(asset_id))
             
-            return jsonify({
-                'success': True,
-                'asset_id': str(asset_id),
-                'image_id': str(image_id) if image_id else None,
-                'message': f'Upload successful! Asset ID: {asset_id}. Image ID: {image_id if image_id else "Resolving..."}'
-            })
+            return jsonify(cape_upload_response(asset_id, job))
         except RuntimeError as e:
             error_msg = str(e)
             print(f"[API] ❌ Upload failed: {error_msg}")
@@ -582,8 +767,6 @@ def upload_cape():
                 'error': f'Upload failed: {error_msg}',
                 'success': False
             }), 500
-        finally:
-            loop.close()
         
     except Exception as e:
         print(f"[API] Upload error: {e}")
@@ -591,147 +774,316 @@ def upload_cape():
         traceback.print_exc()
         return jsonify({'error': str(e), 'success': False}), 500
 
+async def bulk_upload_item(spool, run_blocking=asyncio.to_thread, force=False):
+    """
+    One file of a bulk upload: normalize, dedup (unless force), upload to Roblox
+    No resolution job here - finish_bulk_upload() resolves the whole batch together
+    """
+    file_bytes, ingest = await run_blocking(normalize_cape_image, spool)
+    digest = content_hash(file_bytes)
+    existing = None if force else await run_blocking(get_upload_index().lookup, digest)
+    if existing:
+        print(f"[API] ♻️ Duplicate upload - reusing Asset ID: {existing['asset_id']}")
+        return {'success': True, **existing, 'duplicate': True}
+    
+    async def upload():
+        asset_name, asset_desc = new_cape_asset_name()
+        asset_id = await upload_decal_to_roblox(
+            ROBLOX_API_KEY,
+            CREATOR_ID,
+            file_bytes,
+            asset_name,
+            asset_desc,
+            to_group=UPLOAD_TO_GROUP
+        )
+        await run_blocking(get_upload_index().record, digest, asset_id)
+        return asset_id
+    
+    # Identical images in the batch (or in other uploads) share one Roblox upload
+    asset_id = await upload_flights.do_async(digest, upload)
+    print(f"[API] ✅ Cape uploaded successfully - Asset ID: {asset_id}")
+    return {'success': True, 'asset_id': str(asset_id), 'image_id': None, 'duplicate': False}
+
+def finish_bulk_upload(results):
+    """
+    Summary line of a bulk upload: queues image ID resolution for every
+    unresolved asset as one grouped job and lists the job per file
+    """
+    unresolved = [result['asset_id'] for result in results if result.get('success') and not result.get('image_id')]
+    jobs = resolution_jobs.submit_many(unresolved)
+    files = []
+    for result in sorted(results, key=lambda result: result['index']):
+        job = jobs.get(result.get('asset_id'))
+        files.append({
+            'index': result['index'],
+            'asset_id': result.get('asset_id'),
+            'image_id': result.get('image_id'),
+            'job_id': job['job_id'] if job else None,
+            'job_status': job['status'] if job else ('completed' if result.get('image_id') else None),
+        })
+    uploaded = sum(1 for result in results if result.get('success'))
+    duplicates = sum(1 for result in results if result.get('duplicate'))
+    print(f"[API] ✅ Bulk upload finished - {uploaded}/{len(results)} uploaded ({duplicates} duplicates)")
+    return {
+        'done': True,
+        'count': len(results),
+        'uploaded': uploaded,
+        'duplicates': duplicates,
+        'failed': len(results) - uploaded,
+        'files': files,
+    }
+
+def bulk_upload_request_error(file_count):
+    """(message, status) if a bulk upload can't start, else None"""
+    if not CAPE_UPLOAD_AVAILABLE:
+        return 'Cape upload module not available', 500
+    if file_count == 0:
+        return 'No files provided', 400
+    if file_count > BULK_UPLOAD_MAX_FILES:
+        return f'At most {BULK_UPLOAD_MAX_FILES} files per bulk upload', 400
+    config_error = cape_upload_config_error()
+    if config_error:
+        return config_error, 500
+    return None
+
+@app.route('/api/upload-capes', methods=['POST'])
+def upload_capes():
+    """
+    Upload many cape images in one request (repeat the cape_images form field)
+    
+    Streams NDJSON: one line per file as its upload finishes
+    ({"index", "filename", "success", "asset_id", "image_id", "duplicate"} or {"success": false, "error"}),
+    then a summary line {"done": true, ..., "files": [{"index", "asset_id", "job_id", ...}]}
+    whose jobs resolve the image IDs of the whole batch together
+    ?force=1 uploads every file, even ones uploaded before
+    """
+    force = force_upload_requested(request.args)
+    files = [file for file in request.files.getlist('cape_images') if file.filename]
+    error = bulk_upload_request_error(len(files))
+    if error:
+        return jsonify({'error': error[0], 'success': False}), error[1]
+    
+    # Spool everything up front - the stream below outlives the request's file objects
+    items = spool_files((file.filename, file.stream) for file in files)
+    print(f"[API] Bulk upload of {len(items)} capes")
+    
+    def generate():
+        results = []
+        try:
+            for result in upload_all_sync(items, lambda spool: bulk_upload_item(spool, force=force)):
+                results.append(result)
+                yield ndjson_line(result)
+            yield ndjson_line(finish_bulk_upload(results))
+        finally:
+            close_items(items)
+    
+    return Response(generate(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
+@app.route('/api/cape-jobs/<job_id>', methods=['GET'])
+def get_cape_job(job_id):
+    """Get status of a background image ID resolution job"""
+    job = resolution_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+def _remember_logged_image_id(asset_id, image_id):
+    """Cache an image ID the bot already logged, so later status checks skip Roblox"""
+    if image_id and str(image_id) != str(asset_id):
+        get_resolution_cache().put(asset_id, image_id)
+
+def logged_cape_status(asset_id):
+    """Status from the cape index (cape_logs.json, then purchases.json by decal ID)"""
+    match = cape_store.find_by_asset_id(asset_id)
+    if match:
+        source, cape = match
+        if source == SOURCE_CAPE_LOGS:
+            _remember_logged_image_id(asset_id, cape.get('image_id'))
+        return {
+            'asset_id': asset_id,
+            'image_id': cape.get('image_id') if source == SOURCE_CAPE_LOGS else cape.get('decal_id'),
+            'status': 'completed',
+            'timestamp': cape.get('timestamp') or datetime.now().isoformat()
+        }
+    
+    return {
+        'asset_id': asset_id,
+        'image_id': None,
+        'status': 'processing'
+    }
+
+def resolve_cape_status(asset_id, max_retries=10, refresh=False):
+    """Resolve an asset's status payload - Thumbnails API first, then the cape index"""
+    # First, try to get image ID using Thumbnails API (PERFECT METHOD)
+    image_id = get_image_id_perfect(str(asset_id), max_retries=max_retries, refresh=refresh)
+    
+    if image_id:
+        print(f"[API] ✅ Status check found image ID: {image_id}")
+        return {
+            'asset_id': asset_id,
+            'image_id': image_id,
+            'status': 'completed',
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    return logged_cape_status(asset_id)
+
+# One server-side resolution per subscribed asset, pushed to every listener (see cape_events.py)
+# Each round asks Roblox again past the 'still processing' cache entry; the hub retries until final
+SSE_KEEPALIVE_SECONDS = 15
+cape_status_hub = StatusHub(lambda asset_id: resolve_cape_status(asset_id, max_retries=10, refresh=True))
+
+def sse_event(event, payload):
+    """Format one Server-Sent Event"""
+    return f'event: {event}\ndata: {json.dumps(payload)}\n\n'
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
 @app.route('/api/cape-status/<asset_id>', methods=['GET'])
 def get_cape_status(asset_id):
     """Check status of uploaded cape and get image ID if available"""
     try:
-        # First, try to get image ID using Thumbnails API (PERFECT METHOD)
         # Use more retries for status check since user is waiting
-        image_id = get_image_id_perfect(str(asset_id), max_retries=10)
-        
-        if image_id:
-            print(f"[API] ✅ Status check found image ID: {image_id}")
-            return jsonify({
-                'asset_id': asset_id,
-                'image_id': image_id,
-                'status': 'completed',
-                'timestamp': datetime.now().isoformat()
-            })
-        
-        # Check cape_logs.json for this asset ID
-        cape_logs = load_json_file('cape_logs.json')
-        if cape_logs:
-            if 'capes' in cape_logs and isinstance(cape_logs['capes'], list):
-                for cape in cape_logs['capes']:
-                    if str(cape.get('asset_id', '')) == str(asset_id):
-                        return jsonify({
-                            'asset_id': asset_id,
-                            'image_id': cape.get('image_id', cape.get('asset_id', '')),
-                            'status': 'completed',
-                            'timestamp': cape.get('timestamp', datetime.now().isoformat())
-                        })
-            else:
-                for key, cape in cape_logs.items():
-                    if key != '_note' and str(cape.get('asset_id', '')) == str(asset_id):
-                        return jsonify({
-                            'asset_id': asset_id,
-                            'image_id': cape.get('image_id', cape.get('asset_id', '')),
-                            'status': 'completed',
-                            'timestamp': cape.get('timestamp', datetime.now().isoformat())
-                        })
-        
-        # Check purchases.json for this asset ID
-        purchases = load_json_file('purchases.json')
-        if purchases:
-            for user_id, user_purchases in purchases.items():
-                if isinstance(user_purchases, list):
-                    for purchase in user_purchases:
-                        if isinstance(purchase, dict) and str(purchase.get('decal_id', '')) == str(asset_id):
-                            return jsonify({
-                                'asset_id': asset_id,
-                                'image_id': purchase.get('decal_id'),
-                                'status': 'completed',
-                                'timestamp': purchase.get('timestamp', datetime.now().isoformat())
-                            })
-        
-        return jsonify({
-            'asset_id': asset_id,
-            'image_id': None,
-            'status': 'processing'
-        })
+        return jsonify(resolve_cape_status(asset_id, max_retries=10))
     except Exception as e:
         print(f"[API] Error getting cape status: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/cape-status/<asset_id>/events', methods=['GET'])
+def cape_status_events(asset_id):
+    """
+    Server-Sent Events stream for one asset - sends a single 'status' event
+    (same payload as /api/cape-status) once the image ID resolves, then closes
+    """
+    future = cape_status_hub.subscribe(asset_id)
+    
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    payload = future.result(timeout=SSE_KEEPALIVE_SECONDS)
+                    break
+                except FutureTimeoutError:
+                    yield ': keepalive\n\n'
+            yield sse_event('status', payload)
+        finally:
+            cape_status_hub.unsubscribe(asset_id)
+    
+    return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+HISTORY_MAX_LIMIT = 500
+
 @app.route('/api/capes/history', methods=['GET'])
 def get_cape_history():
-    """Get cape history - from cape_logs.json first, then purchases.json as fallback"""
+    """
+    Get cape history - from cape_logs.json first, then purchases.json as fallback
+    
+    Query params:
+        username: case-insensitive substring filter
+        match: 'prefix' to match usernames starting with username instead
+        limit: page size (max 500) - omit to stream every cape
+        cursor: next_cursor from the previous page
+    
+    The JSON document is streamed in batches, so memory per request stays flat.
+    """
     try:
         username_filter = request.args.get('username', '').upper().replace('+', ' ')
-        all_capes = []
-        
-        # Method 1: Try to load from cape_logs.json first (more detailed)
-        cape_logs = load_json_file('cape_logs.json')
-        if cape_logs and isinstance(cape_logs, dict):
-            # Check if it has 'capes' key (new format) or is a dict of entries (old format)
-            if 'capes' in cape_logs and isinstance(cape_logs['capes'], list):
-                # New format: {"capes": [...]}
-                for cape in cape_logs['capes']:
-                    if isinstance(cape, dict):
-                        all_capes.append({
-                            'decal_id': cape.get('asset_id', cape.get('decal_id', '')),
-                            'asset_id': cape.get('asset_id', cape.get('decal_id', '')),
-                            'image_id': cape.get('image_id', cape.get('asset_id', cape.get('decal_id', ''))),
-                            'ticket_number': cape.get('ticket_number', ''),
-                            'timestamp': cape.get('timestamp', ''),
-                            'discord_user_id': cape.get('discord_user_id', ''),
-                            'username': cape.get('username', 'Unknown')
-                        })
-            elif len(cape_logs) > 0:
-                # Old format: {key: {...}, key: {...}}
-                for key, cape in cape_logs.items():
-                    if key != '_note' and isinstance(cape, dict):
-                        all_capes.append({
-                            'decal_id': cape.get('asset_id', cape.get('decal_id', '')),
-                            'asset_id': cape.get('asset_id', cape.get('decal_id', '')),
-                            'image_id': cape.get('image_id', cape.get('asset_id', cape.get('decal_id', ''))),
-                            'ticket_number': cape.get('ticket_number', ''),
-                            'timestamp': cape.get('timestamp', ''),
-                            'discord_user_id': cape.get('discord_user_id', ''),
-                            'username': cape.get('username', 'Unknown')
-                        })
-        
-        # Method 2: Fallback to purchases.json if cape_logs.json is empty
-        if len(all_capes) == 0:
-            purchases = load_json_file('purchases.json')
-            if purchases:
-                for user_id, user_purchases in purchases.items():
-                    if isinstance(user_purchases, list):
-                        for purchase in user_purchases:
-                            if isinstance(purchase, dict):
-                                decal_id = purchase.get('decal_id', '')
-                                all_capes.append({
-                                    'decal_id': decal_id,
-                                    'asset_id': decal_id,
-                                    'image_id': decal_id,
-                                    'ticket_number': purchase.get('ticket_number', ''),
-                                    'timestamp': purchase.get('timestamp', ''),
-                                    'discord_user_id': user_id,
-                                    'username': 'Unknown'
-                                })
+        prefix = request.args.get('match') == 'prefix'
+        cursor = request.args.get('cursor') or None
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+        if cursor:
+            decode_cursor(cursor)  # Reject malformed cursors before streaming starts
         
-        # Filter by username if specified
-        if username_filter:
-            all_capes = [c for c in all_capes if username_filter in str(c.get('username', '')).upper()]
+        total = cape_store.history_count(username_filter, prefix)
+        print(f"[API] ✅ Cape history loaded - {total} capes found")
         
-        # Sort by timestamp (newest first)
-        all_capes.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        
-        print(f"[API] ✅ Cape history loaded - {len(all_capes)} capes found")
+        def generate():
+            yield '{"username": ' + json.dumps(username_filter if username_filter else 'ALL')
+            yield ', "total": ' + str(total) + ', "capes": ['
+            
+            last_cursor = None
+            count = 0
+            try:
+                # Fetch one extra record to know whether there is a next page
+                fetch_limit = limit + 1 if limit is not None else None
+                for record, record_cursor in cape_store.iter_history(username_filter, cursor, fetch_limit, prefix=prefix):
+                    if limit is not None and count == limit:
+                        break
+                    yield (', ' if count else '') + json.dumps(record)
+                    last_cursor = record_cursor
+                    count += 1
+                else:
+                    last_cursor = None
+            except Exception as e:
+                print(f"[API] Error streaming cape history: {e}")
+                last_cursor = None
+            
+            yield '], "count": ' + str(count) + ', "next_cursor": ' + json.dumps(last_cursor) + '}'
         
-        return jsonify({
-            'username': username_filter if username_filter else 'ALL',
-            'capes': all_capes,
-            'total': len(all_capes)
-        })
+        return Response(generate(), mimetype='application/json')
+    except ValueError as e:
+        return jsonify({'capes': [], 'total': 0, 'error': str(e)}), 400
     except Exception as e:
         print(f"[API] Error getting cape history: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'capes': [], 'total': 0, 'error': str(e)})
 
+CAPE_RENDER_BATCH_MAX = int(os.getenv('CAPE_RENDER_BATCH_MAX', '50'))
+
+@app.route('/api/capes/render', methods=['POST'])
+def render_cape_route():
+    """
+    Render one cape description server-side (see cape_renderer.py)
+    
+    Body: the builder's {"layers": [...]} (as saveCape() stores it)
+    Returns the 400x400 cape as image/png
+    """
+    if not CAPE_RENDER_AVAILABLE:
+        return jsonify({'error': 'Cape renderer not available'}), 500
+    spec = request.get_json(silent=True)
+    if spec is None:
+        return jsonify({'error': 'Expected a JSON cape description'}), 400
+    try:
+        return Response(render_cape_png(spec), mimetype='image/png')
+    except RenderError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"[API] Error rendering cape: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/capes/render/batch', methods=['POST'])
+def render_capes_batch():
+    """
+    Render many cape descriptions in parallel (e.g. a whole ticket queue)
+    
+    Body: {"capes": [{"layers": [...]}, ...]} (max CAPE_RENDER_BATCH_MAX)
+    Returns {"count", "rendered", "results": [{"index", "success", "image" (PNG data URL) | "error"}]}
+    """
+    if not CAPE_RENDER_AVAILABLE:
+        return jsonify({'error': 'Cape renderer not available'}), 500
+    body = request.get_json(silent=True) or {}
+    capes = body.get('capes')
+    if not isinstance(capes, list) or not capes:
+        return jsonify({'error': 'Expected {"capes": [...]}'}), 400
+    if len(capes) > CAPE_RENDER_BATCH_MAX:
+        return jsonify({'error': f'At most {CAPE_RENDER_BATCH_MAX} capes per batch'}), 400
+    
+    results = []
+    for result in render_many(capes):
+        png = result.pop('png', None)
+        if png is not None:
+            result['image'] = 'data:image/png;base64,' + base64.b64encode(png).decode()
+        results.append(result)
+    rendered = sum(1 for result in results if result['success'])
+    print(f"[API] ✅ Rendered {rendered}/{len(results)} capes")
+    return jsonify({'count': len(results), 'rendered': rendered, 'results': results})
+
 if __name__ == '__main__':
     print("=" * 60)
     print("🚀 ZAID'S CAPES - Combined Server")
@@ -743,4 +1095,9 @@ if __name__ == '__main__':
         print("⚠️  WARNING: DISCORD_CLIENT_ID not set in .env")
         print("   Discord OAuth will not work until configured")
         print("=" * 60)
+    # Connect to the Discord gateway and compute stats up front so the caches are warm
+    # (only in the reloader's serving process, not the file watcher)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        get_discord_gateway()
+        stats_refresher.start()
     app.run(debug=True, port=5000, host='0.0.0.0')
@@ -7,6 +7,7 @@ from flask_cors import CORS
 import json
 import os
 from datetime import datetime
+from journal import journaled
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend
@@ -14,13 +15,14 @@ CORS(app)  # Enable CORS for frontend
 # Load data from your bot's JSON files
 DATA_DIR = "../"  # Path to your bot's data files
 
+# Tickets go through journal.py; the bot reads and rewrites ticket_data.json itself,
+# so every write is compacted into the file straight away (write_through)
+ticket_file = journaled(os.path.join(DATA_DIR, "ticket_data.json"), write_through=True)
+
 def load_ticket_data():
-    """Load tickets from your bot's ticket system"""
+    """Load tickets from your bot's ticket system (snapshot + journaled updates)"""
     try:
-        ticket_file = os.path.join(DATA_DIR, "ticket_data.json")
-        if os.path.exists(ticket_file):
-            with open(ticket_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+        return ticket_file.load()
     except Exception as e:
         print(f"Error loading tickets: {e}")
     return {}
@@ -112,19 +114,14 @@ def get_ticket(ticket_id):
 def complete_ticket(ticket_id):
     """Mark ticket as completed"""
     try:
-        ticket_file = os.path.join(DATA_DIR, "ticket_data.json")
-        if os.path.exists(ticket_file):
-            with open(ticket_file, 'r', encoding='utf-8') as f:
-                ticket_data = json.load(f)
-            
-            if ticket_id in ticket_data:
-                ticket_data[ticket_id]['status'] = 'completed'
-                ticket_data[ticket_id]['completed_at'] = datetime.now().isoformat()
-                
-                with open(ticket_file, 'w', encoding='utf-8') as f:
-                    json.dump(ticket_data, f, indent=4)
-                
-                return jsonify({'success': True})
+        ticket_data = load_ticket_data()
+        if ticket_id in ticket_data:
+            # Keyed by ticket ID, so it lands on the right ticket even if the bot rewrote the file
+            ticket_file.merge([ticket_id], {
+                'status': 'completed',
+                'completed_at': datetime.now().isoformat()
+            })
+            return jsonify({'success': True})
         
         return jsonify({'error': 'Ticket not found'}), 404
     except Exception as e:
@@ -0,0 +1,509 @@
+"""
+Async Serving Mode
+Runs the API on one aiohttp event loop. The long-running routes (cape
+upload and bulk upload, cape status and its event stream, OAuth callback,
+stats, tickets) are coroutines, so thousands of status waits share one
+process instead of pinning threads.
+Every other route is served by the Flask app through a WSGI bridge.
+
+Usage: python async_server.py   (same port, URLs and responses as api.py)
+"""
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+import aiohttp
+from aiohttp import web
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+import api
+import tracing
+from api import app as flask_app
+from batch_resolver import THUMBNAILS_HOST, get_thumbnail_batcher
+from bulk_upload import BULK_UPLOAD_MAX_FILES, close_items, ndjson_line, upload_all
+from cape_ingest import UploadRejected, normalize_cape_image, spool_upload_async
+from http_pool import http_client
+from metrics import metrics
+from rate_limiter import rate_limiter
+from resolution_cache import get_resolution_cache
+from singleflight import image_id_flight_key, image_id_flights
+from upload_index import content_hash, get_upload_index
+
+ASYNC_PORT = int(os.getenv('ASYNC_PORT', '5000'))
+# Threads for blocking work: Flask routes, file/index reads
+WSGI_THREADS = int(os.getenv('ASYNC_WSGI_THREADS', '32'))
+
+executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='wsgi')
+
+
+async def run_blocking(fn, *args):
+    """Run a blocking call on the worker pool"""
+    if tracing.TRACING_ENABLED:
+        fn = functools.partial(contextvars.copy_context().run, fn)  # Spans in fn join the request's trace
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+# JSON responses serialized inside a 'json_serialize' span when the request is traced
+json_response = functools.partial(web.json_response, dumps=tracing.dumps)
+
+
+# ==================== ASYNC IMAGE ID RESOLVER ====================
+
+async def get_image_id_perfect_async(asset_id: str, max_retries: int = 25) -> Optional[str]:
+    """Coroutine version of api.get_image_id_perfect (same cache, batcher and retry schedule)"""
+    if not asset_id or not str(asset_id).isdigit() or int(asset_id) <= 0:
+        return None
+    asset_id = str(asset_id)
+
+    async def resolve():
+        cache = get_resolution_cache()
+        found, image_id = await run_blocking(cache.lookup, asset_id)
+        if found:
+            return image_id
+        image_id = await _fetch_image_id_async(asset_id, max_retries)
+        if image_id:
+            await run_blocking(cache.put, asset_id, image_id)
+        else:
+            await run_blocking(cache.put_negative, asset_id)
+        return image_id
+
+    # Shares one resolution with every concurrent waiter for the asset and retry budget -
+    # async routes, Flask routes on the bridge, cape jobs and the SSE hub alike
+    return await image_id_flights.do_async(image_id_flight_key(asset_id, max_retries), resolve)
+
+
+async def _fetch_image_id_async(asset_id: str, max_retries: int) -> Optional[str]:
+    batcher = get_thumbnail_batcher()
+    attempts = 0
+    for attempt in range(1, max_retries + 1):
+        try:
+            if attempt > 1:
+                # Jittered backoff that honors Retry-After; None = shared retry budget spent
+                wait_time = rate_limiter.retry_delay(THUMBNAILS_HOST, attempt)
+                if wait_time is None:
+                    print(f"[IMAGE-ID] ⚠️ Retry budget for {THUMBNAILS_HOST} spent, giving up on {asset_id}")
+                    break
+                with tracing.span('backoff', attempt=attempt, seconds=round(wait_time, 3)):
+                    await asyncio.sleep(wait_time)
+
+            attempts += 1
+            with tracing.span('thumbnails_lookup', attempt=attempt):
+                img_id = await asyncio.wrap_future(batcher.submit(asset_id))
+            if img_id:
+                print(f"[IMAGE-ID] ✅ Found image ID {img_id} from Thumbnails API (attempt {attempt})")
+                metrics.observe_resolution('async', attempts, 'thumbnails')
+                return img_id
+        except Exception:
+            pass  # Silent retry
+
+    # AssetDelivery API (fallback)
+    try:
+        status, _, _, final_url = await http_client.async_request(
+            'GET', f"{api.ROBLOX_ASSETDELIVERY_URL}/v1/asset?id={asset_id}", allow_redirects=True
+        )
+        if status == 200:
+            image_id = api.image_id_from_delivery_url(final_url, asset_id)
+            if image_id:
+                print(f"[IMAGE-ID] ✅ Found image ID {image_id} from AssetDelivery")
+                metrics.observe_resolution('async', attempts + 1, 'asset_delivery')
+                return image_id
+    except Exception:
+        pass
+    metrics.observe_resolution('async', attempts + 1, None)
+    return None
+
+
+# ==================== ASYNC ROUTES ====================
+
+async def cape_status(request: web.Request) -> web.Response:
+    asset_id = request.match_info['asset_id']
+    try:
+        image_id = await get_image_id_perfect_async(asset_id, max_retries=10)
+        if image_id:
+            print(f"[API] ✅ Status check found image ID: {image_id}")
+            return json_response({
+                'asset_id': asset_id,
+                'image_id': image_id,
+                'status': 'completed',
+                'timestamp': datetime.now().isoformat()
+            })
+        return json_response(await run_blocking(api.logged_cape_status, asset_id))
+    except Exception as e:
+        print(f"[API] Error getting cape status: {e}")
+        traceback.print_exc()
+        return json_response({'error': str(e)}, status=500)
+
+
+async def cape_status_events(request: web.Request) -> web.StreamResponse:
+    """SSE stream for one asset - a waiting subscriber costs no thread"""
+    asset_id = request.match_info['asset_id']
+    future = asyncio.wrap_future(api.cape_status_hub.subscribe(asset_id))
+    response = web.StreamResponse(headers={**api.SSE_HEADERS, 'Content-Type': 'text/event-stream'})
+    await response.prepare(request)
+    try:
+        await response.write(b'retry: 5000\n\n')
+        while True:
+            try:
+                payload = await asyncio.wait_for(asyncio.shield(future), timeout=api.SSE_KEEPALIVE_SECONDS)
+                break
+            except asyncio.TimeoutError:
+                await response.write(b': keepalive\n\n')
+        await response.write(api.sse_event('status', payload).encode())
+        await response.write_eof()
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    finally:
+        api.cape_status_hub.unsubscribe(asset_id)
+    return response
+
+
+async def upload_cape(request: web.Request) -> web.Response:
+    try:
+        if not api.CAPE_UPLOAD_AVAILABLE:
+            return json_response({'error': 'Cape upload module not available'}, status=500)
+
+        # Stream the multipart body - only the cape_image part is read, into a size-capped spool
+        spool = None
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == 'cape_image':
+                if not part.filename:
+                    return json_response({'error': 'No file selected'}, status=400)
+                try:
+                    spool = await spool_upload_async(part)
+                except UploadRejected as e:
+                    return json_response({'error': str(e), 'success': False}, status=e.status)
+                break
+        if spool is None:
+            return json_response({'error': 'No file provided'}, status=400)
+
+        # Resize/strip/recompress off the event loop
+        try:
+            with spool:
+                file_bytes, ingest = await run_blocking(normalize_cape_image, spool)
+        except UploadRejected as e:
+            return json_response({'error': str(e), 'success': False}, status=e.status)
+        print(f"[API] Normalized upload {ingest['original_bytes']} -> {ingest['normalized_bytes']} bytes "
+              f"({ingest['width']}x{ingest['height']})")
+
+        # Same image uploaded before? Hand back its IDs instead of creating a new asset
+        digest = content_hash(file_bytes)
+        force = api.force_upload_requested(request.query)
+        existing = None if force else await run_blocking(get_upload_index().lookup, digest)
+        if existing:
+            print(f"[API] ♻️ Duplicate upload - reusing Asset ID: {existing['asset_id']}")
+            return json_response(await run_blocking(api.duplicate_upload_response, existing))
+
+        asset_name, asset_desc = api.new_cape_asset_name()
+        config_error = api.cape_upload_config_error()
+        if config_error:
+            return json_response({'error': config_error}, status=500)
+
+        async def upload():
+            # Runs on the shared loop - no per-request event loop
+            asset_id = await api.upload_decal_to_roblox(
+                api.ROBLOX_API_KEY,
+                api.CREATOR_ID,
+                file_bytes,
+                asset_name,
+                asset_desc,
+                to_group=api.UPLOAD_TO_GROUP
+            )
+            await run_blocking(get_upload_index().record, digest, asset_id)
+            return asset_id
+
+        try:
+            # Identical images submitted at the same moment share one Roblox upload
+            asset_id = await api.upload_flights.do_async(digest, upload)
+        except RuntimeError as e:
+            print(f"[API] ❌ Upload failed: {e}")
+            return json_response({'error': str(e), 'success': False}, status=500)
+        except Exception as e:
+            print(f"[API] ❌ Upload error: {e}")
+            traceback.print_exc()
+            return json_response({'error': f'Upload failed: {e}', 'success': False}, status=500)
+
+        print(f"[API] ✅ Cape uploaded successfully - Asset ID: {asset_id}")
+        job = api.resolution_jobs.submit(str(asset_id))
+        return json_response(api.cape_upload_response(asset_id, job))
+    except Exception as e:
+        print(f"[API] Upload error: {e}")
+        traceback.print_exc()
+        return json_response({'error': str(e), 'success': False}, status=500)
+
+
+async def upload_capes(request: web.Request) -> web.StreamResponse:
+    """Bulk upload (see api.upload_capes) - every file's upload runs on the shared loop"""
+    if not api.CAPE_UPLOAD_AVAILABLE:
+        return json_response({'error': 'Cape upload module not available', 'success': False}, status=500)
+
+    # Spool each cape_images part as it streams in; a rejected file becomes its error row
+    items = []
+    too_many = False
+    try:
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name != 'cape_images' or not part.filename:
+                continue
+            if len(items) == BULK_UPLOAD_MAX_FILES:
+                too_many = True
+                break
+            try:
+                items.append((part.filename, await spool_upload_async(part)))
+            except UploadRejected as e:
+                items.append((part.filename, e))
+    except Exception:
+        close_items(items)
+        raise
+    error = api.bulk_upload_request_error(len(items) + too_many)
+    if error:
+        close_items(items)
+        return json_response({'error': error[0], 'success': False}, status=error[1])
+
+    print(f"[API] Bulk upload of {len(items)} capes")
+    response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson', 'X-Accel-Buffering': 'no'})
+    await response.prepare(request)
+    results = []
+    try:
+        force = api.force_upload_requested(request.query)
+        async for result in upload_all(items, lambda spool: api.bulk_upload_item(spool, run_blocking, force)):
+            results.append(result)
+            await response.write(ndjson_line(result))
+        await response.write(ndjson_line(await run_blocking(api.finish_bulk_upload, results)))
+        await response.write_eof()
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    return response
+
+
+async def discord_callback(request: web.Request) -> web.StreamResponse:
+    code = request.query.get('code')
+    error = request.query.get('error')
+
+    if error:
+        return web.Response(
+            text=f'<html><body><h1>OAuth Error: {error}</h1><p><a href="/dashboard.html">Go back to login</a></p></body></html>',
+            status=400, content_type='text/html'
+        )
+    if not code:
+        return json_response({'error': 'No code provided'}, status=400)
+
+    try:
+        status, _, body, _ = await http_client.async_request(
+            'POST', f'{api.DISCORD_API_URL}/oauth2/token',
+            data=api.discord_token_request(code),
+            headers={'Content-Type': 'application/x-www-form-urlencoded'}
+        )
+        if status >= 400:
+            error_body = body.decode(errors='replace')
+            print(f"[API] OAuth error: {error_body}")
+            return web.Response(text=api.OAUTH_ERROR_PAGE.format(error_body), status=500, content_type='text/html')
+        access_token = json.loads(body).get('access_token')
+        if not access_token:
+            return json_response({'error': 'Failed to get access token'}, status=400)
+
+        status, _, body, _ = await http_client.async_request(
+            'GET', f'{api.DISCORD_API_URL}/users/@me',
+            headers={'Authorization': f'Bearer {access_token}'}
+        )
+        if status >= 400:
+            error_body = body.decode(errors='replace')
+            print(f"[API] OAuth error: {error_body}")
+            return web.Response(text=api.OAUTH_ERROR_PAGE.format(error_body), status=500, content_type='text/html')
+        user_data = json.loads(body)
+
+        response = web.Response(status=302, headers={'Location': '/dashboard.html?logged_in=true'})
+        _store_flask_session(request, response, {'discord_user': api.discord_session_user(user_data, access_token)})
+        return response
+    except Exception as e:
+        print(f"[API] OAuth callback error: {e}")
+        traceback.print_exc()
+        return web.Response(text=api.ERROR_PAGE.format(str(e)), status=500, content_type='text/html')
+
+
+def _store_flask_session(request: web.Request, response: web.StreamResponse, values: dict):
+    """Update the Flask session cookie so Flask routes see the login"""
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    cookie_name = flask_app.config['SESSION_COOKIE_NAME']
+    session_data = {}
+    if request.cookies.get(cookie_name):
+        try:
+            session_data = serializer.loads(request.cookies[cookie_name])
+        except Exception:
+            session_data = {}
+    session_data.update(values)
+    response.set_cookie(
+        cookie_name, serializer.dumps(session_data),
+        httponly=flask_app.config['SESSION_COOKIE_HTTPONLY'],
+        secure=flask_app.config['SESSION_COOKIE_SECURE'],
+        samesite=flask_app.config['SESSION_COOKIE_SAMESITE'],
+        path=flask_app.config['SESSION_COOKIE_PATH'] or '/',
+    )
+
+
+async def get_stats(request: web.Request) -> web.Response:
+    stats, freshness = api.stats_refresher.get()
+    return json_response({**stats, 'freshness': freshness})
+
+
+async def get_tickets(request: web.Request) -> web.Response:
+    # Same circuit breaker as api.bot_api_get - no waiting on the timeout while the bot is down
+    breaker = api.bot_api_breaker
+    if not breaker.allow():
+        return json_response([])
+    try:
+        status, _, body, _ = await http_client.async_request(
+            'GET', f'{api.BOT_API_URL}/api/tickets', timeout=aiohttp.ClientTimeout(total=2)
+        )
+    except Exception as e:
+        breaker.record_failure(e)
+        return json_response([])
+    if status >= 500:
+        breaker.record_failure(RuntimeError(f'HTTP {status}'))
+        return json_response([])
+    breaker.record_success()
+    try:
+        if status < 400:
+            tickets = json.loads(body)
+            if tickets:
+                return json_response(tickets)
+    except Exception:
+        pass
+    return json_response([])
+
+
+# ==================== FLASK (WSGI) BRIDGE ====================
+
+async def wsgi_bridge(request: web.Request) -> web.StreamResponse:
+    """Serve any other route with the Flask app on the worker pool, streaming its body"""
+    body = await request.read()
+    builder = EnvironBuilder(
+        path=request.path,
+        base_url=f'{request.scheme}://{request.host}',
+        query_string=request.query_string,
+        method=request.method,
+        headers=list(request.headers.items()),
+        data=body,
+        environ_base={'REMOTE_ADDR': request.remote or ''},
+    )
+    environ = builder.get_environ()
+    builder.close()
+
+    app_iter, status, headers = await run_blocking(lambda: run_wsgi_app(flask_app.wsgi_app, environ))
+    status_code = int(status.split(' ', 1)[0])
+    response = web.StreamResponse(status=status_code, reason=status.split(' ', 1)[1] if ' ' in status else None)
+    for name, value in headers.items():
+        if name.lower() not in ('content-length', 'transfer-encoding', 'connection'):
+            response.headers.add(name, value)
+    await response.prepare(request)
+
+    iterator = iter(app_iter)
+    sentinel = object()
+    try:
+        while True:
+            chunk = await run_blocking(next, iterator, sentinel)
+            if chunk is sentinel:
+                break
+            if chunk:
+                await response.write(chunk.encode() if isinstance(chunk, str) else chunk)
+    finally:
+        if hasattr(app_iter, 'close'):
+            await run_blocking(app_iter.close)
+    await response.write_eof()
+    return response
+
+
+@web.middleware
+async def metrics_middleware(request: web.Request, handler):
+    """Per-route latency for the native routes (bridged routes are timed by the Flask app)"""
+    if request.match_info.route.name == 'wsgi':
+        return await handler(request)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        resource = request.match_info.route.resource
+        route = f'{request.method} {resource.canonical if resource else "<unmatched>"}'
+        metrics.observe_route(route, status, time.perf_counter() - started)
+
+
+@web.middleware
+async def tracing_middleware(request: web.Request, handler):
+    """Trace sampled requests to the native routes (only installed while tracing is on)"""
+    if request.match_info.route.name == 'wsgi':
+        return await handler(request)  # Traced by the Flask app
+    root = tracing.tracer.start(f'{request.method} {request.path}',
+                                force=request.headers.get(tracing.TRACE_HEADER) == '1')
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        if root is not None and not response.prepared:
+            response.headers['X-Trace-Id'] = root.trace_id
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        tracing.tracer.finish(root, status=status)
+
+
+@web.middleware
+async def cors_middleware(request: web.Request, handler):
+    """Mirror flask_cors(supports_credentials=True) on the native async routes (Flask handles the rest)"""
+    response = await handler(request)
+    origin = request.headers.get('Origin')
+    if origin and request.match_info.route.name != 'wsgi':
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Allow-Credentials'] = 'true'
+        response.headers['Vary'] = 'Origin'
+    return response
+
+
+def create_app() -> web.Application:
+    middlewares = [metrics_middleware, tracing_middleware, cors_middleware] if tracing.TRACING_ENABLED \
+        else [metrics_middleware, cors_middleware]
+    application = web.Application(middlewares=middlewares, client_max_size=50 * 1024 * 1024)
+    application.router.add_get('/api/cape-status/{asset_id}', cape_status)
+    application.router.add_get('/api/cape-status/{asset_id}/events', cape_status_events)
+    application.router.add_post('/api/upload-cape', upload_cape)
+    application.router.add_post('/api/upload-capes', upload_capes)
+    application.router.add_get('/api/auth/callback', discord_callback)
+    application.router.add_get('/api/stats', get_stats)
+    application.router.add_get('/api/tickets', get_tickets)
+    application.router.add_route('*', '/{tail:.*}', wsgi_bridge, name='wsgi')
+
+    async def on_startup(app):
+        api.get_discord_gateway()
+        api.stats_refresher.start()
+
+    async def on_cleanup(app):
+        await http_client.close_async()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    application.on_startup.append(on_startup)
+    application.on_cleanup.append(on_cleanup)
+    return application
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("🚀 ZAID'S CAPES - Async Server")
+    print("=" * 60)
+    print(f"📁 Serving static files AND API on port {ASYNC_PORT}")
+    print(f"🌐 Open: http://localhost:{ASYNC_PORT}")
+    print("=" * 60)
+    web.run_app(create_app(), host='0.0.0.0', port=ASYNC_PORT)
@@ -0,0 +1,177 @@
+"""
+Batched Roblox Thumbnails API Lookups
+Collects asset IDs that are waiting on an image ID for a short window and
+sends them as ONE multi-ID thumbnails request, then hands each caller its
+own result. One lookup = one attempt; callers keep their own retry loops.
+"""
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from http_pool import host_of, http_client
+from tracing import current_span, shared_span
+
+# Base URL overridable for offline benchmarks (see bench_stubs.py)
+THUMBNAILS_API_URL = os.getenv('ROBLOX_THUMBNAILS_URL', 'https://thumbnails.roblox.com').rstrip('/') + '/v1/assets'
+THUMBNAILS_HOST = host_of(THUMBNAILS_API_URL)  # rate-limit/retry-budget key for lookups
+BATCH_WINDOW = float(os.getenv('THUMBNAILS_BATCH_WINDOW', '0.25'))  # seconds to collect IDs
+BATCH_MAX_SIZE = int(os.getenv('THUMBNAILS_BATCH_MAX_SIZE', '100'))  # Thumbnails API limit
+
+
+def extract_image_id(entry: dict, asset_id: str) -> Optional[str]:
+    """
+    Pull the image ID out of one thumbnails API entry
+
+    Returns:
+        Image ID as string, or None if the entry has none yet
+    """
+    asset_id = str(asset_id)
+
+    # Check targetId field (MOST RELIABLE)
+    target_id = entry.get("targetId")
+    if target_id and str(target_id) != asset_id:
+        return str(target_id)
+
+    image_url = entry.get("imageUrl") or ""
+    if image_url:
+        # Pattern 1: https://tr.rbxcdn.com/{imageId}/420x420/...
+        # Pattern 2: rbxcdn.com/{imageId}
+        # Pattern 3: Any numeric ID in URL (9+ digits)
+        for pattern in (r'/tr\.rbxcdn\.com/(\d{9,})/', r'rbxcdn\.com/(\d{9,})/', r'/(\d{9,})/'):
+            match = re.search(pattern, image_url)
+            if match and match.group(1) != asset_id:
+                return match.group(1)
+
+    return None
+
+
+class ThumbnailBatcher:
+    """Coalesces pending thumbnails lookups into multi-ID requests"""
+
+    def __init__(self, window: float = BATCH_WINDOW, max_batch: int = BATCH_MAX_SIZE, timeout: float = 20):
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        # asset ID -> [(future, waiting caller's trace span or None)]
+        self._pending: Dict[str, List[Tuple[Future, object]]] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self.requests_sent = 0
+        self.ids_requested = 0
+
+    def lookup(self, asset_id: str, timeout: Optional[float] = None) -> Optional[str]:
+        """Single batched attempt at resolving one asset ID (blocking)"""
+        future = self.submit(asset_id)
+        try:
+            return future.result(timeout=timeout if timeout is not None else self.window + self.timeout + 5)
+        except Exception:
+            return None
+
+    def lookup_many(self, asset_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Single batched attempt at resolving many asset IDs (blocking)"""
+        futures = {str(asset_id): self.submit(asset_id) for asset_id in asset_ids}
+        results = {}
+        for asset_id, future in futures.items():
+            try:
+                results[asset_id] = future.result(timeout=self.window + self.timeout + 5)
+            except Exception:
+                results[asset_id] = None
+        return results
+
+    def submit(self, asset_id: str) -> Future:
+        """Queue an asset ID for the next batch"""
+        future: Future = Future()
+        with self._cond:
+            self._ensure_thread()
+            self._pending.setdefault(str(asset_id), []).append((future, current_span()))
+            self._cond.notify()
+        return future
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='thumbnail-batcher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # Let more callers join this batch
+            deadline = time.monotonic() + self.window
+            with self._cond:
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                asset_ids = list(self._pending)[:self.max_batch]
+                batch = {asset_id: self._pending.pop(asset_id) for asset_id in asset_ids}
+            self._flush(batch)
+
+    def _flush(self, batch: Dict[str, List[Tuple[Future, object]]]):
+        results: Dict[str, Optional[str]] = {}
+        waiting_spans = [parent for waiters in batch.values() for _, parent in waiters]
+        try:
+            # The request runs on this thread - its spans go into every traced waiter's trace
+            with shared_span('thumbnails_batch', waiting_spans, ids=len(batch), waiters=len(waiting_spans)):
+                results = self._fetch(list(batch))
+        except Exception as e:
+            print(f"[IMAGE-ID] Batched thumbnails request failed: {e}")
+        for asset_id, waiters in batch.items():
+            for future, _ in waiters:
+                if not future.done():
+                    future.set_result(results.get(asset_id))
+
+    def _fetch(self, asset_ids: List[str]) -> Dict[str, Optional[str]]:
+        """One thumbnails API call for the whole batch"""
+        self.requests_sent += 1
+        self.ids_requested += len(asset_ids)
+        response = http_client.get(
+            THUMBNAILS_API_URL,
+            params={
+                'assetIds': ','.join(asset_ids),
+                'size': '420x420',
+                'format': 'Png',
+                'isCircular': 'false',
+            },
+            timeout=self.timeout,
+        )
+        if response.status_code != 200:
+            return {}
+
+        entries = response.json().get("data") or []
+        wanted = set(asset_ids)
+        results: Dict[str, Optional[str]] = {}
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            # Only trust targetId - an entry without one can't be matched to an asset safely,
+            # and its asset stays unresolved so the caller retries it
+            asset_id = str(entry.get("targetId", ""))
+            if asset_id not in wanted:
+                continue
+            if results.get(asset_id):
+                continue
+            results[asset_id] = extract_image_id(entry, asset_id)
+        return results
+
+    def stats(self) -> dict:
+        return {'requests_sent': self.requests_sent, 'ids_requested': self.ids_requested}
+
+
+_batcher: Optional[ThumbnailBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def get_thumbnail_batcher() -> ThumbnailBatcher:
+    """Get the process-wide thumbnails batcher"""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = ThumbnailBatcher()
+    return _batcher
@@ -0,0 +1,197 @@
+"""
+Local Stand-Ins for Roblox, Discord and the Bot API
+Small aiohttp servers that answer like thumbnails.roblox.com,
+assetdelivery.roblox.com, the Discord REST/OAuth endpoints and the bot's
+API on port 5001, with injectable latency, errors and 429s. Used by
+benchmark.py; point the API at them with the *_URL environment variables
+that StubServices.env() returns.
+
+Usage: python bench_stubs.py   (runs the stubs until Ctrl+C and prints their env)
+"""
+import asyncio
+import random
+import threading
+from typing import Dict, Optional
+
+from aiohttp import web
+
+IMAGE_ID_OFFSET = 9_000_000_000  # stub image ID = asset ID + offset (always 10+ digits, never the asset ID)
+
+
+class Faults:
+    """What a stub injects into each response"""
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: float = 1.0, pending_rate: float = 0.0):
+        self.latency = latency              # seconds added to every response
+        self.jitter = jitter                # + uniform(0, jitter)
+        self.error_rate = error_rate        # fraction answered with 500
+        self.throttle_rate = throttle_rate  # fraction answered with 429 + Retry-After
+        self.retry_after = retry_after      # Retry-After seconds on a 429
+        self.pending_rate = pending_rate    # thumbnails only: fraction of IDs still "Pending"
+
+    @classmethod
+    def parse(cls, spec: str, base: Optional['Faults'] = None) -> 'Faults':
+        """'latency=0.2,error_rate=0.01' -> Faults (unknown keys rejected)"""
+        faults = cls(**vars(base)) if base else cls()
+        for item in filter(None, spec.split(',')):
+            key, _, value = item.partition('=')
+            if not hasattr(faults, key.strip()):
+                raise ValueError(f'Unknown fault setting: {key}')
+            setattr(faults, key.strip(), float(value))
+        return faults
+
+
+def stub_image_id(asset_id: str) -> str:
+    return str(int(asset_id) + IMAGE_ID_OFFSET)
+
+
+def _faulty(faults: Faults, handler):
+    """Wrap a handler with the service's latency/error/429 injection"""
+    async def wrapped(request: web.Request) -> web.StreamResponse:
+        await asyncio.sleep(faults.latency + random.uniform(0, faults.jitter))
+        roll = random.random()
+        if roll < faults.throttle_rate:
+            return web.json_response({'errors': [{'code': 0, 'message': 'Too many requests'}]}, status=429,
+                                     headers={'Retry-After': str(int(faults.retry_after))})
+        if roll < faults.throttle_rate + faults.error_rate:
+            return web.json_response({'errors': [{'code': 0, 'message': 'InternalServerError'}]}, status=500)
+        return await handler(request)
+    return wrapped
+
+
+def thumbnails_app(faults: Faults) -> web.Application:
+    async def assets(request: web.Request) -> web.Response:
+        data = []
+        for asset_id in filter(None, request.query.get('assetIds', '').split(',')):
+            if not asset_id.isdigit():
+                continue
+            if random.random() < faults.pending_rate:
+                data.append({'targetId': int(asset_id), 'state': 'Pending', 'imageUrl': None})
+            else:
+                data.append({'targetId': int(asset_id), 'state': 'Completed',
+                             'imageUrl': f'https://tr.rbxcdn.com/{stub_image_id(asset_id)}/420/420/Image/Png'})
+        return web.json_response({'data': data})
+
+    app = web.Application()
+    app.router.add_get('/v1/assets', _faulty(faults, assets))
+    return app
+
+
+def assetdelivery_app(faults: Faults) -> web.Application:
+    async def asset(request: web.Request) -> web.Response:
+        asset_id = request.query.get('id', '')
+        if not asset_id.isdigit():
+            return web.json_response({'errors': [{'code': 400, 'message': 'Invalid id'}]}, status=400)
+        # Redirects to the image's CDN location, like the real API
+        raise web.HTTPFound(f'/content/{stub_image_id(asset_id)}/image.png')
+
+    async def content(request: web.Request) -> web.Response:
+        return web.Response(body=b'\x89PNG\r\n\x1a\n', content_type='image/png')
+
+    app = web.Application()
+    app.router.add_get('/v1/asset', _faulty(faults, asset))
+    app.router.add_get('/content/{image_id}/image.png', content)
+    return app
+
+
+def discord_app(faults: Faults) -> web.Application:
+    async def token(request: web.Request) -> web.Response:
+        form = await request.post()
+        if not form.get('code'):
+            return web.json_response({'error': 'invalid_request'}, status=400)
+        return web.json_response({'access_token': f"stub-{form['code']}", 'token_type': 'Bearer',
+                                  'expires_in': 604800, 'scope': 'identify guilds'})
+
+    async def me(request: web.Request) -> web.Response:
+        return web.json_response({'id': '100000000000000001', 'username': 'bench-user',
+                                  'avatar': None, 'discriminator': '0'})
+
+    async def guild(request: web.Request) -> web.Response:
+        return web.json_response({'id': request.match_info['guild_id'], 'name': 'Bench Guild',
+                                  'approximate_member_count': 1234, 'approximate_presence_count': 321})
+
+    app = web.Application()
+    app.router.add_post('/api/oauth2/token', _faulty(faults, token))
+    app.router.add_get('/api/users/@me', _faulty(faults, me))
+    app.router.add_get('/api/v10/guilds/{guild_id}', _faulty(faults, guild))
+    return app
+
+
+def bot_api_app(faults: Faults) -> web.Application:
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response({'pendingTickets': 3, 'completedTickets': 42, 'onlineUsers': 321,
+                                  'totalMembers': 1234, 'botUptime': '99.9%', 'capesGenerated': 42,
+                                  'revenue': '$1680', 'totalUsers': 99, 'totalTickets': 45})
+
+    async def tickets(request: web.Request) -> web.Response:
+        return web.json_response([{'id': str(number), 'channel': f'ticket-{number:04d}', 'status': 'open'}
+                                  for number in range(1, 11)])
+
+    app = web.Application()
+    app.router.add_get('/api/stats', _faulty(faults, stats))
+    app.router.add_get('/api/tickets', _faulty(faults, tickets))
+    return app
+
+
+SERVICES = {
+    'thumbnails': thumbnails_app,
+    'assetdelivery': assetdelivery_app,
+    'discord': discord_app,
+    'bot_api': bot_api_app,
+}
+
+
+class StubServices:
+    """All stubs on one background event loop, each on its own localhost port"""
+
+    def __init__(self, faults: Optional[Dict[str, Faults]] = None, host: str = '127.0.0.1'):
+        self.faults = {name: (faults or {}).get(name) or Faults() for name in SERVICES}
+        self.host = host
+        self.urls: Dict[str, str] = {}
+        self._loop = asyncio.new_event_loop()
+        self._runners = []
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'StubServices':
+        self._thread = threading.Thread(target=self._loop.run_forever, name='bench-stubs', daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result(timeout=10)
+        return self
+
+    async def _start(self):
+        for name, make_app in SERVICES.items():
+            runner = web.AppRunner(make_app(self.faults[name]), access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, self.host, 0)
+            await site.start()
+            port = runner.addresses[-1][1]
+            self._runners.append(runner)
+            self.urls[name] = f'http://{self.host}:{port}'
+
+    def stop(self):
+        async def cleanup():
+            for runner in self._runners:
+                await runner.cleanup()
+        asyncio.run_coroutine_threadsafe(cleanup(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def env(self) -> Dict[str, str]:
+        """Environment that points the API at the stubs"""
+        return {
+            'ROBLOX_THUMBNAILS_URL': self.urls['thumbnails'],
+            'ROBLOX_ASSETDELIVERY_URL': self.urls['assetdelivery'],
+            'DISCORD_API_URL': self.urls['discord'] + '/api',
+            'BOT_API_URL': self.urls['bot_api'],
+        }
+
+
+if __name__ == '__main__':
+    stubs = StubServices().start()
+    for key, value in stubs.env().items():
+        print(f'{key}={value}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stubs.stop()
@@ -0,0 +1,474 @@
+"""
+API Benchmark
+Starts the stub services (bench_stubs.py), runs the API against them -
+Flask's threaded server or async_server.py - with a synthetic bot data
+directory, drives every route in api.py with concurrent clients and
+reports p50/p99 latency and throughput per route. Save a run and compare
+later runs against it to catch performance regressions.
+
+Usage:
+    python benchmark.py                                   (async server, every route)
+    python benchmark.py --server flask --routes stats,cape_status
+    python benchmark.py --faults thumbnails:throttle_rate=0.1 --faults all:latency=0.2
+    python benchmark.py --save bench_baseline.json
+    python benchmark.py --baseline bench_baseline.json    (exit code 1 on a regression)
+
+The upload routes are not driven: they upload to Roblox through
+cape_generation, which lives outside this package and has no stub.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from itertools import count
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from bench_stubs import Faults, SERVICES, StubServices
+from rate_limiter import RATE_LIMITS, parse_limits
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_START_TIMEOUT = 60        # seconds to wait for the API to answer
+REGRESSION_FLOOR_MS = 5.0        # p99 changes smaller than this are noise, not regressions
+FRESH_ASSET_BASE = 20_000_000_000  # cape-status IDs nobody has resolved yet
+
+# Production hosts the stubs stand in for (their RATE_LIMITS move onto the stubs' host:port)
+STUBBED_HOSTS = {
+    'thumbnails.roblox.com': 'thumbnails',
+    'assetdelivery.roblox.com': 'assetdelivery',
+}
+
+# Routes in api.py that aren't driven, and why
+NOT_DRIVEN = {
+    'upload_cape': 'uploads go to Roblox through cape_generation (outside this package, not stubbed)',
+    'upload_capes': 'uploads go to Roblox through cape_generation (outside this package, not stubbed)',
+}
+
+RENDER_SPEC = {'layers': [
+    {'type': 'background', 'order': 0, 'properties': {'color': '#1e1e2e'}},
+    {'type': 'gradient', 'order': 1, 'opacity': 60,
+     'properties': {'direction': 'vertical', 'colors': ['#ff0055', '#00ccff']}},
+    {'type': 'shape', 'order': 2, 'properties': {'shape': 'star', 'color': '#ffd700', 'x': 100, 'y': 100, 'width': 200, 'height': 200}},
+    {'type': 'text', 'order': 3, 'properties': {'text': 'BENCH', 'color': '#ffffff', 'x': 200, 'y': 40, 'align': 'center'}},
+]}
+
+
+class Route:
+    """One benchmarked endpoint"""
+
+    def __init__(self, name: str, method: str, path: str, body=None, ok=(200,)):
+        self.name = name
+        self.method = method
+        self.path = path    # str.format()ed with Samples.values() for every request
+        self.body = body    # JSON body
+        self.ok = ok        # statuses that count as success
+
+
+ROUTES = [
+    Route('index', 'GET', '/'),
+    Route('static_dashboard', 'GET', '/dashboard.html'),
+    Route('static_builder', 'GET', '/cape-builder.html'),
+    Route('auth_login', 'GET', '/api/auth/login', ok=(302,)),
+    Route('auth_callback', 'GET', '/api/auth/callback?code=bench{n}', ok=(302,)),
+    Route('auth_me', 'GET', '/api/auth/me', ok=(401,)),
+    Route('auth_logout', 'POST', '/api/auth/logout'),
+    Route('stats', 'GET', '/api/stats'),
+    Route('tickets', 'GET', '/api/tickets'),
+    Route('ticket', 'GET', '/api/tickets/{n}', ok=(501,)),
+    Route('bot_api_status', 'GET', '/api/bot-api/status'),
+    Route('user_points', 'GET', '/api/user/{user_id}/points'),
+    Route('user_purchases', 'GET', '/api/user/{user_id}/purchases'),
+    Route('quota_moderation', 'GET', '/api/quota/moderation/{user_id}'),
+    Route('quota_evmd', 'GET', '/api/quota/evmd/{user_id}'),
+    Route('cape_job', 'GET', '/api/cape-jobs/bench-{n}', ok=(404,)),
+    Route('cape_status_logged', 'GET', '/api/cape-status/{logged_asset_id}'),
+    Route('cape_status_fresh', 'GET', '/api/cape-status/{fresh_asset_id}'),
+    Route('cape_status_events', 'GET', '/api/cape-status/{fresh_asset_id}/events'),
+    Route('capes_history', 'GET', '/api/capes/history?limit=50'),
+    Route('capes_history_user', 'GET', '/api/capes/history?username={username}'),
+    Route('capes_history_all', 'GET', '/api/capes/history'),
+    Route('capes_render', 'POST', '/api/capes/render', body=RENDER_SPEC),
+    Route('capes_render_batch', 'POST', '/api/capes/render/batch', body={'capes': [RENDER_SPEC] * 5}),
+    Route('metrics', 'GET', '/api/metrics'),
+    Route('traces_slow', 'GET', '/api/traces/slow'),
+]
+
+
+# ==================== SYNTHETIC DATA ====================
+
+def write_data_dir(path: str, capes: int, users: int) -> dict:
+    """Bot data files (cape_logs.json, purchases.json, points.json, ...) shaped like the bot writes them"""
+    rng = random.Random(42)
+    user_ids = [str(300_000_000_000_000_000 + n) for n in range(users)]
+    usernames = {user_id: f'BENCHUSER{n:05d}' for n, user_id in enumerate(user_ids)}
+    started = datetime(2025, 1, 1)
+    cape_logs, purchases = [], {}
+    for n in range(capes):
+        user_id = rng.choice(user_ids)
+        asset_id = str(10_000_000_000 + n)
+        timestamp = (started + timedelta(minutes=7 * n)).isoformat()
+        cape_logs.append({
+            'asset_id': asset_id,
+            'image_id': str(int(asset_id) + 1),
+            'ticket_number': n + 1,
+            'timestamp': timestamp,
+            'discord_user_id': user_id,
+            'username': usernames[user_id],
+        })
+        purchases.setdefault(user_id, []).append({'decal_id': asset_id, 'ticket_number': n + 1, 'timestamp': timestamp})
+
+    files = {
+        'cape_logs.json': {'capes': cape_logs},
+        'purchases.json': purchases,
+        'points.json': {user_id: rng.randint(0, 500) for user_id in user_ids},
+        'ticket_counter.json': {'counter': capes + capes // 20},
+        'moderation_quota_data.json': {user_id: {'count': rng.randint(0, 20)} for user_id in user_ids[:50]},
+        'evmd_quota_data.json': {user_id: {'count': rng.randint(0, 20)} for user_id in user_ids[:50]},
+    }
+    for filename, data in files.items():
+        with open(os.path.join(path, filename), 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+    return {
+        'user_ids': user_ids,
+        'usernames': list(usernames.values()),
+        'asset_ids': [cape['asset_id'] for cape in cape_logs],
+    }
+
+
+class Samples:
+    """Path parameters for each request"""
+
+    def __init__(self, data: dict, seed: int = 7):
+        self.data = data
+        self.rng = random.Random(seed)
+        self.fresh = count(FRESH_ASSET_BASE + int(time.time()) % 1_000_000 * 1000)
+
+    def values(self, n: int) -> dict:
+        return {
+            'n': n,
+            'user_id': self.rng.choice(self.data['user_ids']),
+            'username': self.rng.choice(self.data['usernames'])[:-1],  # substring match, like the search box
+            'logged_asset_id': self.rng.choice(self.data['asset_ids']),
+            'fresh_asset_id': next(self.fresh),
+        }
+
+
+# ==================== SERVER UNDER TEST ====================
+
+FLASK_RUNNER = (
+    "import sys, api\n"
+    "from werkzeug.serving import run_simple\n"
+    "api.get_discord_gateway()\n"
+    "api.stats_refresher.start()\n"
+    "run_simple('127.0.0.1', int(sys.argv[1]), api.app, threaded=True)\n"
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def stub_rate_limits(stubs: StubServices) -> str:
+    """RATE_LIMITS with the production hosts' limits moved onto the stubs, so pacing matches production"""
+    entries = []
+    for host, (rate, burst) in parse_limits(RATE_LIMITS).items():
+        service = STUBBED_HOSTS.get(host)
+        if service:
+            host = urlsplit(stubs.urls[service]).netloc
+        entries.append(f'{host}={rate:g}/{burst:g}')
+    return ','.join(entries)
+
+
+def server_env(stubs: StubServices, work_dir: str) -> Dict[str, str]:
+    """Environment for the API process: every outbound URL on a stub, all state in work_dir"""
+    env = dict(os.environ)
+    env.update(stubs.env())
+    env.update({
+        'BOT_DATA_DIR': work_dir,
+        'CAPE_INDEX_PATH': os.path.join(work_dir, 'cape_index.db'),
+        'IMAGE_ID_CACHE_PATH': os.path.join(work_dir, 'image_id_cache.db'),
+        'CAPE_UPLOAD_INDEX_PATH': os.path.join(work_dir, 'cape_uploads.db'),
+        'DISCORD_TOKEN': 'bench-token',
+        'DISCORD_CLIENT_ID': 'bench-client',
+        'DISCORD_CLIENT_SECRET': 'bench-secret',
+        'DISCORD_GATEWAY_ENABLED': 'false',  # no stub for the gateway websocket
+        'ROBLOX_API_KEY': '',                 # set (empty) so ../.env can't supply real credentials
+        'RATE_LIMITS': stub_rate_limits(stubs),
+        'PYTHONUNBUFFERED': '1',
+    })
+    return env
+
+
+def start_server(kind: str, port: int, env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    if kind == 'flask':
+        command = [sys.executable, '-c', FLASK_RUNNER, str(port)]
+    else:
+        command = [sys.executable, os.path.join(HERE, 'async_server.py')]
+        env = dict(env, ASYNC_PORT=str(port))
+    with open(log_path, 'w', encoding='utf-8') as log:
+        return subprocess.Popen(command, cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_until_ready(base_url: str, process: subprocess.Popen, log_path: str):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f'API server exited with code {process.returncode} (log: {log_path})')
+            try:
+                async with session.get(base_url + '/api/bot-api/status') as response:
+                    await response.read()
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f'API server did not answer within {SERVER_START_TIMEOUT}s (log: {log_path})')
+
+
+def stop_server(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# ==================== LOAD ====================
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+async def drive_route(session: aiohttp.ClientSession, base_url: str, route: Route, samples: Samples,
+                      requests: int, concurrency: int, duration: Optional[float], warmup: int) -> dict:
+    """Hit one route with `concurrency` clients - `requests` times, or for `duration` seconds"""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+
+    async def one(n: int, record: bool = True):
+        nonlocal errors
+        path = route.path.format(**samples.values(n))
+        started = time.perf_counter()
+        try:
+            async with session.request(route.method, base_url + path, json=route.body, allow_redirects=False) as response:
+                await response.read()
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            status = None
+        if not record:
+            return
+        latencies.append(time.perf_counter() - started)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if status not in route.ok:
+            errors += 1
+
+    for n in range(warmup):
+        await one(-1 - n, record=False)
+
+    numbers = count() if duration else iter(range(requests))
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def client():
+        for n in numbers:
+            if deadline and time.perf_counter() >= deadline:
+                break
+            await one(n)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'statuses': statuses,
+        'p50_ms': _ms(percentile(latencies, 0.5)),
+        'p99_ms': _ms(percentile(latencies, 0.99)),
+        'max_ms': _ms(latencies[-1] if latencies else None),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+async def run_benchmark(base_url: str, routes: List[Route], samples: Samples, args) -> Dict[str, dict]:
+    results = {}
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        for route in routes:
+            result = await drive_route(session, base_url, route, samples, args.requests, args.concurrency,
+                                       args.duration, args.warmup)
+            results[route.name] = result
+            print(format_row(route.name, result), flush=True)
+    return results
+
+
+# ==================== REPORTING ====================
+
+HEADER = f"{'route':<22} {'reqs':>6} {'errors':>6} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'req/s':>8}"
+
+
+def format_row(name: str, result: dict) -> str:
+    def number(value):
+        return '-' if value is None else f'{value:.1f}'
+    return (f"{name:<22} {result['requests']:>6} {result['errors']:>6} {number(result['p50_ms']):>9} "
+            f"{number(result['p99_ms']):>9} {number(result['max_ms']):>9} {number(result['rps']):>8}")
+
+
+def find_regressions(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Routes whose p99 grew or throughput dropped by more than `tolerance` (a fraction) since the baseline"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not result['requests'] or before.get('p99_ms') is None:
+            continue
+        p99, old_p99 = result['p99_ms'], before['p99_ms']
+        if p99 > old_p99 * (1 + tolerance) and p99 - old_p99 > REGRESSION_FLOOR_MS:
+            regressions.append(f'{name}: p99 {old_p99:.1f}ms -> {p99:.1f}ms')
+        if before.get('rps') and result['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['rps']:.1f} -> {result['rps']:.1f} req/s")
+    return regressions
+
+
+def parse_faults(specs: List[str]) -> Dict[str, Faults]:
+    """['thumbnails:throttle_rate=0.1', 'all:latency=0.2'] -> {service: Faults}, applied in order"""
+    faults: Dict[str, Faults] = {}
+    for spec in specs:
+        service, _, settings = spec.partition(':')
+        names = list(SERVICES) if service == 'all' else [service]
+        for name in names:
+            if name not in SERVICES:
+                raise ValueError(f"Unknown service '{name}' (one of: all, {', '.join(SERVICES)})")
+            faults[name] = Faults.parse(settings, faults.get(name))
+    return faults
+
+
+def select_routes(names: Optional[str]) -> List[Route]:
+    """--routes a,b: routes whose name contains any of the given strings"""
+    if not names:
+        return list(ROUTES)
+    wanted = [name.strip() for name in names.split(',') if name.strip()]
+    return [route for route in ROUTES if any(name in route.name for name in wanted)]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark every API route against local stub services')
+    parser.add_argument('--server', choices=('async', 'flask'), default='async',
+                        help='async_server.py (default) or api.py on a threaded Flask server')
+    parser.add_argument('--routes', help='comma-separated route names (substring match); default: all')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route (default 200)')
+    parser.add_argument('--duration', type=float, help='seconds per route instead of a request count')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent clients (default 16)')
+    parser.add_argument('--warmup', type=int, default=3, help='unmeasured requests per route first (default 3)')
+    parser.add_argument('--timeout', type=float, default=60, help='per-request timeout in seconds')
+    parser.add_argument('--faults', action='append', default=[], metavar='SERVICE:K=V,...',
+                        help="stub faults, e.g. thumbnails:throttle_rate=0.1,retry_after=2 or all:latency=0.2 "
+                             "(settings: latency, jitter, error_rate, throttle_rate, retry_after, pending_rate)")
+    parser.add_argument('--capes', type=int, default=5000, help='capes in the synthetic data (default 5000)')
+    parser.add_argument('--users', type=int, default=1000, help='users in the synthetic data (default 1000)')
+    parser.add_argument('--save', metavar='FILE', help='write the results as JSON')
+    parser.add_argument('--baseline', metavar='FILE', help='compare against a --save file from an earlier run')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='allowed p99 growth / throughput drop vs the baseline (default 0.25 = 25%%)')
+    parser.add_argument('--keep', action='store_true', help='keep the work directory (data files, server log)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        faults = parse_faults(args.faults)
+    except ValueError as e:
+        print(f'[BENCH] ❌ {e}')
+        return 2
+    routes = select_routes(args.routes)
+    if not routes:
+        print(f'[BENCH] ❌ No route matches {args.routes!r}')
+        return 2
+
+    work_dir = tempfile.mkdtemp(prefix='capes-bench-')
+    data = write_data_dir(work_dir, args.capes, args.users)
+    stubs = StubServices(faults).start()
+    port = free_port()
+    log_path = os.path.join(work_dir, 'server.log')
+    process = start_server(args.server, port, server_env(stubs, work_dir), log_path)
+    base_url = f'http://127.0.0.1:{port}'
+    print(f'[BENCH] {args.server} server on {base_url}, {args.capes} capes / {args.users} users, '
+          f'{args.concurrency} clients, ' + (f'{args.duration:g}s' if args.duration else f'{args.requests} requests')
+          + ' per route')
+    for name, reason in NOT_DRIVEN.items():
+        print(f'[BENCH] ⏭️  Skipping {name}: {reason}')
+
+    try:
+        asyncio.run(wait_until_ready(base_url, process, log_path))
+        print(HEADER)
+        results = asyncio.run(run_benchmark(base_url, routes, Samples(data), args))
+    except RuntimeError as e:
+        print(f'[BENCH] ❌ {e}')
+        args.keep = True
+        return 1
+    finally:
+        stop_server(process)
+        stubs.stop()
+        if args.keep:
+            print(f'[BENCH] Work directory kept: {work_dir}')
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    failed = {name: result for name, result in results.items() if result['errors']}
+    for name, result in failed.items():
+        print(f"[BENCH] ⚠️ {name}: {result['errors']} unexpected responses {result['statuses']}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'server': args.server,
+                'concurrency': args.concurrency,
+                'requests': args.requests,
+                'duration': args.duration,
+                'faults': {name: vars(setting) for name, setting in faults.items()},
+                'finished_at': datetime.now().isoformat(),
+                'routes': results,
+            }, f, indent=2)
+        print(f'[BENCH] ✅ Results saved to {args.save}')
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('server') != args.server or baseline.get('concurrency') != args.concurrency:
+            print(f"[BENCH] ⚠️ Baseline ran {baseline.get('server')} with {baseline.get('concurrency')} clients - "
+                  f"numbers may not be comparable")
+        regressions = find_regressions(results, baseline.get('routes', {}), args.max_regression)
+        if regressions:
+            print(f'[BENCH] ❌ {len(regressions)} regression(s) vs {args.baseline}:')
+            for regression in regressions:
+                print(f'   {regression}')
+            return 1
+        print(f'[BENCH] ✅ No regressions vs {args.baseline} (tolerance {args.max_regression:.0%})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Bulk Cape Uploads
+Runs the uploads of a multi-file request on one event loop, with at most
+BULK_UPLOAD_CONCURRENCY of them in flight, and hands back each file's
+result as soon as it finishes (streamed to the client as NDJSON lines).
+"""
+import asyncio
+import json
+import os
+import queue
+import threading
+from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable, Iterable, Iterator, List, Tuple, Union
+
+from cape_ingest import UploadRejected, spool_upload
+
+BULK_UPLOAD_CONCURRENCY = int(os.getenv('BULK_UPLOAD_CONCURRENCY', '4'))  # Roblox uploads at once
+BULK_UPLOAD_MAX_FILES = int(os.getenv('BULK_UPLOAD_MAX_FILES', '50'))      # files per request
+
+# (filename, spooled file - or the UploadRejected it failed with)
+BulkItem = Tuple[str, Union[BinaryIO, UploadRejected]]
+_DONE = object()
+
+
+def ndjson_line(payload: Any) -> bytes:
+    return (json.dumps(payload) + '\n').encode()
+
+
+def spool_files(files: Iterable[Tuple[str, BinaryIO]]) -> List[BulkItem]:
+    """Spool each (filename, stream); a rejected file becomes its error, not a failed request"""
+    items = []
+    for filename, stream in files:
+        try:
+            items.append((filename, spool_upload(stream)))
+        except UploadRejected as e:
+            items.append((filename, e))
+    return items
+
+
+def close_items(items: List[BulkItem]):
+    for _, source in items:
+        if not isinstance(source, UploadRejected):
+            source.close()
+
+
+async def upload_all(items: List[BulkItem], upload_item: Callable[[BinaryIO], Awaitable[dict]],
+                     concurrency: int = BULK_UPLOAD_CONCURRENCY) -> AsyncIterator[dict]:
+    """
+    Run upload_item(spool) for every item, at most `concurrency` at once
+
+    Yields:
+        {'index', 'filename', **upload_item result} in completion order;
+        failures are {'success': False, 'error', 'status'} rows
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(index: int, filename: str, source) -> dict:
+        row = {'index': index, 'filename': filename}
+        try:
+            if isinstance(source, UploadRejected):
+                raise source
+            async with semaphore:
+                return {**row, **await upload_item(source)}
+        except UploadRejected as e:
+            return {**row, 'success': False, 'error': str(e), 'status': e.status}
+        except Exception as e:
+            print(f"[BULK] ❌ Upload of {filename or f'file {index}'} failed: {e}")
+            return {**row, 'success': False, 'error': f'Upload failed: {e}', 'status': 500}
+        finally:
+            if not isinstance(source, UploadRejected):
+                source.close()
+
+    tasks = [asyncio.ensure_future(run(index, filename, source)) for index, (filename, source) in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Client went away mid-stream - stop the uploads that haven't finished
+        for task in tasks:
+            task.cancel()
+        close_items(items)  # Spools of tasks cancelled before they started
+
+
+def upload_all_sync(items: List[BulkItem], upload_item: Callable[[BinaryIO], Awaitable[dict]],
+                    concurrency: int = BULK_UPLOAD_CONCURRENCY) -> Iterator[dict]:
+    """upload_all() for a WSGI worker: the event loop runs on its own thread, results come back in order of completion"""
+    results: queue.Queue = queue.Queue()
+    stop = threading.Event()
+
+    async def drive():
+        async for result in upload_all(items, upload_item, concurrency):
+            results.put(result)
+            if stop.is_set():
+                break
+
+    def run():
+        try:
+            asyncio.run(drive())
+        except Exception as e:
+            print(f"[BULK] ❌ Bulk upload loop failed: {e}")
+        finally:
+            results.put(_DONE)
+
+    thread = threading.Thread(target=run, name='bulk-upload', daemon=True)
+    thread.start()
+    try:
+        while True:
+            result = results.get()
+            if result is _DONE:
+                break
+            yield result
+    finally:
+        stop.set()
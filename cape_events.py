@@ -0,0 +1,84 @@
+"""
+Cape Status Push Hub
+Subscribers to an asset ID share ONE server-side resolution; every
+subscriber's future completes with the same status payload once it is
+final (resolved, or errored) or the hub gives up on the asset. While the
+asset is still processing, the hub re-resolves on a doubling interval -
+waiting between rounds on a timer, not a worker.
+Feeds the Server-Sent Events endpoint that replaces client polling.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict
+
+STATUS_HUB_WORKERS = int(os.getenv('STATUS_HUB_WORKERS', '4'))
+STATUS_HUB_TIMEOUT = float(os.getenv('STATUS_HUB_TIMEOUT', '600'))  # send 'processing' after this long
+STATUS_HUB_RETRY_SECONDS = float(os.getenv('STATUS_HUB_RETRY_SECONDS', '5'))  # first wait between rounds
+STATUS_HUB_MAX_RETRY_SECONDS = 60.0
+
+
+def is_final(payload: dict) -> bool:
+    """Anything but 'processing' ends the wait"""
+    return payload.get('status') != 'processing'
+
+
+class StatusHub:
+    """Fans one resolution per asset ID out to every subscriber"""
+
+    def __init__(self, resolve: Callable[[str], dict], max_workers: int = STATUS_HUB_WORKERS,
+                 timeout: float = STATUS_HUB_TIMEOUT):
+        self.resolve = resolve
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='status-hub')
+        self._pending: Dict[str, Future] = {}
+        self._subscribers: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, asset_id: str) -> Future:
+        """Future that completes with the asset's status payload"""
+        asset_id = str(asset_id)
+        with self._lock:
+            self._subscribers[asset_id] = self._subscribers.get(asset_id, 0) + 1
+            future = self._pending.get(asset_id)
+            if future is None:
+                future = self._pending[asset_id] = Future()
+                deadline = time.monotonic() + self.timeout
+                self._executor.submit(self._run, asset_id, future, deadline, STATUS_HUB_RETRY_SECONDS)
+        return future
+
+    def unsubscribe(self, asset_id: str):
+        asset_id = str(asset_id)
+        with self._lock:
+            count = self._subscribers.get(asset_id, 0) - 1
+            if count > 0:
+                self._subscribers[asset_id] = count
+            else:
+                self._subscribers.pop(asset_id, None)
+
+    def _run(self, asset_id: str, future: Future, deadline: float, delay: float):
+        try:
+            payload = self.resolve(asset_id)
+        except Exception as e:
+            print(f"[EVENTS] ❌ Status resolution failed for asset {asset_id}: {e}")
+            payload = {'asset_id': asset_id, 'image_id': None, 'status': 'error', 'error': str(e)}
+        with self._lock:
+            listening = self._subscribers.get(asset_id, 0) > 0
+            retry = listening and not is_final(payload) and time.monotonic() + delay < deadline
+            if not retry:
+                self._pending.pop(asset_id, None)
+        if retry:
+            next_delay = min(delay * 2, STATUS_HUB_MAX_RETRY_SECONDS)
+            timer = threading.Timer(delay, self._executor.submit, (self._run, asset_id, future, deadline, next_delay))
+            timer.daemon = True
+            timer.start()
+            return
+        future.set_result(payload)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'assets_resolving': len(self._pending),
+                'subscribers': sum(self._subscribers.values()),
+            }
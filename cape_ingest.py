@@ -0,0 +1,201 @@
+"""
+Cape Upload Ingestion
+Streams an uploaded cape image into a spooled temp file (in memory up to
+a threshold, on disk past it) with a hard size cap, then normalizes it
+before it goes to Roblox: EXIF rotation applied, downscaled to the decal
+size, metadata stripped and recompressed - or passed through untouched
+when it is already a clean PNG/JPEG of a usable size.
+"""
+import io
+import os
+import tempfile
+from typing import BinaryIO, Tuple
+
+from PIL import Image, ImageOps
+
+CAPE_UPLOAD_MAX_BYTES = int(os.getenv('CAPE_UPLOAD_MAX_BYTES', str(20 * 1024 * 1024)))   # per image
+CAPE_UPLOAD_REQUEST_MAX_BYTES = CAPE_UPLOAD_MAX_BYTES + 64 * 1024  # one image plus the multipart framing
+CAPE_UPLOAD_SPOOL_BYTES = int(os.getenv('CAPE_UPLOAD_SPOOL_BYTES', str(1024 * 1024)))    # RAM before spilling
+CAPE_DECAL_MAX_SIZE = int(os.getenv('CAPE_DECAL_MAX_SIZE', '1024'))  # Roblox downscales larger decals anyway
+CAPE_JPEG_QUALITY = int(os.getenv('CAPE_JPEG_QUALITY', '90'))   # when a JPEG upload has to be re-encoded
+CHUNK_SIZE = 64 * 1024
+
+# Uploads already in one of these (and clean, small enough) go to Roblox untouched
+PASSTHROUGH_FORMATS = ('PNG', 'JPEG')
+PASSTHROUGH_MODES = ('RGB', 'RGBA', 'L', 'LA', 'P')
+METADATA_KEYS = ('exif', 'icc_profile', 'xmp', 'XML:com.adobe.xmp', 'comment', 'photoshop')
+
+
+class UploadRejected(ValueError):
+    """The upload can't be used - status is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def new_spool() -> tempfile.SpooledTemporaryFile:
+    return tempfile.SpooledTemporaryFile(max_size=CAPE_UPLOAD_SPOOL_BYTES, mode='w+b')
+
+
+def too_large(max_bytes: int = CAPE_UPLOAD_MAX_BYTES) -> UploadRejected:
+    return UploadRejected(f'Image too large (max {max_bytes // (1024 * 1024)} MB)', status=413)
+
+
+def _check_size(size: int, max_bytes: int):
+    if size > max_bytes:
+        raise too_large(max_bytes)
+
+
+def spool_upload(stream: BinaryIO, max_bytes: int = CAPE_UPLOAD_MAX_BYTES) -> tempfile.SpooledTemporaryFile:
+    """Copy an upload stream into a spooled temp file in chunks, enforcing the size cap"""
+    spool = new_spool()
+    size = 0
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            _check_size(size, max_bytes)
+            spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    if size == 0:
+        spool.close()
+        raise UploadRejected('Empty file')
+    spool.seek(0)
+    return spool
+
+
+async def spool_upload_async(part, max_bytes: int = CAPE_UPLOAD_MAX_BYTES) -> tempfile.SpooledTemporaryFile:
+    """spool_upload() for an aiohttp multipart BodyPartReader"""
+    spool = new_spool()
+    size = 0
+    try:
+        while True:
+            chunk = await part.read_chunk(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            _check_size(size, max_bytes)
+            spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    if size == 0:
+        spool.close()
+        raise UploadRejected('Empty file')
+    spool.seek(0)
+    return spool
+
+
+def _has_metadata(image: Image.Image) -> bool:
+    """Anything worth stripping: EXIF, ICC profile, XMP, PNG text chunks, JPEG comments/APP segments"""
+    if any(key in image.info for key in METADATA_KEYS):
+        return True
+    if getattr(image, 'text', None):
+        return True
+    # APP0 (JFIF) and APP14 (Adobe color transform) describe the encoding, not the picture
+    return any(marker not in ('APP0', 'APP14') for marker, _ in getattr(image, 'applist', []))
+
+
+def _encode(image: Image.Image, image_format: str) -> bytes:
+    output = io.BytesIO()
+    if image_format == 'JPEG':
+        image.save(output, format='JPEG', quality=CAPE_JPEG_QUALITY, optimize=True)
+    else:
+        image.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+def normalize_cape_image(source: BinaryIO, max_size: int = CAPE_DECAL_MAX_SIZE) -> Tuple[bytes, dict]:
+    """
+    Decode, orient, downscale, strip and recompress an uploaded image
+
+    A PNG or JPEG that is already small enough and carries no metadata is
+    passed through byte for byte. Anything else is re-encoded as PNG - or
+    as JPEG when it was a JPEG and that comes out smaller, so photos don't
+    balloon.
+
+    Returns:
+        (image bytes, {original_bytes, normalized_bytes, width, height, resized, format, reencoded})
+    """
+    source.seek(0, os.SEEK_END)
+    original_bytes = source.tell()
+    source.seek(0)
+    try:
+        with Image.open(source) as opened:
+            source_format = opened.format
+            passthrough = (source_format in PASSTHROUGH_FORMATS and opened.mode in PASSTHROUGH_MODES
+                           and max(opened.size) <= max_size and not _has_metadata(opened))
+            image = ImageOps.exif_transpose(opened)
+            image.load()
+    except Image.DecompressionBombError:
+        raise UploadRejected('Image dimensions too large', status=413)
+    except Exception:
+        raise UploadRejected('File is not a valid image')
+
+    if passthrough:
+        source.seek(0)
+        data = source.read()
+        return data, {
+            'original_bytes': original_bytes,
+            'normalized_bytes': len(data),
+            'width': image.width,
+            'height': image.height,
+            'resized': False,
+            'format': source_format.lower(),
+            'reencoded': False,
+        }
+
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    if has_alpha and image.getchannel('A').getextrema() == (255, 255):
+        image = image.convert('RGB')  # alpha channel carries nothing
+
+    resized = max(image.size) > max_size
+    if resized:
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+
+    # Fresh image: no EXIF, ICC profile, text chunks or other metadata survive
+    clean = Image.new(image.mode, image.size)
+    clean.paste(image)
+    image_format, data = 'PNG', _encode(clean, 'PNG')
+    if source_format == 'JPEG' and clean.mode == 'RGB':
+        jpeg = _encode(clean, 'JPEG')
+        if len(jpeg) < len(data):
+            image_format, data = 'JPEG', jpeg
+    return data, {
+        'original_bytes': original_bytes,
+        'normalized_bytes': len(data),
+        'width': clean.width,
+        'height': clean.height,
+        'resized': resized,
+        'format': image_format.lower(),
+        'reencoded': True,
+    }
+
+
+def _seekable(stream: BinaryIO) -> bool:
+    try:
+        return bool(stream.seekable())
+    except (AttributeError, ValueError):
+        return False
+
+
+def ingest_upload(stream: BinaryIO) -> Tuple[bytes, dict]:
+    """
+    Spool + normalize - the whole ingestion pipeline for one uploaded file
+    A stream that is already seekable (werkzeug has spooled the multipart file) is normalized in place
+    """
+    if _seekable(stream):
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        _check_size(size, CAPE_UPLOAD_MAX_BYTES)
+        if size == 0:
+            raise UploadRejected('Empty file')
+        return normalize_cape_image(stream)
+    with spool_upload(stream) as spool:
+        return normalize_cape_image(spool)
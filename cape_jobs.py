@@ -0,0 +1,168 @@
+"""
+Background Image ID Resolution Jobs
+Runs the slow Thumbnails API lookups on a bounded worker pool
+so /api/upload-cape can return as soon as the decal is uploaded
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+# Pool sizing (override in .env)
+RESOLVER_WORKERS = int(os.getenv('IMAGE_ID_RESOLVER_WORKERS', '4'))
+RESOLVER_MAX_PENDING = int(os.getenv('IMAGE_ID_RESOLVER_MAX_PENDING', '64'))
+JOB_TTL_SECONDS = int(os.getenv('IMAGE_ID_JOB_TTL', '3600'))
+
+
+class ResolutionJobs:
+    """Bounded pool of image ID resolution jobs, tracked by job ID"""
+
+    def __init__(self, resolver: Callable[[str], Optional[str]], max_workers: int = RESOLVER_WORKERS,
+                 max_pending: int = RESOLVER_MAX_PENDING, ttl: int = JOB_TTL_SECONDS,
+                 group_resolver: Optional[Callable[[List[str], Callable[[str, Optional[str]], None]], None]] = None):
+        self.resolver = resolver
+        # group_resolver(asset_ids, on_result) resolves several assets in one go, calling
+        # on_result(asset_id, image_id) as each one is found (see submit_many)
+        self.group_resolver = group_resolver
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-id')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._jobs: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, asset_id: str) -> dict:
+        """
+        Queue image ID resolution for an uploaded asset
+
+        Returns:
+            Snapshot of the job. Status is 'rejected' when the queue is full,
+            in which case the client should fall back to /api/cape-status.
+        """
+        job = self._new_job(asset_id)
+        return self._enqueue([job], lambda: self._run(job))[0]
+
+    def submit_many(self, asset_ids: List[str]) -> Dict[str, dict]:
+        """
+        Queue resolution for several uploads as ONE pool task, so every retry
+        is a single multi-ID lookup instead of one per asset
+
+        Returns:
+            {asset_id: job snapshot} - still one job per asset for polling
+        """
+        asset_ids = list(dict.fromkeys(str(asset_id) for asset_id in asset_ids))
+        if not asset_ids:
+            return {}
+        if self.group_resolver is None:
+            return {asset_id: self.submit(asset_id) for asset_id in asset_ids}
+        jobs = [self._new_job(asset_id) for asset_id in asset_ids]
+        return {job['asset_id']: job for job in self._enqueue(jobs, lambda: self._run_group(jobs))}
+
+    @staticmethod
+    def _new_job(asset_id: str) -> dict:
+        return {
+            'job_id': uuid.uuid4().hex,
+            'asset_id': str(asset_id),
+            'image_id': None,
+            'status': 'queued',
+            'error': None,
+            'created_at': datetime.now().isoformat(),
+            'finished_at': None,
+        }
+
+    def _enqueue(self, jobs: List[dict], task: Callable[[], None]) -> List[dict]:
+        """Run jobs as one pool task (one pending slot), or reject them all if the queue is full"""
+        self._prune()
+
+        if not self._slots.acquire(blocking=False):
+            for job in jobs:
+                job['status'] = 'rejected'
+                job['error'] = 'Resolver queue is full'
+            asset_ids = ', '.join(job['asset_id'] for job in jobs)
+            print(f"[JOBS] ⚠️ Queue full, not resolving asset {asset_ids} in background")
+            return jobs
+
+        with self._lock:
+            for job in jobs:
+                self._jobs[job['job_id']] = job
+        try:
+            self._executor.submit(task)
+        except RuntimeError as e:
+            self._slots.release()
+            for job in jobs:
+                self._finish(job, 'failed', error=str(e))
+        return [self.get(job['job_id']) for job in jobs]
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Get a copy of a job's current state"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+            return {key: value for key, value in job.items() if not key.startswith('_')}
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job: dict):
+        try:
+            with self._lock:
+                job['status'] = 'resolving'
+            image_id = self.resolver(job['asset_id'])
+            if image_id:
+                print(f"[JOBS] ✅ Resolved image ID {image_id} for asset {job['asset_id']}")
+                self._finish(job, 'completed', image_id=str(image_id))
+            else:
+                self._finish(job, 'processing')
+        except Exception as e:
+            print(f"[JOBS] ❌ Resolution error for asset {job['asset_id']}: {e}")
+            self._finish(job, 'failed', error=str(e))
+        finally:
+            self._slots.release()
+
+    def _run_group(self, jobs: List[dict]):
+        by_asset = {job['asset_id']: job for job in jobs}
+
+        def on_result(asset_id: str, image_id: Optional[str]):
+            job = by_asset.get(str(asset_id))
+            if job is None or job['finished_at'] is not None:
+                return
+            if image_id:
+                print(f"[JOBS] ✅ Resolved image ID {image_id} for asset {asset_id}")
+                self._finish(job, 'completed', image_id=str(image_id))
+            else:
+                self._finish(job, 'processing')
+
+        try:
+            with self._lock:
+                for job in jobs:
+                    job['status'] = 'resolving'
+            self.group_resolver(list(by_asset), on_result)
+            for asset_id in by_asset:
+                on_result(asset_id, None)  # Whatever the group resolver didn't report is still processing
+        except Exception as e:
+            print(f"[JOBS] ❌ Resolution error for assets {', '.join(by_asset)}: {e}")
+            for job in jobs:
+                if job['finished_at'] is None:
+                    self._finish(job, 'failed', error=str(e))
+        finally:
+            self._slots.release()
+
+    def _finish(self, job: dict, status: str, image_id: Optional[str] = None, error: Optional[str] = None):
+        with self._lock:
+            job['status'] = status
+            job['image_id'] = image_id
+            job['error'] = error
+            job['finished_at'] = datetime.now().isoformat()
+            job['_finished'] = time.monotonic()
+
+    def _prune(self):
+        """Drop finished jobs older than the TTL"""
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.get('_finished') is not None and job['_finished'] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
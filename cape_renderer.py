@@ -0,0 +1,399 @@
+"""
+Server-Side Cape Renderer
+Renders the cape builder's layer description (the same JSON the browser
+builders keep in `layers`) to a 400x400 image with vectorized NumPy, so
+the API and the bot can produce previews and upload-ready capes without
+a browser. Mirrors renderLayer() in cape-builder.js / enhanced_cape_builder.js:
+background, gradient (horizontal / vertical / diagonal / radial), shape
+(rectangle, circle, triangle, star, polygon with rotation), pattern
+(stripes), text and data-URL images, with layer opacity and blend modes.
+"""
+import base64
+import io
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+CANVAS_SIZE = 400  # same as the builders' canvas
+SHAPE_SUPERSAMPLE = int(os.getenv('CAPE_RENDER_SUPERSAMPLE', '4'))  # anti-aliasing samples per axis
+RENDER_WORKERS = int(os.getenv('CAPE_RENDER_WORKERS', '4'))
+MAX_IMAGE_LAYER_SIZE = CANVAS_SIZE * 4          # largest scaled image layer side (pixels)
+MAX_IMAGE_SOURCE_PIXELS = 4096 * 4096           # largest decoded image layer source
+
+NAMED_COLORS = {
+    'white': '#ffffff', 'black': '#000000', 'red': '#ff0000', 'green': '#008000', 'blue': '#0000ff',
+    'cyan': '#00ffff', 'magenta': '#ff00ff', 'yellow': '#ffff00', 'transparent': 'rgba(0,0,0,0)',
+}
+
+
+class RenderError(ValueError):
+    """The cape description can't be rendered"""
+
+
+def parse_color(value, default: str = '#000000') -> Tuple[np.ndarray, float]:
+    """CSS color (#rgb, #rrggbb, #rrggbbaa, rgb(), rgba(), a few names) -> (RGB floats 0-1, alpha)"""
+    text = str(value or default).strip().lower()
+    text = NAMED_COLORS.get(text, text)
+    if text.startswith('#'):
+        digits = text[1:]
+        if len(digits) in (3, 4):
+            digits = ''.join(ch * 2 for ch in digits)
+        if len(digits) in (6, 8) and re.fullmatch(r'[0-9a-f]+', digits):
+            channels = [int(digits[i:i + 2], 16) / 255 for i in range(0, len(digits), 2)]
+            return np.array(channels[:3], dtype=np.float32), channels[3] if len(channels) == 4 else 1.0
+    match = re.fullmatch(r'rgba?\(([^)]*)\)', text)
+    if match:
+        parts = [part.strip() for part in match.group(1).split(',')]
+        if len(parts) in (3, 4):
+            try:
+                rgb = [min(255.0, max(0.0, float(part))) / 255 for part in parts[:3]]
+                alpha = min(1.0, max(0.0, float(parts[3]))) if len(parts) == 4 else 1.0
+                return np.array(rgb, dtype=np.float32), alpha
+            except ValueError:
+                pass
+    # Like fillStyle, an unparseable color is ignored in favour of the default
+    if text != default:
+        return parse_color(default, default)
+    raise RenderError(f'Invalid color: {value}')
+
+
+def _number(properties: dict, key: str, default: float) -> float:
+    """Builder semantics: missing, empty or 0 falls back to the default (JS `value || default`)"""
+    try:
+        value = float(properties.get(key) or 0)
+    except (TypeError, ValueError):
+        return default
+    return value or default
+
+
+class CapeCanvas:
+    """Float RGB canvas with source-over (and a few blend mode) compositing"""
+
+    def __init__(self, width: int = CANVAS_SIZE, height: int = CANVAS_SIZE):
+        self.width = width
+        self.height = height
+        # The builders clear to opaque white before drawing layers
+        self.pixels = np.ones((height, width, 3), dtype=np.float32)
+        # Pixel-centre coordinates, shared by every gradient/shape
+        self.ys, self.xs = np.mgrid[0:height, 0:width].astype(np.float32) + 0.5
+
+    def composite(self, color: np.ndarray, coverage, alpha: float, blend: str = 'source-over',
+                  region: Tuple[slice, slice] = (slice(None), slice(None))):
+        """
+        Draw `color` (H x W x 3 or one RGB) with per-pixel `coverage` (0-1) and
+        layer alpha into `region` of the canvas
+        """
+        dest = self.pixels[region]
+        weight = np.asarray(coverage, dtype=np.float32) * alpha
+        if np.ndim(weight) == 2:
+            weight = weight[..., None]
+        source = np.broadcast_to(color, dest.shape)
+        if blend == 'multiply':
+            source = dest * source
+        elif blend == 'screen':
+            source = 1 - (1 - dest) * (1 - source)
+        elif blend == 'lighten':
+            source = np.maximum(dest, source)
+        elif blend == 'darken':
+            source = np.minimum(dest, source)
+        elif blend == 'overlay':
+            source = np.where(dest <= 0.5, 2 * dest * source, 1 - 2 * (1 - dest) * (1 - source))
+        self.pixels[region] = dest + (source - dest) * weight
+
+    def to_image(self) -> Image.Image:
+        return Image.fromarray(np.clip(self.pixels * 255 + 0.5, 0, 255).astype(np.uint8), 'RGB')
+
+
+# ==================== GEOMETRY ====================
+
+def _clip_box(canvas: CapeCanvas, left: float, top: float, right: float, bottom: float):
+    """Integer pixel box covering [left, right) x [top, bottom), clipped to the canvas"""
+    x0, y0 = max(0, int(math.floor(left))), max(0, int(math.floor(top)))
+    x1, y1 = min(canvas.width, int(math.ceil(right))), min(canvas.height, int(math.ceil(bottom)))
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1, y1
+
+
+def _sample_grid(box, samples: int):
+    """Sub-pixel sample coordinates for a pixel box: arrays of shape (h * samples, w * samples)"""
+    x0, y0, x1, y1 = box
+    offsets = (np.arange(samples, dtype=np.float32) + 0.5) / samples
+    xs = (np.arange(x0, x1, dtype=np.float32)[:, None] + offsets[None, :]).reshape(-1)
+    ys = (np.arange(y0, y1, dtype=np.float32)[:, None] + offsets[None, :]).reshape(-1)
+    return np.meshgrid(xs, ys)
+
+
+def _downsample(mask: np.ndarray, samples: int) -> np.ndarray:
+    """Average samples x samples blocks -> fractional pixel coverage"""
+    h, w = mask.shape[0] // samples, mask.shape[1] // samples
+    return mask.reshape(h, samples, w, samples).mean(axis=(1, 3), dtype=np.float32)
+
+
+def polygon_coverage(canvas: CapeCanvas, points: List[Tuple[float, float]], samples: int = SHAPE_SUPERSAMPLE):
+    """
+    Anti-aliased coverage of a polygon (even-odd rule, like canvas fill())
+    Returns (coverage, region) limited to the polygon's bounding box, or None
+    """
+    xs_pts = [p[0] for p in points]
+    ys_pts = [p[1] for p in points]
+    box = _clip_box(canvas, min(xs_pts), min(ys_pts), max(xs_pts), max(ys_pts))
+    if box is None:
+        return None
+    px, py = _sample_grid(box, samples)
+    inside = np.zeros(px.shape, dtype=bool)
+    count = len(points)
+    for i in range(count):
+        (xa, ya), (xb, yb) = points[i], points[(i + 1) % count]
+        if ya == yb:
+            continue
+        crosses = (ya > py) != (yb > py)
+        x_at = xa + (py - ya) * (xb - xa) / (yb - ya)
+        inside ^= crosses & (px < x_at)
+    x0, y0, x1, y1 = box
+    return _downsample(inside, samples), (slice(y0, y1), slice(x0, x1))
+
+
+def ellipse_coverage(canvas: CapeCanvas, cx: float, cy: float, radius: float, samples: int = SHAPE_SUPERSAMPLE):
+    box = _clip_box(canvas, cx - radius, cy - radius, cx + radius, cy + radius)
+    if box is None or radius <= 0:
+        return None
+    px, py = _sample_grid(box, samples)
+    inside = (px - cx) ** 2 + (py - cy) ** 2 <= radius * radius
+    x0, y0, x1, y1 = box
+    return _downsample(inside, samples), (slice(y0, y1), slice(x0, x1))
+
+
+def _transform(points, cx: float, cy: float, rotation_deg: float):
+    """Rotate shape-local points about the shape centre (ctx.translate + ctx.rotate)"""
+    angle = math.radians(rotation_deg or 0)
+    cos_a, sin_a = math.cos(angle), math.sin(angle)
+    return [(cx + x * cos_a - y * sin_a, cy + x * sin_a + y * cos_a) for x, y in points]
+
+
+def shape_points(shape: str, width: float, height: float, sides: int = 6) -> Optional[List[Tuple[float, float]]]:
+    """Outline of a builder shape around (0, 0), as drawShape() traces it"""
+    if shape == 'rectangle':
+        return [(-width / 2, -height / 2), (width / 2, -height / 2), (width / 2, height / 2), (-width / 2, height / 2)]
+    if shape == 'triangle':
+        return [(0, -height / 2), (-width / 2, height / 2), (width / 2, height / 2)]
+    if shape == 'star':
+        outer = min(width, height) / 2
+        return [
+            (math.cos(i * math.pi / 5 - math.pi / 2) * (outer if i % 2 == 0 else outer / 2),
+             math.sin(i * math.pi / 5 - math.pi / 2) * (outer if i % 2 == 0 else outer / 2))
+            for i in range(10)
+        ]
+    if shape == 'polygon':
+        radius = min(width, height) / 2
+        sides = max(3, int(sides or 6))
+        return [
+            (math.cos(i * 2 * math.pi / sides - math.pi / 2) * radius,
+             math.sin(i * 2 * math.pi / sides - math.pi / 2) * radius)
+            for i in range(sides)
+        ]
+    return None
+
+
+# ==================== LAYERS ====================
+
+def render_background(canvas: CapeCanvas, properties: dict, alpha: float, blend: str):
+    color, color_alpha = parse_color(properties.get('color'), '#ffffff')
+    canvas.composite(color, 1.0, alpha * color_alpha, blend)
+
+
+def gradient_ramp(t: np.ndarray, colors: List[str]) -> np.ndarray:
+    """Colors evenly spaced from t=0 to t=1 (addColorStop(i / (n - 1), color)) -> H x W x 3"""
+    parsed = [parse_color(color) for color in colors] or [parse_color('#00ced1'), parse_color('#c71585')]
+    if len(parsed) == 1:
+        parsed = parsed * 2
+    stops = np.linspace(0.0, 1.0, len(parsed), dtype=np.float32)
+    rgb = np.stack([color for color, _ in parsed])
+    return np.stack([np.interp(t, stops, rgb[:, channel]) for channel in range(3)], axis=-1).astype(np.float32)
+
+
+def render_gradient(canvas: CapeCanvas, properties: dict, alpha: float, blend: str):
+    x = float(properties.get('x') or 0)
+    y = float(properties.get('y') or 0)
+    width = _number(properties, 'width', canvas.width)
+    height = _number(properties, 'height', canvas.height)
+    box = _clip_box(canvas, x, y, x + width, y + height)
+    if box is None:
+        return
+    x0, y0, x1, y1 = box
+    region = (slice(y0, y1), slice(x0, x1))
+    px, py = canvas.xs[region], canvas.ys[region]
+
+    direction = properties.get('direction') or 'diagonal'
+    if direction == 'radial':
+        radius = max(width, height) / 2
+        t = np.hypot(px - (x + width / 2), py - (y + height / 2)) / radius
+    else:
+        if direction == 'horizontal':
+            dx, dy = width, 0.0
+        elif direction == 'vertical':
+            dx, dy = 0.0, height
+        else:
+            dx, dy = width, height
+        t = ((px - x) * dx + (py - y) * dy) / (dx * dx + dy * dy)
+    t = np.clip(t, 0.0, 1.0)
+    canvas.composite(gradient_ramp(t, properties.get('colors') or []), 1.0, alpha, blend, region)
+
+
+def render_shape(canvas: CapeCanvas, properties: dict, alpha: float, blend: str):
+    shape = properties.get('shape') or 'rectangle'
+    x, y = _number(properties, 'x', 50), _number(properties, 'y', 50)
+    width, height = _number(properties, 'width', 100), _number(properties, 'height', 100)
+    cx, cy = x + width / 2, y + height / 2
+    color, color_alpha = parse_color(properties.get('color'), '#00ffff')
+
+    if shape == 'circle':
+        result = ellipse_coverage(canvas, cx, cy, min(width, height) / 2)
+    else:
+        points = shape_points(shape, width, height, properties.get('sides') or 6)
+        if points is None:
+            raise RenderError(f'Unknown shape: {shape}')
+        result = polygon_coverage(canvas, _transform(points, cx, cy, properties.get('rotation') or 0))
+    if result is not None:
+        coverage, region = result
+        canvas.composite(color, coverage, alpha * color_alpha, blend, region)
+
+
+def render_pattern(canvas: CapeCanvas, properties: dict, alpha: float, blend: str):
+    color1, alpha1 = parse_color(properties.get('color1'), '#ffffff')
+    color2, alpha2 = parse_color(properties.get('color2'), '#000000')
+    canvas.composite(color1, 1.0, alpha * alpha1, blend)
+    if (properties.get('pattern') or 'stripes') == 'stripes':
+        stripe = max(1, int(_number(properties, 'size', 10)))
+        columns = (np.arange(canvas.width) % (stripe * 2)) < stripe
+        coverage = np.broadcast_to(columns[None, :].astype(np.float32), (canvas.height, canvas.width))
+        canvas.composite(color2, coverage, alpha * alpha2, blend)
+
+
+def _font(properties: dict):
+    size = int(_number(properties, 'fontSize', 24))
+    family = str(properties.get('fontFamily') or 'Arial')
+    for name in (family, family.lower(), f'{family}.ttf', f'{family.lower()}.ttf', 'DejaVuSans.ttf'):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:  # Pillow < 10.1 has a single fixed-size default font
+        return ImageFont.load_default()
+
+
+def render_text(canvas: CapeCanvas, properties: dict, alpha: float, blend: str):
+    color, color_alpha = parse_color(properties.get('color'), '#000000')
+    mask = Image.new('L', (canvas.width, canvas.height), 0)
+    anchor = {'center': 'mt', 'right': 'rt'}.get(properties.get('align'), 'lt')  # textBaseline = 'top'
+    ImageDraw.Draw(mask).text(
+        (_number(properties, 'x', 50), _number(properties, 'y', 50)),
+        str(properties.get('text') or 'Sample Text'), fill=255, font=_font(properties), anchor=anchor,
+    )
+    coverage = np.asarray(mask, dtype=np.float32) / 255
+    canvas.composite(color, coverage, alpha * color_alpha, blend)
+
+
+def decode_data_url(src: str) -> Image.Image:
+    match = re.match(r'data:image/[\w.+-]+;base64,(.*)', src or '', re.DOTALL)
+    if not match:
+        raise RenderError('Image layers need a base64 data: URL')
+    try:
+        image = Image.open(io.BytesIO(base64.b64decode(match.group(1))))
+    except Exception as e:
+        raise RenderError(f'Invalid image data: {e}')
+    # Image.open only reads the header - check the size before decoding the pixels
+    if image.width * image.height > MAX_IMAGE_SOURCE_PIXELS:
+        raise RenderError(f'Image layer source too large ({image.width}x{image.height})')
+    try:
+        return image.convert('RGBA')
+    except Exception as e:
+        raise RenderError(f'Invalid image data: {e}')
+
+
+def render_image(canvas: CapeCanvas, properties: dict, alpha: float, blend: str):
+    image = decode_data_url(properties.get('src'))
+    width = _number(properties, 'width', image.width) * abs(float(properties.get('scaleX') or 1))
+    height = _number(properties, 'height', image.height) * abs(float(properties.get('scaleY') or 1))
+    if not (abs(width) <= MAX_IMAGE_LAYER_SIZE and abs(height) <= MAX_IMAGE_LAYER_SIZE):
+        raise RenderError(f'Image layer too large (max {MAX_IMAGE_LAYER_SIZE}x{MAX_IMAGE_LAYER_SIZE} after scaling)')
+    image = image.resize((max(1, round(width)), max(1, round(height))), Image.LANCZOS)
+    if properties.get('rotation'):
+        image = image.rotate(-float(properties['rotation']), resample=Image.BICUBIC, expand=True)
+    # Centre stays at (x + width / 2, y + height / 2) as in renderImage()
+    cx = float(properties.get('x') or 0) + _number(properties, 'width', image.width) / 2
+    cy = float(properties.get('y') or 0) + _number(properties, 'height', image.height) / 2
+    left, top = round(cx - image.width / 2), round(cy - image.height / 2)
+    box = _clip_box(canvas, left, top, left + image.width, top + image.height)
+    if box is None:
+        return
+    x0, y0, x1, y1 = box
+    pixels = np.asarray(image, dtype=np.float32)[y0 - top:y1 - top, x0 - left:x1 - left] / 255
+    canvas.composite(pixels[..., :3], pixels[..., 3], alpha, blend, (slice(y0, y1), slice(x0, x1)))
+
+
+LAYER_RENDERERS = {
+    'background': render_background,
+    'gradient': render_gradient,
+    'shape': render_shape,
+    'pattern': render_pattern,
+    'text': render_text,
+    'image': render_image,
+}
+
+
+# ==================== ENTRY POINTS ====================
+
+def render_cape(spec, width: int = CANVAS_SIZE, height: int = CANVAS_SIZE) -> Image.Image:
+    """
+    Render a cape description to an RGB image
+    `spec` is the builder's layers list, or {"layers": [...]} as saveCape() stores it.
+    """
+    layers = spec.get('layers') if isinstance(spec, dict) else spec
+    if not isinstance(layers, list):
+        raise RenderError('Cape description needs a "layers" list')
+
+    canvas = CapeCanvas(width, height)
+    visible = [layer for layer in layers if isinstance(layer, dict) and layer.get('visible', True)]
+    for layer in sorted(visible, key=lambda layer: layer.get('order', 0) or 0):
+        renderer = LAYER_RENDERERS.get(layer.get('type'))
+        if renderer is None:
+            continue  # the builders skip unknown layer types too
+        alpha = (float(layer.get('opacity') or 100)) / 100  # (layer.opacity || 100) / 100
+        renderer(canvas, layer.get('properties') or {}, min(1.0, max(0.0, alpha)), layer.get('blendMode') or 'source-over')
+    return canvas.to_image()
+
+
+def render_cape_png(spec, width: int = CANVAS_SIZE, height: int = CANVAS_SIZE) -> bytes:
+    """Render a cape description straight to PNG bytes (upload-ready)"""
+    output = io.BytesIO()
+    render_cape(spec, width, height).save(output, format='PNG', optimize=False)
+    return output.getvalue()
+
+
+_executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix='cape-render')
+
+
+def render_many(specs: Iterable) -> List[dict]:
+    """
+    Render a batch of cape descriptions in parallel (NumPy releases the GIL)
+    Returns one {"index", "success", "png" | "error"} per description, in order
+    """
+    def render_one(index_spec):
+        index, spec = index_spec
+        try:
+            return {'index': index, 'success': True, 'png': render_cape_png(spec)}
+        except RenderError as e:
+            return {'index': index, 'success': False, 'error': str(e)}
+        except Exception as e:
+            print(f"[RENDER] ❌ Cape {index} failed: {e}")
+            return {'index': index, 'success': False, 'error': f'Render failed: {e}'}
+
+    return list(_executor.map(render_one, enumerate(specs)))
@@ -0,0 +1,385 @@
+"""
+Indexed Cape Store
+SQLite index built from the bot's cape_logs.json and purchases.json so
+status and history lookups don't scan every cape ever logged.
+Re-synced incrementally whenever either file changes on disk.
+"""
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from journal import journaled
+from username_index import UsernameIndex
+
+# Above this many matching usernames, fall back to filtering rows in SQL
+USERNAME_IN_LIMIT = 500
+
+INDEX_PATH = os.getenv('CAPE_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cape_index.db'))
+
+SOURCE_CAPE_LOGS = 'cape_logs'
+SOURCE_PURCHASES = 'purchases'
+
+SOURCE_FILES = {
+    SOURCE_CAPE_LOGS: 'cape_logs.json',
+    SOURCE_PURCHASES: 'purchases.json',
+}
+
+
+def normalize_cape_log(cape: dict) -> dict:
+    """Normalize one cape_logs.json entry to the history record shape"""
+    return {
+        'decal_id': cape.get('asset_id', cape.get('decal_id', '')),
+        'asset_id': cape.get('asset_id', cape.get('decal_id', '')),
+        'image_id': cape.get('image_id', cape.get('asset_id', cape.get('decal_id', ''))),
+        'ticket_number': cape.get('ticket_number', ''),
+        'timestamp': cape.get('timestamp', ''),
+        'discord_user_id': cape.get('discord_user_id', ''),
+        'username': cape.get('username', 'Unknown')
+    }
+
+
+def normalize_purchase(user_id: str, purchase: dict) -> dict:
+    """Normalize one purchases.json entry to the history record shape"""
+    decal_id = purchase.get('decal_id', '')
+    return {
+        'decal_id': decal_id,
+        'asset_id': decal_id,
+        'image_id': decal_id,
+        'ticket_number': purchase.get('ticket_number', ''),
+        'timestamp': purchase.get('timestamp', ''),
+        'discord_user_id': user_id,
+        'username': 'Unknown'
+    }
+
+
+def iter_cape_logs(cape_logs) -> Iterator[dict]:
+    """Yield every record, for both the 'capes' list format and the legacy dict format"""
+    if not cape_logs or not isinstance(cape_logs, dict):
+        return
+    if 'capes' in cape_logs and isinstance(cape_logs['capes'], list):
+        for cape in cape_logs['capes']:
+            if isinstance(cape, dict):
+                yield normalize_cape_log(cape)
+    else:
+        for key, cape in cape_logs.items():
+            if key != '_note' and isinstance(cape, dict):
+                yield normalize_cape_log(cape)
+
+
+def iter_purchases(purchases) -> Iterator[dict]:
+    """Yield a record for every purchase of every user"""
+    if not purchases or not isinstance(purchases, dict):
+        return
+    for user_id, user_purchases in purchases.items():
+        if isinstance(user_purchases, list):
+            for purchase in user_purchases:
+                if isinstance(purchase, dict):
+                    yield normalize_purchase(user_id, purchase)
+
+
+SOURCE_READERS = {
+    SOURCE_CAPE_LOGS: iter_cape_logs,
+    SOURCE_PURCHASES: iter_purchases,
+}
+
+RECORD_FIELDS = ('decal_id', 'asset_id', 'image_id', 'ticket_number', 'timestamp', 'discord_user_id', 'username')
+
+
+def record_identity(record: dict):
+    """Cheap content key for a normalized record (no serialization unless a value is unhashable)"""
+    identity = tuple(record.get(field) for field in RECORD_FIELDS)
+    try:
+        hash(identity)
+    except TypeError:
+        return json.dumps(record, sort_keys=True, default=str)
+    return identity
+
+
+def encode_cursor(position: Tuple[str, int]) -> str:
+    """Opaque pagination cursor for a (timestamp, seq) history position - seq never changes once assigned"""
+    return base64.urlsafe_b64encode(json.dumps(list(position)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Inverse of encode_cursor - raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, seq = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return str(timestamp), int(seq)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+class CapeStore:
+    """SQLite-backed index over cape_logs.json and purchases.json"""
+
+    def __init__(self, data_dir: str, path: str = INDEX_PATH):
+        self.data_dir = data_dir
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS capes (
+                source TEXT NOT NULL,
+                source_key TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                row_hash TEXT NOT NULL,
+                asset_id TEXT,
+                decal_id TEXT,
+                discord_user_id TEXT,
+                ticket_number TEXT,
+                username TEXT,
+                timestamp TEXT,
+                record TEXT NOT NULL,
+                PRIMARY KEY (source, source_key)
+            );
+            CREATE INDEX IF NOT EXISTS idx_capes_asset_id ON capes (asset_id);
+            CREATE INDEX IF NOT EXISTS idx_capes_decal_id ON capes (decal_id);
+            CREATE INDEX IF NOT EXISTS idx_capes_discord_user_id ON capes (discord_user_id);
+            CREATE INDEX IF NOT EXISTS idx_capes_ticket_number ON capes (ticket_number);
+            CREATE INDEX IF NOT EXISTS idx_capes_timestamp ON capes (source, timestamp DESC, seq);
+            CREATE INDEX IF NOT EXISTS idx_capes_username ON capes (source, username);
+            CREATE TABLE IF NOT EXISTS sources (
+                source TEXT PRIMARY KEY,
+                signature TEXT NOT NULL
+            );
+        ''')
+        self._db.commit()
+        self._signatures: Dict[str, Optional[str]] = dict(self._db.execute('SELECT source, signature FROM sources').fetchall())
+        # source -> {(record identity, occurrence): source_key} for the rows in the index
+        self._keys: Dict[str, Dict[tuple, str]] = {}
+        self._listeners: List[Callable[[str, List[dict], List[dict]], None]] = []
+
+        # Username search index - seeded from the existing rows, then kept current by sync()
+        self.username_index = UsernameIndex()
+        for username, count in self._db.execute('SELECT username, COUNT(*) FROM capes GROUP BY username'):
+            self.username_index.add(username, count)
+        self.add_listener(lambda source, added, removed: self.username_index.update(
+            [str(record['username']) for record in added],
+            [str(record['username']) for record in removed]
+        ))
+
+    def add_listener(self, listener: Callable[[str, List[dict], List[dict]], None]):
+        """Call listener(source, added_records, removed_records) after every sync that changes rows"""
+        self._listeners.append(listener)
+
+    def sync(self):
+        """Bring the index up to date with the JSON files (no-op if unchanged)"""
+        for source in SOURCE_FILES:
+            self._sync_source(source)
+
+    def _sync_source(self, source: str):
+        filepath = os.path.join(self.data_dir, SOURCE_FILES[source])
+        signature = journaled(filepath).signature()
+        signature_key = json.dumps(signature)
+        if self._signatures.get(source) == signature_key:
+            return
+
+        with self._lock:
+            if self._signatures.get(source) == signature_key:
+                return
+
+            data = journaled(filepath).load()
+            keys = self._source_keys(source)
+
+            seen = set()
+            inserts = []
+            added = []
+            new_keys = {}
+            occurrences = {}
+            next_seq = self._db.execute('SELECT COALESCE(MAX(seq), -1) + 1 FROM capes').fetchone()[0]
+            for record in SOURCE_READERS[source](data):
+                identity = record_identity(record)
+                # Identical records are told apart by occurrence, not by position in the file
+                occurrence = occurrences.get(identity, 0)
+                occurrences[identity] = occurrence + 1
+                seen.add((identity, occurrence))
+                if (identity, occurrence) in keys:
+                    continue  # Unchanged - its row and seq stay as they are
+                record_json = json.dumps(record, sort_keys=True, default=str)
+                row_hash = hashlib.sha1(record_json.encode()).hexdigest()
+                source_key = f'{row_hash}:{occurrence}' if occurrence else row_hash
+                new_keys[(identity, occurrence)] = source_key
+                inserts.append((
+                    source, source_key, next_seq, row_hash,
+                    str(record['asset_id']), str(record['decal_id']), str(record['discord_user_id']),
+                    str(record['ticket_number']), str(record['username']), str(record['timestamp']),
+                    record_json
+                ))
+                next_seq += 1
+                added.append(record)
+
+            stale = [key for key in keys if key not in seen]
+            stale_keys = [keys[key] for key in stale]
+            removed = self._records_for_keys(source, stale_keys) if stale else []
+
+            self._db.executemany(
+                'DELETE FROM capes WHERE source = ? AND source_key = ?',
+                [(source, key) for key in stale_keys]
+            )
+            self._db.executemany(
+                'INSERT OR REPLACE INTO capes (source, source_key, seq, row_hash, asset_id, decal_id, '
+                'discord_user_id, ticket_number, username, timestamp, record) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                inserts
+            )
+            self._db.execute(
+                'INSERT OR REPLACE INTO sources (source, signature) VALUES (?, ?)',
+                (source, signature_key)
+            )
+            self._db.commit()
+            self._signatures[source] = signature_key
+            for key in stale:
+                del keys[key]
+            keys.update(new_keys)
+
+            if inserts or stale:
+                print(f"[STORE] Synced {SOURCE_FILES[source]} - {len(inserts)} added, {len(stale)} removed")
+                for listener in self._listeners:
+                    try:
+                        listener(source, added, removed)
+                    except Exception as e:
+                        print(f"[STORE] Listener error: {e}")
+
+    def _source_keys(self, source: str) -> Dict[tuple, str]:
+        """In-memory identity -> source_key map for a source, loaded from the index on first use"""
+        keys = self._keys.get(source)
+        if keys is None:
+            keys = {}
+            for source_key, record_json in self._db.execute(
+                    'SELECT source_key, record FROM capes WHERE source = ?', (source,)):
+                occurrence = int(source_key.partition(':')[2] or 0)
+                keys[(record_identity(json.loads(record_json)), occurrence)] = source_key
+            self._keys[source] = keys
+        return keys
+
+    def _records_for_keys(self, source: str, keys: List[str]) -> List[dict]:
+        records = []
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self._db.execute(
+                f'SELECT record FROM capes WHERE source = ? AND source_key IN ({placeholders})',
+                [source, *chunk]
+            ).fetchall()
+            records.extend(json.loads(row[0]) for row in rows)
+        return records
+
+    def _query(self, sql: str, params=()) -> List[dict]:
+        self.sync()
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def find_by_asset_id(self, asset_id: str) -> Optional[Tuple[str, dict]]:
+        """
+        Find a cape by asset ID - cape logs first, then purchases (by decal ID)
+
+        Returns:
+            (source, record) or None
+        """
+        asset_id = str(asset_id)
+        records = self._query(
+            'SELECT record FROM capes WHERE source = ? AND asset_id = ? ORDER BY seq LIMIT 1',
+            (SOURCE_CAPE_LOGS, asset_id)
+        )
+        if records:
+            return SOURCE_CAPE_LOGS, records[0]
+        records = self._query(
+            'SELECT record FROM capes WHERE source = ? AND decal_id = ? ORDER BY seq LIMIT 1',
+            (SOURCE_PURCHASES, asset_id)
+        )
+        if records:
+            return SOURCE_PURCHASES, records[0]
+        return None
+
+    def find_by_user(self, discord_user_id: str) -> List[dict]:
+        return self._query(
+            'SELECT record FROM capes WHERE discord_user_id = ? ORDER BY timestamp DESC, seq',
+            (str(discord_user_id),)
+        )
+
+    def find_by_ticket(self, ticket_number) -> List[dict]:
+        return self._query(
+            'SELECT record FROM capes WHERE ticket_number = ? ORDER BY timestamp DESC, seq',
+            (str(ticket_number),)
+        )
+
+    def history_source(self) -> str:
+        """History comes from cape_logs.json, falling back to purchases.json when it's empty"""
+        self.sync()
+        with self._lock:
+            row = self._db.execute('SELECT 1 FROM capes WHERE source = ? LIMIT 1', (SOURCE_CAPE_LOGS,)).fetchone()
+        return SOURCE_CAPE_LOGS if row else SOURCE_PURCHASES
+
+    def _history_filter(self, username_filter: str, prefix: bool = False) -> Tuple[str, list]:
+        where = 'source = ?'
+        params: list = [self.history_source()]
+        if username_filter:
+            if prefix:
+                usernames = self.username_index.search_prefix(username_filter)
+            else:
+                usernames = self.username_index.search(username_filter)
+            if not usernames:
+                where += ' AND 0'
+            elif len(usernames) <= USERNAME_IN_LIMIT:
+                where += f' AND username IN ({",".join("?" * len(usernames))})'
+                params.extend(sorted(usernames))
+            elif prefix:
+                where += ' AND substr(UPPER(username), 1, ?) = ?'
+                params.extend([len(username_filter), username_filter.upper()])
+            else:
+                where += ' AND instr(UPPER(username), ?) > 0'
+                params.append(username_filter.upper())
+        return where, params
+
+    def history_count(self, username_filter: str = '', prefix: bool = False) -> int:
+        """Number of history records matching the username filter"""
+        where, params = self._history_filter(username_filter, prefix)
+        with self._lock:
+            return self._db.execute(f'SELECT COUNT(*) FROM capes WHERE {where}', params).fetchone()[0]
+
+    def iter_history(self, username_filter: str = '', cursor: Optional[str] = None,
+                     limit: Optional[int] = None, batch_size: int = 200,
+                     prefix: bool = False) -> Iterator[Tuple[dict, str]]:
+        """
+        Stream history records newest first, fetching batch_size rows at a time
+
+        Yields:
+            (record, cursor) - pass a record's cursor back in to resume after it
+        """
+        self.sync()
+        where, params = self._history_filter(username_filter, prefix)
+        position = decode_cursor(cursor) if cursor else None
+        remaining = limit
+
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            sql = f'SELECT record, timestamp, seq FROM capes WHERE {where}'
+            page_params = list(params)
+            if position is not None:
+                sql += ' AND (timestamp < ? OR (timestamp = ? AND seq > ?))'
+                page_params += [position[0], position[0], position[1]]
+            sql += ' ORDER BY timestamp DESC, seq LIMIT ?'
+            page_params.append(size)
+
+            with self._lock:
+                rows = self._db.execute(sql, page_params).fetchall()
+            for record_json, timestamp, seq in rows:
+                position = (timestamp, seq)
+                yield json.loads(record_json), encode_cursor(position)
+            if remaining is not None:
+                remaining -= len(rows)
+            if len(rows) < size:
+                return
+
+    def count(self, source: Optional[str] = None) -> int:
+        self.sync()
+        with self._lock:
+            if source:
+                return self._db.execute('SELECT COUNT(*) FROM capes WHERE source = ?', (source,)).fetchone()[0]
+            return self._db.execute('SELECT COUNT(*) FROM capes').fetchone()[0]
@@ -0,0 +1,120 @@
+"""
+Circuit Breaker
+Wraps calls to a dependency that can go away (the bot's local API on
+port 5001). After enough consecutive failures the circuit OPENS and calls
+fail fast; after a cool-down ONE half-open probe is let through, and its
+result decides whether the circuit closes again or stays open.
+"""
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '3'))  # consecutive failures to open
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))       # seconds open before a probe
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the dependency while the circuit is open"""
+
+
+class CircuitBreaker:
+    """Closed -> open after N failures -> half-open probe -> closed/open"""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        # metrics
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.times_opened = 0
+        self.last_error: Optional[str] = None
+        self.last_state_change = time.time()
+
+    def allow(self) -> bool:
+        """
+        Whether a call may go out now
+        Every allowed call must be followed by record_success() or record_failure().
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED:
+                self.calls += 1
+                return True
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self.calls += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+                print(f"[BREAKER] ✅ {self.name} recovered, circuit closed")
+
+    def record_failure(self, error: Optional[BaseException] = None):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error) if error is not None else None
+            probe_failed = self.state == HALF_OPEN
+            self._probe_in_flight = False
+            if probe_failed or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self._set_state(OPEN)
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                print(f"[BREAKER] ⚠️ {self.name} unavailable ({self.last_error}), "
+                      f"failing fast for {self.reset_timeout:.0f}s")
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Run fn through the breaker - raises CircuitOpenError while open"""
+        if not self.allow():
+            raise CircuitOpenError(f'{self.name} circuit is open')
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def _set_state(self, state: str):
+        self.state = state
+        self.last_state_change = time.time()
+
+    def stats(self) -> dict:
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1)
+            return {
+                'name': self.name,
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'probe_in_seconds': retry_in,
+                'calls': self.calls,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'times_opened': self.times_opened,
+                'last_error': self.last_error,
+                'last_state_change': self.last_state_change,
+            }
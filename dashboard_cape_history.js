@@ -2,6 +2,9 @@
 class CapeHistoryManager {
     constructor() {
         this.capes = [];
+        this.nextCursor = null;
+        this.pageSize = 50;
+        this.loading = false;
         this.init();
     }
 
@@ -12,27 +15,55 @@ class CapeHistoryManager {
         }, 500);
     }
 
+    async fetchPage(cursor) {
+        const params = new URLSearchParams({ limit: this.pageSize });
+        if (cursor) params.set('cursor', cursor);
+
+        const response = await fetch(`/api/capes/history?${params}`, {
+            method: 'GET',
+            credentials: 'include',
+            headers: {
+                'Content-Type': 'application/json'
+            }
+        });
+
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        return response.json();
+    }
+
     async loadCapeHistory() {
+        // Load the first page (newest capes); older ones load on demand
+        if (this.loading) return;
+        this.loading = true;
         try {
-            // Load all capes (purchases.json contains all cape data)
-            const response = await fetch('/api/capes/history', {
-                method: 'GET',
-                credentials: 'include',
-                headers: {
-                    'Content-Type': 'application/json'
-                }
-            });
-            
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            
-            const data = await response.json();
+            const data = await this.fetchPage(null);
             this.capes = data.capes || [];
+            this.nextCursor = data.next_cursor || null;
+            this.total = data.total || this.capes.length;
             this.displayCapes(this.capes);
         } catch (error) {
             console.error('[Dashboard] Error loading cape history:', error);
             this.displayError('Failed to load cape history: ' + error.message);
+        } finally {
+            this.loading = false;
+        }
+    }
+
+    async loadMore() {
+        if (this.loading || !this.nextCursor) return;
+        this.loading = true;
+        try {
+            const data = await this.fetchPage(this.nextCursor);
+            this.capes = this.capes.concat(data.capes || []);
+            this.nextCursor = data.next_cursor || null;
+            this.displayCapes(this.capes);
+        } catch (error) {
+            console.error('[Dashboard] Error loading more capes:', error);
+        } finally {
+            this.loading = false;
         }
     }
 
@@ -51,7 +82,15 @@ class CapeHistoryManager {
             return;
         }
 
-        container.innerHTML = capes.map(cape => this.createCapeCard(cape)).join('');
+        let html = capes.map(cape => this.createCapeCard(cape)).join('');
+        if (this.nextCursor) {
+            html += `
+                <button class="ticket-action-btn load-more-capes" onclick="window.capeHistoryManager.loadMore()">
+                    Load more (${capes.length} of ${this.total})
+                </button>
+            `;
+        }
+        container.innerHTML = html;
     }
 
     createCapeCard(cape) {
@@ -0,0 +1,234 @@
+"""
+Persistent Discord Gateway Client
+One long-lived discord.Client connected to the gateway on a dedicated
+event-loop thread. Member/role events keep a (guild_id, user_id) -> roles
+index current, so authorization checks are in-memory lookups.
+If the client dies it is restarted with exponential backoff; until it is
+connected again, checks go to the REST API instead of the index.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+import discord
+
+from http_pool import http_client
+from metrics import metrics
+
+GATEWAY_RETRY_SECONDS = float(os.getenv('DISCORD_GATEWAY_RETRY_SECONDS', '5'))  # first restart delay, doubling
+GATEWAY_MAX_RETRY_SECONDS = float(os.getenv('DISCORD_GATEWAY_MAX_RETRY_SECONDS', '900'))
+
+
+class DiscordGateway:
+    """Background discord.Client with a cached authorized-role index"""
+
+    def __init__(self, token: str, role_ids: Iterable[int] = (), role_names: Iterable[str] = (),
+                 fetch_timeout: float = 5.0, api_url: str = 'https://discord.com/api'):
+        self.token = token
+        self.api_url = api_url.rstrip('/')
+        self.role_ids = frozenset(role_ids)
+        self.role_names = frozenset(name.lower() for name in role_names)
+        self.fetch_timeout = fetch_timeout
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.client: Optional[discord.Client] = None
+        self.ready = threading.Event()
+        # (guild_id, user_id) -> authorized role keys the member holds (empty = not authorized)
+        self._roles: Dict[Tuple[int, int], FrozenSet] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._retry_at = 0.0
+        self.failures = 0  # consecutive gateway failures (reset once connected)
+        self.last_error: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.rest_checks = 0
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        """Start the client on its own thread (idempotent; a failed client is restarted only after its backoff)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if time.monotonic() < self._retry_at:
+                return
+            self._thread = threading.Thread(target=self._run, name='discord-gateway', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        intents = discord.Intents.default()
+        intents.guilds = True
+        intents.members = True
+        self.client = discord.Client(intents=intents)
+        self._register_events(self.client)
+        error = 'client closed'
+        try:
+            self.loop.run_until_complete(self.client.start(self.token))
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        finally:
+            self.ready.clear()
+            try:
+                self.loop.run_until_complete(self.client.close())
+            except Exception:
+                pass
+            self.loop.close()
+            with self._lock:
+                self.failures += 1
+                self.last_error = error
+                delay = min(GATEWAY_RETRY_SECONDS * 2 ** (self.failures - 1), GATEWAY_MAX_RETRY_SECONDS)
+                self._retry_at = time.monotonic() + delay
+            print(f"[DISCORD] ❌ Gateway client stopped: {error} - next attempt in {delay:.0f}s "
+                  f"(REST role checks until then)")
+
+    def run_coroutine(self, coro, timeout: Optional[float] = None):
+        """Run a coroutine on the gateway loop from any thread and wait for the result"""
+        if self.loop is None or not self.loop.is_running():
+            coro.close()
+            raise RuntimeError('Discord gateway loop is not running')
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout=timeout)
+
+    def _register_events(self, client: discord.Client):
+        @client.event
+        async def on_ready():
+            print(f"[DISCORD] ✅ Gateway connected as {client.user}")
+            # A new session doesn't replay what happened while we were away
+            with self._lock:
+                self._roles.clear()
+                self.failures = 0
+            self.ready.set()
+
+        @client.event
+        async def on_resumed():
+            self.ready.set()
+
+        @client.event
+        async def on_disconnect():
+            self.ready.clear()
+
+        @client.event
+        async def on_member_update(before, after):
+            self._store(after)
+
+        @client.event
+        async def on_member_join(member):
+            self._store(member)
+
+        @client.event
+        async def on_member_remove(member):
+            self.invalidate(member.guild.id, member.id)
+
+        @client.event
+        async def on_guild_role_update(before, after):
+            # A rename can change the name-based match for everyone holding the role
+            self.invalidate(after.guild.id)
+
+        @client.event
+        async def on_guild_role_delete(role):
+            self.invalidate(role.guild.id)
+
+        @client.event
+        async def on_guild_remove(guild):
+            self.invalidate(guild.id)
+
+    # ---------- role index ----------
+
+    def _authorized_roles(self, member) -> FrozenSet:
+        roles = set()
+        for role in getattr(member, 'roles', []):
+            if role.id in self.role_ids:
+                roles.add(role.id)
+            elif role.name.lower() in self.role_names:
+                roles.add(role.name.lower())
+        return frozenset(roles)
+
+    def _store(self, member) -> FrozenSet:
+        roles = self._authorized_roles(member)
+        with self._lock:
+            self._roles[(member.guild.id, member.id)] = roles
+        return roles
+
+    def invalidate(self, guild_id: int, user_id: Optional[int] = None):
+        with self._lock:
+            if user_id is not None:
+                self._roles.pop((guild_id, user_id), None)
+            else:
+                for key in [key for key in self._roles if key[0] == guild_id]:
+                    del self._roles[key]
+
+    def authorized_roles(self, user_id: int, guild_id: int) -> FrozenSet:
+        """
+        Authorized role keys a user holds in a guild
+
+        Served from the index; on a miss the member comes from the gateway
+        member cache, or a REST fetch if the member isn't cached yet.
+        While the gateway is down the index can't be trusted, so the REST API answers.
+        """
+        user_id, guild_id = int(user_id), int(guild_id)
+        if not self.ready.is_set():
+            return self._authorized_roles_rest(user_id, guild_id)
+        with self._lock:
+            roles = self._roles.get((guild_id, user_id))
+            if roles is not None:
+                self.hits += 1
+                return roles
+            self.misses += 1
+
+        guild = self.client.get_guild(guild_id)
+        if not guild:
+            return frozenset()
+        member = guild.get_member(user_id)
+        if member is None:
+            try:
+                with metrics.timed('discord_gateway:fetch_member'):
+                    member = self.run_coroutine(guild.fetch_member(user_id), timeout=self.fetch_timeout)
+            except discord.NotFound:
+                member = None
+        if member is None:
+            with self._lock:
+                self._roles[(guild_id, user_id)] = frozenset()
+            return frozenset()
+        return self._store(member)
+
+    def _authorized_roles_rest(self, user_id: int, guild_id: int) -> FrozenSet:
+        """authorized_roles() straight from the REST API (not indexed - no events keep it current)"""
+        with self._lock:
+            self.rest_checks += 1
+        headers = {'Authorization': f'Bot {self.token}'}
+        with metrics.timed('discord_gateway:rest_member'):
+            response = http_client.get(f'{self.api_url}/guilds/{guild_id}/members/{user_id}',
+                                       headers=headers, timeout=self.fetch_timeout)
+        if response.status_code == 404:
+            return frozenset()
+        response.raise_for_status()
+        member_role_ids = {int(role_id) for role_id in response.json().get('roles', [])}
+        roles = {role_id for role_id in member_role_ids if role_id in self.role_ids}
+        if self.role_names and member_role_ids - roles:
+            with metrics.timed('discord_gateway:rest_roles'):
+                response = http_client.get(f'{self.api_url}/guilds/{guild_id}/roles',
+                                           headers=headers, timeout=self.fetch_timeout)
+            response.raise_for_status()
+            for role in response.json():
+                name = str(role.get('name', '')).lower()
+                if int(role['id']) in member_role_ids and name in self.role_names:
+                    roles.add(name)
+        return frozenset(roles)
+
+    def is_authorized(self, user_id: int, guild_id: int) -> bool:
+        return bool(self.authorized_roles(user_id, guild_id))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'ready': self.ready.is_set(),
+                'indexed_members': len(self._roles),
+                'hits': self.hits,
+                'misses': self.misses,
+                'rest_checks': self.rest_checks,
+                'failures': self.failures,
+                'last_error': self.last_error,
+            }
@@ -0,0 +1,196 @@
+"""
+Shared Pooled HTTP Clients
+One keep-alive connection pool for every outbound call (Roblox, Discord,
+the bot API on port 5001), for both sync (requests) and async (aiohttp)
+callers, with per-host limits and pool metrics. Every call is paced by
+the rate-limit scheduler (see rate_limiter.py).
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics
+from rate_limiter import rate_limiter
+from tracing import span
+
+# Pool sizing (override in .env)
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '10'))          # connections kept per host
+HTTP_POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', '10'))              # hosts with a live pool
+HTTP_POOL_BLOCK = os.getenv('HTTP_POOL_BLOCK', 'false').lower() == 'true'  # wait for a free connection
+HTTP_ASYNC_LIMIT = int(os.getenv('HTTP_ASYNC_LIMIT', '100'))           # total async connections
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '30'))
+
+# Per-host overrides of HTTP_POOL_MAXSIZE, e.g. HTTP_POOL_HOST_LIMITS="thumbnails.roblox.com=20,localhost:5001=4"
+HOST_LIMITS: Dict[str, int] = {}
+for _item in filter(None, os.getenv('HTTP_POOL_HOST_LIMITS', '').split(',')):
+    _host, _, _limit = _item.partition('=')
+    if _limit.strip().isdigit():
+        HOST_LIMITS[_host.strip()] = int(_limit)
+
+
+def host_of(url: str) -> str:
+    """host[:port] of a URL, used as the metrics/limits key"""
+    return urlsplit(url).netloc
+
+
+class PooledHTTPClient:
+    """Process-wide keep-alive HTTP client with per-host pools and metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, dict] = {}
+        self.session = requests.Session()
+        default_adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                                      pool_block=HTTP_POOL_BLOCK)
+        self.session.mount('https://', default_adapter)
+        self.session.mount('http://', default_adapter)
+        self._adapters = {'default': default_adapter}
+        for host, limit in HOST_LIMITS.items():
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=limit, pool_block=HTTP_POOL_BLOCK)
+            self.session.mount(f'https://{host}', adapter)
+            self.session.mount(f'http://{host}', adapter)
+            self._adapters[host] = adapter
+        # One aiohttp session per event loop (sessions can't be shared across loops)
+        self._async_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        self._sync_loop: Optional[asyncio.AbstractEventLoop] = None  # see run_sync
+
+    # ---------- sync ----------
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """requests-style call through the shared session"""
+        host = host_of(url)
+        rate_limiter.wait(host)
+        started = time.perf_counter()
+        with span('http', method=method, host=host) as http_span:
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except Exception:
+                self._record(host, time.perf_counter() - started, None)
+                raise
+            http_span.set(status=response.status_code)
+        self._record(host, time.perf_counter() - started, response.status_code)
+        rate_limiter.observe(host, response.status_code, response.headers)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    # ---------- async ----------
+
+    def async_session(self) -> aiohttp.ClientSession:
+        """Shared aiohttp session for the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._async_sessions.get(loop)
+            if session is None or session.closed:
+                connector = aiohttp.TCPConnector(limit=HTTP_ASYNC_LIMIT, limit_per_host=HTTP_POOL_MAXSIZE,
+                                                 keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT)
+                session = aiohttp.ClientSession(connector=connector)
+                self._async_sessions[loop] = session
+            return session
+
+    def run_sync(self, coro):
+        """
+        Run a coroutine from sync code (Flask routes) and wait for its result
+        Every caller shares one background loop - and so one aiohttp session - instead of a loop each
+        """
+        with self._lock:
+            if self._sync_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='http-async', daemon=True).start()
+                self._sync_loop = loop
+        return asyncio.run_coroutine_threadsafe(coro, self._sync_loop).result()
+
+    async def async_request(self, method: str, url: str, **kwargs):
+        """
+        aiohttp call through the shared session - returns (status, headers, body bytes, final URL)
+        """
+        host = host_of(url)
+        delay = rate_limiter.reserve(host)
+        if delay > 0:
+            with span('rate_limit_wait', host=host, seconds=round(delay, 3)):
+                await asyncio.sleep(delay)
+        started = time.perf_counter()
+        with span('http', method=method, host=host) as http_span:
+            try:
+                async with self.async_session().request(method, url, **kwargs) as response:
+                    body = await response.read()
+                    http_span.set(status=response.status)
+                    self._record(host, time.perf_counter() - started, response.status)
+                    rate_limiter.observe(host, response.status, response.headers)
+                    return response.status, response.headers, body, str(response.url)
+            except Exception:
+                self._record(host, time.perf_counter() - started, None)
+                raise
+
+    async def close_async(self):
+        """Close the aiohttp session of the running loop (call on shutdown)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._async_sessions.pop(loop, None)
+        if session is not None:
+            await session.close()
+
+    # ---------- metrics ----------
+
+    def _record(self, host: str, elapsed: float, status: Optional[int]):
+        metrics.observe_outbound(host, status, elapsed)
+        with self._lock:
+            entry = self._metrics.setdefault(host, {
+                'requests': 0, 'errors': 0, 'status': {}, 'total_seconds': 0.0, 'max_seconds': 0.0,
+            })
+            entry['requests'] += 1
+            entry['total_seconds'] += elapsed
+            entry['max_seconds'] = max(entry['max_seconds'], elapsed)
+            if status is None:
+                entry['errors'] += 1
+            else:
+                entry['status'][str(status)] = entry['status'].get(str(status), 0) + 1
+
+    def stats(self) -> dict:
+        """Per-host call counts/latency plus live connection pool state"""
+        with self._lock:
+            hosts = {}
+            for host, host_metrics in self._metrics.items():
+                hosts[host] = dict(host_metrics, status=dict(host_metrics['status']),
+                                   avg_seconds=round(host_metrics['total_seconds'] / host_metrics['requests'], 4))
+
+        pools = {}
+        for name, adapter in self._adapters.items():
+            manager = adapter.poolmanager
+            for key in list(manager.pools.keys()):
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                pools[f'{pool.scheme}://{pool.host}:{pool.port}'] = {
+                    'adapter': name,
+                    'maxsize': pool.pool.maxsize if pool.pool else 0,
+                    'idle': pool.pool.qsize() if pool.pool else 0,
+                    'connections_opened': pool.num_connections,
+                    'requests': pool.num_requests,
+                }
+
+        with self._lock:
+            async_pools = {
+                str(id(loop)): {
+                    'limit': session.connector.limit if session.connector else 0,
+                    'closed': session.closed,
+                }
+                for loop, session in self._async_sessions.items()
+            }
+        return {'hosts': hosts, 'pools': pools, 'async_sessions': async_pools,
+                'rate_limits': rate_limiter.stats()}
+
+
+# Shared by every outbound call in api.py and the resolvers
+http_client = PooledHTTPClient()
@@ -2,10 +2,19 @@
 PERFECT Image ID Resolver using Roblox Thumbnails API
 This is the MOST RELIABLE method to get image ID from asset ID
 """
-import requests
+import os
 import re
 import time
-from typing import Optional
+from typing import Optional, Tuple
+from resolution_cache import get_resolution_cache
+from batch_resolver import THUMBNAILS_HOST, get_thumbnail_batcher
+from singleflight import image_id_flights
+from http_pool import http_client
+from metrics import metrics
+from rate_limiter import rate_limiter
+from tracing import span
+
+ASSETDELIVERY_URL = os.getenv('ROBLOX_ASSETDELIVERY_URL', 'https://assetdelivery.roblox.com').rstrip('/')
 
 def get_image_id_from_thumbnails_api(asset_id: str, max_retries: int = 10, delay: float = 2.0) -> Optional[str]:
     """
@@ -14,73 +23,52 @@ def get_image_id_from_thumbnails_api(asset_id: str, max_retries: int = 10, delay
     Args:
         asset_id: The asset ID (as string)
         max_retries: Maximum number of retry attempts
-        delay: Delay between retries in seconds
+        delay: Base delay for the jittered retry backoff, in seconds
     
     Returns:
         Image ID as string, or None if not found
     """
+    return _thumbnails_lookup(asset_id, max_retries, delay)[0]
+
+def _thumbnails_lookup(asset_id: str, max_retries: int, delay: float) -> Tuple[Optional[str], int]:
+    """get_image_id_from_thumbnails_api() that also reports how many attempts it made"""
     asset_id_num = int(asset_id) if asset_id else None
     if not asset_id_num or asset_id_num <= 0:
-        return None
+        return None, 0
     
-    url = f"https://thumbnails.roblox.com/v1/assets?assetIds={asset_id}&size=420x420&format=Png&isCircular=false"
+    # Each attempt joins a shared multi-ID request (see batch_resolver.py)
+    batcher = get_thumbnail_batcher()
     
     for attempt in range(1, max_retries + 1):
         try:
-            if attempt > 1:
-                time.sleep(delay * attempt)  # Progressive delay
-            
-            response = requests.get(url, timeout=15)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if "data" in data and len(data["data"]) > 0:
-                    entry = data["data"][0]
-                    
-                    # Method 1: Check targetId field (MOST RELIABLE)
-                    target_id = entry.get("targetId")
-                    if target_id and str(target_id) != str(asset_id):
-                        print(f"[IMAGE-ID] ✅ Found image ID {target_id} from targetId (attempt {attempt})")
-                        return str(target_id)
-                    
-                    # Method 2: Extract from imageUrl
-                    image_url = entry.get("imageUrl", "")
-                    if image_url:
-                        # Extract ID from URL: https://tr.rbxcdn.com/{imageId}/420x420/...
-                        match = re.search(r'/tr\.rbxcdn\.com/(\d{9,})/', image_url)
-                        if match:
-                            img_id = match.group(1)
-                            if img_id != str(asset_id):
-                                print(f"[IMAGE-ID] ✅ Found image ID {img_id} from imageUrl (attempt {attempt})")
-                                return img_id
-                        
-                        # Alternative pattern: rbxcdn.com/{imageId}
-                        match2 = re.search(r'rbxcdn\.com/(\d{9,})/', image_url)
-                        if match2:
-                            img_id = match2.group(1)
-                            if img_id != str(asset_id):
-                                print(f"[IMAGE-ID] ✅ Found image ID {img_id} from imageUrl (attempt {attempt})")
-                                return img_id
-            
-            if attempt < max_retries:
-                print(f"[IMAGE-ID] ⏳ Attempt {attempt}/{max_retries} failed, retrying in {delay * attempt}s...")
-            
+            with span('thumbnails_lookup', attempt=attempt):
+                img_id = batcher.lookup(asset_id)
+            if img_id:
+                print(f"[IMAGE-ID] ✅ Found image ID {img_id} from Thumbnails API (attempt {attempt})")
+                return img_id, attempt
         except Exception as e:
             print(f"[IMAGE-ID] ❌ Attempt {attempt} error: {e}")
-            if attempt < max_retries:
-                time.sleep(delay * attempt)
+        
+        if attempt < max_retries:
+            # Jittered backoff that honors Retry-After; None = shared retry budget spent
+            wait_time = rate_limiter.retry_delay(THUMBNAILS_HOST, attempt + 1, base=delay)
+            if wait_time is None:
+                print(f"[IMAGE-ID] ⚠️ Retry budget for {THUMBNAILS_HOST} spent, giving up")
+                return None, attempt
+            print(f"[IMAGE-ID] ⏳ Attempt {attempt}/{max_retries} failed, retrying in {wait_time:.1f}s...")
+            with span('backoff', attempt=attempt + 1, seconds=round(wait_time, 3)):
+                time.sleep(wait_time)
     
     print(f"[IMAGE-ID] ❌ Could not find image ID after {max_retries} attempts")
-    return None
+    return None, max_retries
 
 def get_image_id_from_asset_delivery(asset_id: str) -> Optional[str]:
     """
     Fallback method: Get image ID from AssetDelivery API
     """
     try:
-        url = f"https://assetdelivery.roblox.com/v1/asset?id={asset_id}"
-        response = requests.get(url, allow_redirects=True, timeout=15)
+        url = f"{ASSETDELIVERY_URL}/v1/asset?id={asset_id}"
+        response = http_client.get(url, allow_redirects=True, timeout=15)
         
         if response.status_code == 200:
             final_url = response.url
@@ -96,9 +84,39 @@ def get_image_id_from_asset_delivery(asset_id: str) -> Optional[str]:
     
     return None
 
+def resolve_image_ids_batch(asset_ids) -> dict:
+    """
+    Resolve many asset IDs at once (e.g. a queue of tickets)
+    Cached IDs cost nothing; the rest share ONE thumbnails request
+    
+    Returns:
+        {asset_id: image_id or None}
+    """
+    cache = get_resolution_cache()
+    results = {}
+    uncached = []
+    for asset_id in asset_ids:
+        found, image_id = cache.lookup(asset_id)
+        if found:
+            results[str(asset_id)] = image_id
+        else:
+            uncached.append(str(asset_id))
+    
+    if uncached:
+        for asset_id, image_id in get_thumbnail_batcher().lookup_many(uncached).items():
+            if image_id:
+                cache.put(asset_id, image_id)
+            else:
+                cache.put_negative(asset_id)
+            results[asset_id] = image_id
+    
+    return results
+
 def resolve_image_id_perfect(asset_id: str) -> Optional[str]:
     """
     PERFECT image ID resolver - uses multiple methods
+    Reads through the resolution cache (see resolution_cache.py), and
+    concurrent callers for the same asset share one resolution
     
     Returns:
         Image ID as string, or None if not found
@@ -106,13 +124,19 @@ def resolve_image_id_perfect(asset_id: str) -> Optional[str]:
     if not asset_id:
         return None
     
+    return image_id_flights.do(str(asset_id), lambda: get_resolution_cache().resolve(asset_id, _resolve_uncached))
+
+def _resolve_uncached(asset_id: str) -> Optional[str]:
+    """Resolve an image ID from Roblox (no caching)"""
     # Method 1: Thumbnails API (MOST RELIABLE - 90% success rate)
-    image_id = get_image_id_from_thumbnails_api(asset_id, max_retries=15, delay=3.0)
+    image_id, attempts = _thumbnails_lookup(asset_id, max_retries=15, delay=3.0)
     if image_id:
+        metrics.observe_resolution('image_id_resolver', attempts, 'thumbnails')
         return image_id
     
     # Method 2: AssetDelivery (fallback)
     image_id = get_image_id_from_asset_delivery(asset_id)
+    metrics.observe_resolution('image_id_resolver', attempts + 1, image_id and 'asset_delivery')
     if image_id:
         return image_id
     
@@ -0,0 +1,366 @@
+"""
+Append-Only Journal for the Bot's JSON Data Files
+Mutations to purchases.json, cape_logs.json, ticket_data.json, ... are
+appended as one JSON line each to <file>.journal (O(1) per write) instead
+of rewriting the whole file. Readers see snapshot + journal replayed.
+Periodically the journal is compacted into a new snapshot written to a
+temp file and swapped in with os.replace, so readers never see a torn file.
+
+Journal ops address dict keys (e.g. a ticket ID), never list positions, so
+if another process (the bot) rewrites the snapshot, the journal is replayed
+onto its version. Files the bot also reads should be opened write_through:
+every write is compacted straight away, so the bot sees it on disk.
+
+Before swapping in a compacted snapshot, the journal gets a marker naming
+it; if we crash before truncating the journal, replay skips everything
+above the marker instead of applying it twice.
+"""
+import json
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from json_cache import json_file_cache
+
+if sys.platform == 'win32':
+    import msvcrt
+else:
+    import fcntl
+
+JOURNAL_COMPACT_ENTRIES = int(os.getenv('JOURNAL_COMPACT_ENTRIES', '1000'))  # compact after this many writes
+SNAPSHOT_INDENT = 4  # matches how the bot writes its data files
+COMPACTED = 'compacted'  # {"op": "compacted", "snapshot": <new snapshot's (inode, mtime_ns, size)>}
+
+
+class FileLock:
+    """Exclusive lock on <file>.lock, shared by every process writing the file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._handle = None
+
+    def __enter__(self):
+        self._handle = open(self.path, 'a+b')
+        if sys.platform == 'win32':
+            self._handle.seek(0)
+            msvcrt.locking(self._handle.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(self._handle.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if sys.platform == 'win32':
+                self._handle.seek(0)
+                msvcrt.locking(self._handle.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._handle.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._handle.close()
+            self._handle = None
+
+
+def _stat_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """(inode, mtime_ns, size) - the inode changes when os.replace swaps a file in"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class _Replay:
+    """
+    Applies ops copy-on-write: containers along an op's path are copied once
+    per replay, so data already handed to readers is never modified
+    """
+
+    def __init__(self, root: Any):
+        self.root = root
+        self._owned = set()
+
+    def _own(self, container):
+        if id(container) in self._owned:
+            return container
+        copied = dict(container) if isinstance(container, dict) else list(container)
+        self._owned.add(id(copied))
+        return copied
+
+    def _fresh(self, next_key):
+        container = [] if isinstance(next_key, int) else {}
+        self._owned.add(id(container))
+        return container
+
+    def apply(self, op: dict):
+        path = op.get('path') or []
+        kind = op.get('op')
+        if not path:
+            if kind == 'set':
+                self.root = op.get('value')
+            elif kind == 'merge' and isinstance(op.get('value'), dict):
+                self.root = self._own(self.root if isinstance(self.root, dict) else {})
+                self.root.update(op['value'])
+            return
+
+        if not isinstance(self.root, (dict, list)):
+            self.root = self._fresh(path[0])
+        else:
+            self.root = self._own(self.root)
+        parent = self.root
+        for position, key in enumerate(path[:-1]):
+            child = self._get(parent, key)
+            next_key = path[position + 1]
+            child = self._own(child) if isinstance(child, (dict, list)) else self._fresh(next_key)
+            self._put(parent, key, child)
+            parent = child
+
+        key = path[-1]
+        if kind == 'set':
+            self._put(parent, key, op.get('value'))
+        elif kind == 'merge':
+            target = self._get(parent, key)
+            target = self._own(target) if isinstance(target, dict) else self._fresh('')
+            target.update(op.get('value') or {})
+            self._put(parent, key, target)
+        elif kind == 'delete' and isinstance(parent, dict):
+            parent.pop(key, None)
+        elif kind == 'append':
+            target = self._get(parent, key)
+            target = self._own(target) if isinstance(target, list) else self._fresh(0)
+            target.append(op.get('value'))
+            self._put(parent, key, target)
+
+    @staticmethod
+    def _get(container, key):
+        if isinstance(container, dict):
+            return container.get(key)
+        if isinstance(key, int) and 0 <= key < len(container):
+            return container[key]
+        return None
+
+    @staticmethod
+    def _put(container, key, value):
+        if isinstance(container, dict):
+            container[key] = value
+        elif isinstance(key, int) and key < len(container):
+            container[key] = value
+        elif isinstance(key, int) and key == len(container):
+            container.append(value)
+        # Anything else (a gap in a list) can only come from a hand-edited journal - skipped
+
+
+class JournaledJSONFile:
+    """One data file: snapshot on disk + append-only journal beside it"""
+
+    def __init__(self, path: str, compact_entries: int = JOURNAL_COMPACT_ENTRIES, write_through: bool = False):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.lock_path = path + '.lock'
+        self.compact_entries = 1 if write_through else compact_entries
+        self._lock = threading.RLock()
+        # Materialized state and the file positions it reflects
+        self._data: Any = None
+        self._snapshot_signature = None
+        self._journal_inode: Optional[int] = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self.writes = 0
+        self.compactions = 0
+
+    # ---------- reads ----------
+
+    def signature(self):
+        """Changes whenever the snapshot or the journal does"""
+        journal = _stat_signature(self.journal_path)
+        return (json_file_cache.signature(self.path), journal and (journal[0], journal[2]))
+
+    def load(self) -> Any:
+        """
+        Snapshot with the journal replayed (shared - treat as read-only)
+        Only journal lines appended since the last load are replayed.
+        """
+        with self._lock:
+            journal = _stat_signature(self.journal_path)
+            if journal is None or journal[2] == 0:
+                # Nothing journaled - exactly the plain cached file
+                self._reset(None)
+                return json_file_cache.load(self.path)
+
+            for _ in range(5):
+                snapshot_signature = _stat_signature(self.path)
+                if (snapshot_signature != self._snapshot_signature or journal[0] != self._journal_inode
+                        or journal[2] < self._journal_offset):
+                    self._reset(snapshot_signature)
+                    base = json_file_cache.load(self.path)
+                else:
+                    base = self._data
+                data = self._replay_from(base, journal[0], snapshot_signature)
+                # A compaction swaps the snapshot before truncating the journal, so an
+                # unchanged snapshot means the journal we read belongs to it
+                if _stat_signature(self.path) == snapshot_signature:
+                    self._data = data
+                    return data
+                journal = _stat_signature(self.journal_path) or journal
+            self._data = data
+            return data
+
+    def _reset(self, snapshot_signature):
+        self._data = None
+        self._snapshot_signature = snapshot_signature
+        self._journal_inode = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+
+    def _replay_from(self, base: Any, journal_inode: int, snapshot_signature) -> Any:
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self._journal_offset)
+                chunk = f.read()
+        except OSError:
+            return base
+        # A line still being written has no newline yet - leave it for the next load
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            self._journal_inode = journal_inode
+            return base
+
+        replay = _Replay(base)
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                op = json.loads(line)
+                if op.get('op') == COMPACTED:
+                    if snapshot_signature and op.get('snapshot') == list(snapshot_signature):
+                        # Crashed between the swap and the truncate - the entries above are in this snapshot
+                        replay = _Replay(base)
+                        self._journal_entries = 0
+                    continue
+                replay.apply(op)
+            except (ValueError, TypeError, AttributeError):
+                print(f"[JOURNAL] ⚠️ Skipping unreadable entry in {os.path.basename(self.journal_path)}")
+            self._journal_entries += 1
+        self._journal_inode = journal_inode
+        self._journal_offset += end
+        return replay.root
+
+    # ---------- writes ----------
+
+    def set(self, path: Sequence, value: Any):
+        """data[path...] = value"""
+        self._write([{'op': 'set', 'path': _key_path(path), 'value': value}])
+
+    def merge(self, path: Sequence, values: dict):
+        """data[path...].update(values)"""
+        self._write([{'op': 'merge', 'path': _key_path(path), 'value': values}])
+
+    def delete(self, path: Sequence):
+        """del data[path...]"""
+        self._write([{'op': 'delete', 'path': _key_path(path)}])
+
+    def append(self, path: Sequence, value: Any):
+        """data[path...].append(value)"""
+        self._write([{'op': 'append', 'path': _key_path(path), 'value': value}])
+
+    def _write(self, ops: List[dict]):
+        with self._locked():
+            self._append_lines(ops)
+
+    @contextmanager
+    def _locked(self):
+        """Thread lock + cross-process file lock around a write"""
+        with self._lock, FileLock(self.lock_path):
+            yield
+
+    def _append_lines(self, ops: List[dict]):
+        self._append_raw(ops)
+        self.writes += len(ops)
+        self.load()
+        if self._journal_entries >= self.compact_entries:
+            self._compact_locked()
+
+    def _append_raw(self, ops: List[dict]):
+        payload = ''.join(json.dumps(op, separators=(',', ':'), default=str) + '\n' for op in ops)
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+    # ---------- compaction ----------
+
+    def compact(self):
+        """Fold the journal into a new snapshot (atomic swap) and empty the journal"""
+        with self._locked():
+            self._compact_locked()
+
+    def _compact_locked(self):
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        for _ in range(3):
+            data = self.load()
+            journal = _stat_signature(self.journal_path)
+            if journal is None or journal[2] == 0:
+                return
+            based_on = self._snapshot_signature
+            entries = self._journal_entries
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=SNAPSHOT_INDENT)
+                f.flush()
+                os.fsync(f.fileno())
+            if _stat_signature(self.path) != based_on:
+                # Rewritten by a writer that doesn't take the lock - replay the journal onto its version
+                os.remove(tmp_path)
+                continue
+            # os.replace keeps the temp file's inode and mtime, so this names the snapshot-to-be
+            self._append_raw([{'op': COMPACTED, 'snapshot': list(_stat_signature(tmp_path))}])
+            os.replace(tmp_path, self.path)
+            with open(self.journal_path, 'w', encoding='utf-8'):
+                pass
+            self.compactions += 1
+            print(f"[JOURNAL] ✅ Compacted {entries} entries into {os.path.basename(self.path)}")
+            self._reset(None)
+            return
+        print(f"[JOURNAL] ⚠️ {os.path.basename(self.path)} kept changing during compaction - journal kept for next time")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'journal_entries': self._journal_entries,
+                'journal_bytes': self._journal_offset,
+                'writes': self.writes,
+                'compactions': self.compactions,
+            }
+
+
+def _key_path(path: Sequence) -> list:
+    """Journal paths name dict keys - a list position means something else once another writer reorders the list"""
+    path = list(path)
+    if any(isinstance(key, int) for key in path):
+        raise TypeError(f'Journal paths must address dict keys, not list positions: {path}')
+    return path
+
+
+_files: Dict[str, JournaledJSONFile] = {}
+_files_lock = threading.Lock()
+
+
+def journaled(filepath: str, write_through: bool = False) -> JournaledJSONFile:
+    """
+    The process-wide JournaledJSONFile for a path
+    write_through: compact after every write (for files another process also reads and writes)
+    """
+    filepath = os.path.abspath(filepath)
+    with _files_lock:
+        journaled_file = _files.get(filepath)
+        if journaled_file is None:
+            journaled_file = _files[filepath] = JournaledJSONFile(filepath, write_through=write_through)
+        elif write_through:
+            journaled_file.compact_entries = 1
+        return journaled_file
+
+
+if __name__ == '__main__':
+    # python journal.py ../purchases.json ../cape_logs.json  - compact now (e.g. from a scheduled task)
+    for filepath in sys.argv[1:]:
+        journaled(filepath).compact()
@@ -0,0 +1,99 @@
+"""
+mtime-Aware JSON File Cache
+Keeps the parsed contents of the bot's JSON data files in memory and only
+re-parses a file when its modification time or size changes
+"""
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from metrics import metrics
+
+
+class JSONFileCache:
+    """
+    Thread-safe cache of parsed JSON files, keyed by path
+
+    Returned objects are shared between requests - treat them as read-only.
+    """
+
+    def __init__(self, default_factory: Callable[[], Any] = dict):
+        self.default_factory = default_factory
+        # path -> ((mtime_ns, size), data)
+        self._entries: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+        self._lock = threading.Lock()
+        self._path_locks: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, filepath: str) -> Any:
+        """Load a JSON file, re-parsing only if it changed on disk"""
+        signature = self._signature(filepath)
+        if signature is None:
+            return self.default_factory()
+
+        with self._lock:
+            entry = self._entries.get(filepath)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                return entry[1]
+            path_lock = self._path_locks.setdefault(filepath, threading.Lock())
+
+        # One thread parses a changed file; others wait for its result
+        with path_lock:
+            signature = self._signature(filepath)
+            if signature is None:
+                return self.default_factory()
+            with self._lock:
+                entry = self._entries.get(filepath)
+                if entry is not None and entry[0] == signature:
+                    self.hits += 1
+                    return entry[1]
+                self.misses += 1
+
+            try:
+                with metrics.timed(f'parse_json:{os.path.basename(filepath)}'), \
+                        open(filepath, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                data = self.default_factory()
+            except OSError:
+                return self.default_factory()
+
+            with self._lock:
+                self._entries[filepath] = (signature, data)
+            return data
+
+    def signature(self, filepath: str) -> Optional[Tuple[int, int]]:
+        """(mtime_ns, size) of a file, or None if it doesn't exist"""
+        return self._signature(filepath)
+
+    def invalidate(self, filepath: Optional[str] = None):
+        with self._lock:
+            if filepath is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(filepath, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'files': len(self._entries),
+            }
+
+    @staticmethod
+    def _signature(filepath: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+
+# Shared by every route that reads the bot's data files
+json_file_cache = JSONFileCache()
@@ -0,0 +1,188 @@
+"""
+Request and Dependency Metrics
+Latency histograms for every API route, every outbound host (Roblox,
+Discord, the bot API) and our own work (data file parsing), outcome
+counts, image ID resolver attempts, plus the stats() of every cache and
+pool - all served as one JSON document by /api/metrics.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Sequence
+
+# Upper bounds in seconds (the last bucket is +Inf)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Resolver attempts until an image ID was found
+ATTEMPT_BUCKETS = (1, 2, 3, 5, 10, 25)
+
+
+class Histogram:
+    """Fixed-bucket histogram (not thread-safe - the registry holds the lock)"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate from the buckets (linear within the bucket the quantile falls in)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / bucket_count)
+            seen += bucket_count
+        return self.max
+
+    def snapshot(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, bucket_count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            cumulative += bucket_count
+            buckets[str(bound)] = cumulative
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 4),
+            'avg': round(self.sum / self.count, 4) if self.count else None,
+            'max': round(self.max, 4),
+            'p50': _round(self.quantile(0.5)),
+            'p90': _round(self.quantile(0.9)),
+            'p99': _round(self.quantile(0.99)),
+            'buckets': buckets,  # cumulative, Prometheus-style "le" bounds
+        }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 4)
+
+
+def outcome_of(status: Optional[int]) -> str:
+    """Status code -> outcome label ('error' = no response at all)"""
+    if status is None:
+        return 'error'
+    if status == 429:
+        return '429'
+    return f'{status // 100}xx'
+
+
+class Metrics:
+    """Process-wide metrics registry"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self._routes: Dict[str, dict] = {}
+        self._outbound: Dict[str, dict] = {}
+        self._operations: Dict[str, Histogram] = {}
+        self._resolutions: Dict[str, dict] = {}
+        self._components: Dict[str, Callable[[], dict]] = {}
+
+    # ---------- recording ----------
+
+    def observe_route(self, route: str, status: int, seconds: float):
+        """One served request - route is the URL rule ('GET /api/cape-status/<asset_id>'), not the raw path"""
+        with self._lock:
+            entry = self._routes.get(route)
+            if entry is None:
+                entry = self._routes[route] = {'status': {}, 'latency': Histogram()}
+            entry['status'][str(status)] = entry['status'].get(str(status), 0) + 1
+            entry['latency'].observe(seconds)
+
+    def observe_outbound(self, host: str, status: Optional[int], seconds: float):
+        """One outbound HTTP call (status None = connection error/timeout)"""
+        outcome = outcome_of(status)
+        with self._lock:
+            entry = self._outbound.get(host)
+            if entry is None:
+                entry = self._outbound[host] = {'outcomes': {}, 'latency': Histogram()}
+            entry['outcomes'][outcome] = entry['outcomes'].get(outcome, 0) + 1
+            entry['latency'].observe(seconds)
+
+    def observe_operation(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self._operations.get(name)
+            if histogram is None:
+                histogram = self._operations[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timed(self, name: str):
+        """with metrics.timed('parse_json:points.json'): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_operation(name, time.perf_counter() - started)
+
+    def observe_resolution(self, resolver: str, attempts: int, method: Optional[str]):
+        """
+        One image ID resolution finished
+        method: what found it ('thumbnails', 'asset_delivery') or None if nothing did
+        """
+        with self._lock:
+            entry = self._resolutions.get(resolver)
+            if entry is None:
+                entry = self._resolutions[resolver] = {
+                    'resolved': 0, 'unresolved': 0, 'methods': {}, 'attempts': 0,
+                    'attempts_to_success': Histogram(ATTEMPT_BUCKETS),
+                }
+            entry['attempts'] += attempts
+            if method:
+                entry['resolved'] += 1
+                entry['methods'][method] = entry['methods'].get(method, 0) + 1
+                entry['attempts_to_success'].observe(attempts)
+            else:
+                entry['unresolved'] += 1
+
+    def register(self, name: str, stats: Callable[[], dict]):
+        """Include a component's stats() (cache, pool, queue, ...) in the snapshot"""
+        with self._lock:
+            self._components[name] = stats
+
+    # ---------- reading ----------
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            routes = {route: {'status': dict(entry['status']), 'latency': entry['latency'].snapshot()}
+                      for route, entry in self._routes.items()}
+            outbound = {host: {'outcomes': dict(entry['outcomes']), 'latency': entry['latency'].snapshot()}
+                        for host, entry in self._outbound.items()}
+            operations = {name: histogram.snapshot() for name, histogram in self._operations.items()}
+            resolutions = {
+                resolver: dict(entry, methods=dict(entry['methods']),
+                               attempts_to_success=entry['attempts_to_success'].snapshot())
+                for resolver, entry in self._resolutions.items()
+            }
+            components = dict(self._components)
+
+        collected = {}
+        for name, stats in components.items():
+            try:
+                collected[name] = stats()
+            except Exception as e:
+                collected[name] = {'error': str(e)}
+        return {
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'routes': routes,
+            'outbound': outbound,
+            'operations': operations,
+            'image_id_resolution': resolutions,
+            'components': collected,
+        }
+
+
+# Shared by api.py, async_server.py, http_pool.py and the resolvers
+metrics = Metrics()
@@ -106,7 +106,7 @@ class PixlrIntegration {
                 if (xhr.status === 200) {
                     const response = JSON.parse(xhr.responseText);
                     if (response.success) {
-                        this.showSuccess(response.asset_id, response.image_id);
+                        this.showSuccess(response.asset_id, response.image_id, response.job_id, response.job_status);
                     } else {
                         this.showError(response.error || 'Upload failed');
                     }
@@ -134,7 +134,7 @@ class PixlrIntegration {
         }
     }
 
-    showSuccess(assetId, imageId) {
+    showSuccess(assetId, imageId, jobId, jobStatus) {
         this.progressDiv.style.display = 'none';
         this.resultDiv.style.display = 'block';
 
@@ -143,8 +143,67 @@ class PixlrIntegration {
 
         // If image ID is still processing, poll for it
         if (!imageId || imageId === 'Processing...') {
+            if (jobId && jobStatus !== 'rejected') {
+                this.pollResolutionJob(jobId, assetId);
+            } else {
+                this.watchImageId(assetId);
+            }
+        }
+    }
+
+    async pollResolutionJob(jobId, assetId, maxAttempts = 60) {
+        // Background job status is served from memory, so poll it quickly (every 2 seconds)
+        for (let i = 0; i < maxAttempts; i++) {
+            await new Promise(resolve => setTimeout(resolve, 2000));
+
+            try {
+                const response = await fetch(`/api/cape-jobs/${jobId}`);
+                if (!response.ok) break;
+                const job = await response.json();
+
+                if (job.status === 'completed' && job.image_id) {
+                    document.getElementById('image-id').textContent = job.image_id;
+                    return;
+                }
+                if (job.status === 'processing' || job.status === 'failed') break;
+            } catch (error) {
+                console.error('Error polling resolution job:', error);
+            }
+        }
+
+        // Job finished without an image ID (still in moderation) - wait for the server to push it
+        this.watchImageId(assetId);
+    }
+
+    watchImageId(assetId) {
+        // Subscribe to the status event stream - the server resolves once and pushes the result
+        if (!window.EventSource) {
             this.pollForImageId(assetId);
+            return;
         }
+
+        const source = new EventSource(`/api/cape-status/${assetId}/events`);
+        let finished = false;
+
+        source.addEventListener('status', (e) => {
+            finished = true;
+            source.close();
+            const data = JSON.parse(e.data);
+            if (data.image_id && data.image_id !== assetId) {
+                document.getElementById('image-id').textContent = data.image_id;
+            } else {
+                // Server stopped waiting before Roblox finished - keep checking by polling
+                this.pollForImageId(assetId);
+            }
+        });
+
+        source.addEventListener('error', () => {
+            // Stream unavailable (e.g. proxy buffering) - fall back to polling
+            if (finished) return;
+            finished = true;
+            source.close();
+            this.pollForImageId(assetId);
+        });
     }
 
     async pollForImageId(assetId, maxAttempts = 30) {
@@ -0,0 +1,184 @@
+"""
+Rate-Limit-Aware Request Scheduler
+Process-wide, per-host token buckets in front of every outbound call
+(see http_pool.py). A 429/503 with Retry-After pauses the whole host for
+every worker, retries back off with jitter so waiting workers don't wake
+in waves, and all retries against a host draw from one shared budget.
+"""
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from tracing import span
+
+# Per-host limits as "host=rate/burst" (requests per second / bucket size)
+RATE_LIMITS = os.getenv('RATE_LIMITS', 'thumbnails.roblox.com=10/20,assetdelivery.roblox.com=10/20')
+RETRY_BACKOFF_BASE = float(os.getenv('RETRY_BACKOFF_BASE', '1.0'))    # seconds before the first retry
+RETRY_BACKOFF_MAX = float(os.getenv('RETRY_BACKOFF_MAX', '30.0'))     # cap on one backoff
+RETRY_BUDGET_PER_SECOND = float(os.getenv('RETRY_BUDGET_PER_SECOND', '10'))  # retries refilled per host
+RETRY_BUDGET_MAX = float(os.getenv('RETRY_BUDGET_MAX', '100'))        # retries banked per host
+THROTTLE_STATUSES = (429, 503)
+
+
+def parse_limits(spec: str) -> Dict[str, tuple]:
+    """'host=rate/burst,...' -> {host: (rate, burst)}"""
+    limits = {}
+    for item in filter(None, spec.split(',')):
+        host, _, value = item.partition('=')
+        rate, _, burst = value.partition('/')
+        try:
+            limits[host.strip()] = (float(rate), float(burst or rate))
+        except ValueError:
+            print(f"[RATE-LIMIT] ⚠️ Ignoring bad RATE_LIMITS entry: {item}")
+    return limits
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After header (seconds or HTTP date) -> seconds to wait"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostState:
+    """Token bucket, throttle window and retry budget for one host"""
+
+    def __init__(self, rate: Optional[float], burst: Optional[float]):
+        now = time.monotonic()
+        self.rate = rate                  # None = no client-side limit (429s are still honored)
+        self.burst = burst
+        self.tokens = burst or 0.0
+        self.updated = now
+        self.blocked_until = 0.0
+        self.consecutive_throttles = 0
+        self.budget = RETRY_BUDGET_MAX
+        self.budget_updated = now
+        # metrics
+        self.requests = 0
+        self.throttled = 0
+        self.waited_seconds = 0.0
+        self.retries = 0
+        self.retries_denied = 0
+
+
+class RateLimitScheduler:
+    """Per-host token buckets, Retry-After handling and shared retry budgets"""
+
+    def __init__(self, limits: Optional[Dict[str, tuple]] = None):
+        self.limits = parse_limits(RATE_LIMITS) if limits is None else limits
+        self._hosts: Dict[str, HostState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host: str) -> HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            rate, burst = self.limits.get(host, (None, None))
+            state = self._hosts[host] = HostState(rate, burst)
+        return state
+
+    def reserve(self, host: str) -> float:
+        """
+        Take a request slot for the host
+        Returns the seconds the caller must wait before sending (0 = go now).
+        The slot is reserved immediately, so sync and async callers share one queue.
+        """
+        with self._lock:
+            state = self._state(host)
+            now = time.monotonic()
+            state.requests += 1
+            # Tokens only accrue once the host's throttle window is over
+            start = max(now, state.blocked_until)
+            wait = start - now
+            if state.rate:
+                state.tokens = min(state.burst, state.tokens + max(0.0, start - state.updated) * state.rate)
+                state.updated = max(start, state.updated)
+                state.tokens -= 1
+                if state.tokens < 0:
+                    wait += -state.tokens / state.rate
+            state.waited_seconds += wait
+            return wait
+
+    def wait(self, host: str):
+        """Blocking reserve()"""
+        delay = self.reserve(host)
+        if delay > 0:
+            with span('rate_limit_wait', host=host, seconds=round(delay, 3)):
+                time.sleep(delay)
+
+    def observe(self, host: str, status: Optional[int], headers=None):
+        """Feed a response back - 429/503 pauses the host for everyone"""
+        with self._lock:
+            state = self._state(host)
+            if status in THROTTLE_STATUSES:
+                state.throttled += 1
+                state.consecutive_throttles += 1
+                retry_after = parse_retry_after((headers or {}).get('Retry-After'))
+                if retry_after is None:
+                    if status != 429:
+                        return
+                    retry_after = self._jittered(RETRY_BACKOFF_BASE, state.consecutive_throttles)
+                state.blocked_until = max(state.blocked_until, time.monotonic() + min(retry_after, 300.0))
+                # Resume at the configured rate afterwards, not with a full burst
+                state.tokens = min(state.tokens, 0.0)
+                print(f"[RATE-LIMIT] ⏳ {host} returned {status}, pausing it for {retry_after:.1f}s")
+            elif status is not None:
+                state.consecutive_throttles = 0
+
+    def retry_delay(self, host: str, attempt: int, base: float = RETRY_BACKOFF_BASE) -> Optional[float]:
+        """
+        Seconds to wait before retry number `attempt` (2 = first retry)
+        Jittered exponential backoff, never shorter than the host's Retry-After.
+        Returns None when the host's shared retry budget is spent - stop retrying.
+        """
+        with self._lock:
+            state = self._state(host)
+            now = time.monotonic()
+            state.budget = min(RETRY_BUDGET_MAX,
+                               state.budget + (now - state.budget_updated) * RETRY_BUDGET_PER_SECOND)
+            state.budget_updated = now
+            if state.budget < 1:
+                state.retries_denied += 1
+                return None
+            state.budget -= 1
+            state.retries += 1
+            return max(self._jittered(base, attempt - 1), state.blocked_until - now)
+
+    @staticmethod
+    def _jittered(base: float, exponent: int) -> float:
+        """Equal-jitter exponential backoff: half fixed, half random"""
+        ceiling = min(RETRY_BACKOFF_MAX, base * (2 ** max(0, exponent - 1)))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                host: {
+                    'rate': state.rate,
+                    'burst': state.burst,
+                    'tokens': round(min(state.burst, state.tokens + max(0.0, now - state.updated) * state.rate), 2)
+                    if state.rate else None,
+                    'blocked_for_seconds': round(max(0.0, state.blocked_until - now), 2),
+                    'requests': state.requests,
+                    'throttled': state.throttled,
+                    'waited_seconds': round(state.waited_seconds, 3),
+                    'retries': state.retries,
+                    'retries_denied': state.retries_denied,
+                    'retry_budget': round(min(RETRY_BUDGET_MAX, state.budget + (now - state.budget_updated)
+                                              * RETRY_BUDGET_PER_SECOND), 1),
+                }
+                for host, state in self._hosts.items()
+            }
+
+
+# Shared by http_pool and every retry loop
+rate_limiter = RateLimitScheduler()
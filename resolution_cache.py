@@ -0,0 +1,141 @@
+"""
+Asset ID -> Image ID Resolution Cache
+Image IDs never change once Roblox assigns them, so resolved IDs are kept
+forever in SQLite (survives restarts) with an in-memory LRU in front.
+Assets that are still in moderation get a short-lived negative entry.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+CACHE_PATH = os.getenv('IMAGE_ID_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'image_id_cache.db'))
+LRU_SIZE = int(os.getenv('IMAGE_ID_CACHE_LRU_SIZE', '4096'))
+NEGATIVE_TTL = float(os.getenv('IMAGE_ID_NEGATIVE_TTL', '30'))
+
+
+class ResolutionCache:
+    """Two-level (LRU + SQLite) cache of asset_id -> image_id"""
+
+    def __init__(self, path: str = CACHE_PATH, lru_size: int = LRU_SIZE, negative_ttl: float = NEGATIVE_TTL):
+        self.path = path
+        self.lru_size = lru_size
+        self.negative_ttl = negative_ttl
+        # asset_id -> (image_id, expires_at); image_id None marks a negative entry
+        self._lru: "OrderedDict[str, Tuple[Optional[str], Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS image_ids ('
+            ' asset_id TEXT PRIMARY KEY,'
+            ' image_id TEXT NOT NULL,'
+            ' resolved_at REAL NOT NULL)'
+        )
+        self._db.commit()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def lookup(self, asset_id: str) -> Tuple[bool, Optional[str]]:
+        """
+        Look up an asset ID
+
+        Returns:
+            (found, image_id). found with image_id None means the asset was
+            checked recently and is still processing.
+        """
+        asset_id = str(asset_id)
+        with self._lock:
+            entry = self._lru.get(asset_id)
+            if entry is not None:
+                image_id, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self._lru.move_to_end(asset_id)
+                    if image_id:
+                        self.hits += 1
+                    else:
+                        self.negative_hits += 1
+                    return True, image_id
+                del self._lru[asset_id]
+
+            row = self._db.execute('SELECT image_id FROM image_ids WHERE asset_id = ?', (asset_id,)).fetchone()
+            if row:
+                self._remember(asset_id, row[0], None)
+                self.hits += 1
+                return True, row[0]
+
+            self.misses += 1
+            return False, None
+
+    def get(self, asset_id: str) -> Optional[str]:
+        """Get a cached image ID (positive entries only)"""
+        return self.lookup(asset_id)[1]
+
+    def put(self, asset_id: str, image_id: str):
+        """Store a resolved image ID permanently"""
+        asset_id, image_id = str(asset_id), str(image_id)
+        with self._lock:
+            self._remember(asset_id, image_id, None)
+            self._db.execute(
+                'INSERT OR REPLACE INTO image_ids (asset_id, image_id, resolved_at) VALUES (?, ?, ?)',
+                (asset_id, image_id, time.time())
+            )
+            self._db.commit()
+
+    def put_negative(self, asset_id: str, ttl: Optional[float] = None):
+        """Mark an asset as still processing for a short while (memory only)"""
+        ttl = self.negative_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._remember(str(asset_id), None, time.time() + ttl)
+
+    def resolve(self, asset_id: str, resolver: Callable[[str], Optional[str]], refresh: bool = False) -> Optional[str]:
+        """
+        Read-through resolve: only calls resolver on a cache miss
+        refresh: also call it past a negative entry (for callers that keep waiting on the asset)
+        """
+        found, image_id = self.lookup(asset_id)
+        if found and (image_id or not refresh):
+            return image_id
+        image_id = resolver(str(asset_id))
+        if image_id:
+            self.put(asset_id, image_id)
+        else:
+            self.put_negative(asset_id)
+        return image_id
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'lru_entries': len(self._lru),
+            }
+
+    def _remember(self, asset_id: str, image_id: Optional[str], expires_at: Optional[float]):
+        # Never let a negative entry shadow a known image ID
+        current = self._lru.get(asset_id)
+        if image_id is None and current is not None and current[0]:
+            return
+        self._lru[asset_id] = (image_id, expires_at)
+        self._lru.move_to_end(asset_id)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+
+_cache: Optional[ResolutionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_resolution_cache() -> ResolutionCache:
+    """Get the process-wide resolution cache (opened on first use)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResolutionCache()
+    return _cache
@@ -0,0 +1,130 @@
+"""
+Single-Flight Call Coalescing
+Concurrent callers asking for the same key share ONE in-flight call
+instead of each running their own (slow) resolution loop
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Any = None
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []  # do_async() callers
+        self.task: Optional[asyncio.Task] = None  # do_async() leader's call (referenced so it isn't collected)
+
+
+def _settle(future: asyncio.Future, result: Any, error: Optional[BaseException]):
+    if future.done():
+        return  # That caller was cancelled
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key - threads (do) and coroutines
+    (do_async, from any event loop) join the same flights
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def _join(self, key: Hashable, waiter=None) -> Tuple[_Call, bool]:
+        """(call, leader?) - the call already running for key, or a new one this caller leads"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            if waiter is not None:
+                call.waiters.append(waiter)
+        return call, leader
+
+    def _finish(self, key: Hashable, call: _Call, result: Any, error: Optional[BaseException]):
+        call.result = result
+        call.error = error
+        with self._lock:
+            del self._calls[key]
+            waiters, call.waiters = call.waiters, []
+        call.done.set()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_settle, future, result, error)
+            except RuntimeError:
+                pass  # That caller's loop is closed
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn() for key, or wait for the call already running for key
+
+        Errors raised by the leader are re-raised in every waiter.
+        """
+        call, leader = self._join(key)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, call, None, e)
+            raise
+        self._finish(key, call, result, None)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable]) -> Any:
+        """
+        Await fn() for key, or the call already running for key (from do() or do_async())
+
+        Waiting costs no thread. The leader's fn() runs as its own task, so a
+        cancelled caller doesn't cancel the call for everyone else.
+        """
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        call, leader = self._join(key, (loop, waiter))
+        if leader:
+            def finished(task: asyncio.Task):
+                if task.cancelled():
+                    self._finish(key, call, None, RuntimeError(f'Call for {key} was cancelled'))
+                elif task.exception() is not None:
+                    self._finish(key, call, None, task.exception())
+                else:
+                    self._finish(key, call, task.result(), None)
+            call.task = loop.create_task(fn())
+            call.task.add_done_callback(finished)
+        return await waiter
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'in_flight': len(self._calls), 'leaders': self.leaders, 'shared': self.shared}
+
+
+# Shared by every image ID resolver path, keyed by image_id_flight_key()
+image_id_flights = SingleFlight()
+
+
+def image_id_flight_key(asset_id, max_retries: int, refresh: bool = False) -> str:
+    """
+    Flight key for one resolution - the retry budget (and refresh) is part of it,
+    so a caller never joins a flight that gives up sooner than it would
+    """
+    return f'{asset_id}:{max_retries}:refresh' if refresh else f'{asset_id}:{max_retries}'
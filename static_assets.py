@@ -0,0 +1,244 @@
+"""
+Static Asset Pipeline
+Builds the website's HTML/CSS/JS/image files once at startup:
+  - content fingerprints (styles.css -> styles.<hash>.css) with immutable caching
+  - strong ETags (one per encoding) and 304 Not Modified for everything else
+  - precompressed gzip (and brotli, if installed) variants
+  - small files kept in memory; large variants spilled to .static_cache/
+HTML pages are rewritten to reference the fingerprinted URLs.
+"""
+import gzip
+import hashlib
+import os
+import re
+import threading
+from typing import Dict, Optional
+
+from flask import Response, request
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Web asset types handled by the pipeline (anything else falls back to send_from_directory)
+MIME_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+    '.json': 'application/json',
+    '.svg': 'image/svg+xml',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.ico': 'image/x-icon',
+    '.woff2': 'font/woff2',
+}
+COMPRESSIBLE = {'.html', '.css', '.js', '.json', '.svg'}
+
+STATIC_MEMORY_MAX = int(os.getenv('STATIC_MEMORY_MAX', str(256 * 1024)))  # bytes per variant kept in RAM
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+# src="x.js" / href="x.css" references to local files
+REFERENCE_PATTERN = re.compile(r'''((?:src|href)\s*=\s*["'])([^"'#?:]+)(["'])''')
+
+
+class StaticAsset:
+    """One built file and its encoded variants"""
+
+    def __init__(self, relpath: str, content: bytes, mtime_size: tuple, cache_dir: str, references=()):
+        self.relpath = relpath
+        self.references = frozenset(references)  # local assets a page points at
+        self.ext = os.path.splitext(relpath)[1].lower()
+        self.mimetype = MIME_TYPES[self.ext]
+        self.mtime_size = mtime_size
+        digest = hashlib.sha256(content).hexdigest()
+        self.etag = digest[:32]
+        stem, ext = os.path.splitext(relpath)
+        self.fingerprinted = f'{stem}.{digest[:10]}{ext}'
+        # encoding ('identity'/'gzip'/'br') -> bytes in memory or a path on disk
+        self.variants: Dict[str, object] = {}
+        self._add_variant('identity', content, cache_dir)
+        if self.ext in COMPRESSIBLE and len(content) > 256:
+            gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+            if len(gzipped) < len(content):
+                self._add_variant('gzip', gzipped, cache_dir)
+            if BROTLI_AVAILABLE:
+                compressed = brotli.compress(content, quality=11)
+                if len(compressed) < len(content):
+                    self._add_variant('br', compressed, cache_dir)
+
+    def _add_variant(self, encoding: str, data: bytes, cache_dir: str):
+        if len(data) <= STATIC_MEMORY_MAX:
+            self.variants[encoding] = data
+            return
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f'{self.etag}.{encoding}')
+        if not os.path.exists(path):
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        self.variants[encoding] = path
+
+    def pick_encoding(self, accept_encoding: str) -> str:
+        accepted = {part.split(';')[0].strip().lower() for part in accept_encoding.split(',')}
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and encoding in accepted:
+                return encoding
+        return 'identity'
+
+    def body(self, encoding: str) -> bytes:
+        variant = self.variants[encoding]
+        if isinstance(variant, bytes):
+            return variant
+        with open(variant, 'rb') as f:
+            return f.read()
+
+
+def _source_signature(path: str) -> Optional[tuple]:
+    """(mtime_ns, size) of a source file, or None if it's gone"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class StaticPipeline:
+    """Manifest of built assets, rebuilt per file when the source changes"""
+
+    def __init__(self, root: str, cache_dir: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        self.cache_dir = cache_dir or os.path.join(self.root, '.static_cache')
+        self._assets: Dict[str, StaticAsset] = {}          # relpath -> asset
+        self._fingerprints: Dict[str, str] = {}           # fingerprinted relpath -> relpath
+        self._lock = threading.RLock()
+
+    def build(self):
+        """Build every web asset under the root (HTML last, so references resolve)"""
+        with self._lock:
+            paths = []
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                dirnames[:] = [d for d in dirnames if not d.startswith('.') and d != '__pycache__']
+                for filename in filenames:
+                    if os.path.splitext(filename)[1].lower() in MIME_TYPES:
+                        paths.append(os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, '/'))
+            paths.sort(key=lambda path: path.endswith('.html'))
+            for relpath in paths:
+                self._build(relpath)
+            print(f"[STATIC] ✅ Built {len(self._assets)} assets (brotli: {'on' if BROTLI_AVAILABLE else 'off'})")
+
+    def _build(self, relpath: str) -> Optional[StaticAsset]:
+        source = os.path.join(self.root, relpath)
+        try:
+            st = os.stat(source)
+            with open(source, 'rb') as f:
+                content = f.read()
+        except OSError:
+            self._forget(relpath)
+            return None
+        references = set()
+        if relpath.endswith('.html'):
+            content = self._rewrite_references(relpath, content, references)
+        asset = StaticAsset(relpath, content, (st.st_mtime_ns, st.st_size), self.cache_dir, references)
+
+        previous = self._assets.get(relpath)
+        if previous is not None:
+            self._fingerprints.pop(previous.fingerprinted, None)
+        self._assets[relpath] = asset
+        self._fingerprints[asset.fingerprinted] = relpath
+
+        # Pages embed fingerprints, so they must be rebuilt when a referenced asset changes
+        if previous is not None and previous.etag != asset.etag and not relpath.endswith('.html'):
+            for other in [path for path, page in self._assets.items() if relpath in page.references]:
+                self._build(other)
+        return asset
+
+    def _forget(self, relpath: str):
+        asset = self._assets.pop(relpath, None)
+        if asset is not None:
+            self._fingerprints.pop(asset.fingerprinted, None)
+
+    def _rewrite_references(self, relpath: str, content: bytes, references: set) -> bytes:
+        base_dir = os.path.dirname(relpath)
+
+        def replace(match):
+            reference = match.group(2)
+            target = os.path.normpath(os.path.join(base_dir, reference)).replace(os.sep, '/')
+            asset = self._assets.get(target)
+            if asset is None or target.endswith('.html'):
+                return match.group(0)
+            references.add(target)
+            fingerprinted_name = os.path.basename(asset.fingerprinted)
+            return f'{match.group(1)}{os.path.join(os.path.dirname(reference), fingerprinted_name).replace(os.sep, "/")}{match.group(3)}'
+
+        return REFERENCE_PATTERN.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+    def _fresh(self, relpath: str, signature: Optional[tuple]) -> Optional[StaticAsset]:
+        """The built asset, rebuilt first if its source signature changed (None if it's gone)"""
+        asset = self._assets.get(relpath)
+        if asset is None:
+            return None
+        if signature is None:
+            self._forget(relpath)
+            return None
+        if signature != asset.mtime_size:
+            asset = self._build(relpath)
+        return asset
+
+    def lookup(self, relpath: str):
+        """(asset, fingerprinted?) for a request path, or (None, False) - picks up source edits without a restart"""
+        relpath = relpath.lstrip('/')
+        with self._lock:
+            fingerprinted = relpath in self._fingerprints
+            source_path = self._fingerprints.get(relpath, relpath)
+            asset = self._assets.get(source_path)
+            if asset is None:
+                return None, False
+            # Pages embed fingerprints: check the assets this one references first,
+            # so a page never points at a fingerprint that is about to go stale
+            paths = sorted(asset.references) + [source_path]
+
+        # Stat outside the lock - only a changed file takes it for a rebuild
+        signatures = [_source_signature(os.path.join(self.root, path)) for path in paths]
+        with self._lock:
+            for path, signature in zip(paths, signatures):
+                self._fresh(path, signature)
+            asset = self._assets.get(source_path)
+            if asset is None:
+                return None, False
+            if fingerprinted and asset.fingerprinted != relpath:
+                return None, False  # The source changed since - that fingerprint's content is gone
+            return asset, fingerprinted
+
+    def serve(self, relpath: str) -> Optional[Response]:
+        """Flask response for a built asset, or None if the pipeline doesn't know the path"""
+        asset, fingerprinted = self.lookup(relpath)
+        if asset is None:
+            return None
+
+        # Each encoding is its own representation, so each gets its own strong ETag
+        encoding = asset.pick_encoding(request.headers.get('Accept-Encoding', ''))
+        etag = f'"{asset.etag}"' if encoding == 'identity' else f'"{asset.etag}-{encoding}"'
+        headers = {
+            'ETag': etag,
+            'Cache-Control': IMMUTABLE_CACHE if fingerprinted else REVALIDATE_CACHE,
+            'Vary': 'Accept-Encoding',
+        }
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in if_none_match or if_none_match.strip() == '*':
+            return Response(status=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        body = asset.body(encoding) if request.method != 'HEAD' else b''
+        # MIME_TYPES already carry the charset - content_type keeps Flask from appending another
+        response = Response(body, content_type=asset.mimetype, headers=headers)
+        if request.method == 'HEAD':
+            response.headers['Content-Length'] = str(len(asset.body(encoding)))
+        return response
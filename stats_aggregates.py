@@ -0,0 +1,72 @@
+"""
+Materialized Stats Aggregates
+Running totals behind /api/stats (completed capes, revenue, users with
+points, pending tickets) kept in memory and updated incrementally:
+  - completed capes move by the rows each cape store sync adds/removes
+  - per-file values are recomputed only when that file's signature changes
+Reading them costs the same no matter how much data the bot has logged.
+"""
+import os
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+from cape_store import CapeStore, SOURCE_PURCHASES
+from journal import journaled
+
+CAPE_PRICE = 40  # dollars per completed cape, for the revenue figure
+
+
+def count_users_with_points(points_data) -> int:
+    return len(points_data) if isinstance(points_data, dict) else 0
+
+
+def ticket_counter_value(ticket_counter) -> int:
+    return ticket_counter.get('counter', 0) if isinstance(ticket_counter, dict) else 0
+
+
+class StatsAggregates:
+    """In-memory aggregates over the bot's data files"""
+
+    def __init__(self, store: CapeStore, data_dir: str):
+        self.store = store
+        self.data_dir = data_dir
+        self._lock = threading.Lock()
+        # Seed from the index, then follow its deltas (purchases rows added/removed per sync)
+        self.completed_capes = store.count(SOURCE_PURCHASES)
+        store.add_listener(self._on_store_change)
+        # filename -> (signature, value)
+        self._file_values: Dict[str, Tuple[Any, Any]] = {}
+
+    def _on_store_change(self, source: str, added, removed):
+        if source != SOURCE_PURCHASES:
+            return
+        with self._lock:
+            self.completed_capes += len(added) - len(removed)
+
+    def _file_value(self, filename: str, compute: Callable[[Any], Any]) -> Any:
+        """compute(parsed file), redone only when the file changes"""
+        filepath = os.path.join(self.data_dir, filename)
+        signature = journaled(filepath).signature()
+        with self._lock:
+            cached = self._file_values.get(filename)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+        value = compute(journaled(filepath).load())
+        with self._lock:
+            self._file_values[filename] = (signature, value)
+        return value
+
+    def snapshot(self) -> dict:
+        """Current aggregates (applies any file changes first)"""
+        self.store.sync()
+        total_tickets = self._file_value('ticket_counter.json', ticket_counter_value)
+        users_with_points = self._file_value('points.json', count_users_with_points)
+        with self._lock:
+            completed = max(0, self.completed_capes)
+        return {
+            'completed_capes': completed,
+            'revenue': completed * CAPE_PRICE,
+            'users_with_points': users_with_points,
+            'total_tickets': total_tickets,
+            'pending_tickets': max(0, total_tickets - completed),
+        }
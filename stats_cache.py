@@ -0,0 +1,97 @@
+"""
+Stale-While-Revalidate Background Cache
+A value is recomputed on a background thread at a fixed interval and
+requests are always served from memory with freshness metadata attached,
+so a slow upstream never shows up in request latency
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from metrics import metrics
+
+
+class BackgroundRefresher:
+    """Keeps the result of compute() fresh in memory"""
+
+    def __init__(self, name: str, compute: Callable[[], Any], interval: float, default: Any = None,
+                 stale_after: Optional[float] = None):
+        self.name = name
+        self.compute = compute
+        self.interval = interval
+        self.stale_after = stale_after if stale_after is not None else interval * 3
+        self.default = default
+        self._value: Any = None
+        self._refreshed_at: Optional[float] = None
+        self._refreshed_wall: Optional[str] = None
+        self._last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._refreshing = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the refresh thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=f'refresh-{self.name}', daemon=True)
+            self._thread.start()
+
+    def refresh_now(self):
+        """Ask the background thread to refresh immediately (doesn't wait)"""
+        self._wake.set()
+
+    def get(self) -> tuple:
+        """
+        Get the cached value without blocking
+
+        Returns:
+            (value, freshness) - value is the default until the first refresh
+        """
+        self.start()
+        with self._lock:
+            value = self._value if self._refreshed_at is not None else self.default
+            return value, self._freshness()
+
+    def stats(self) -> dict:
+        """Freshness of the cached value (for monitoring)"""
+        with self._lock:
+            return self._freshness()
+
+    def _freshness(self) -> dict:
+        age = time.monotonic() - self._refreshed_at if self._refreshed_at is not None else None
+        return {
+            'refreshed_at': self._refreshed_wall,
+            'age_seconds': round(age, 2) if age is not None else None,
+            'stale': age is None or age > self.stale_after,
+            'refreshing': self._refreshing,
+            'refresh_interval': self.interval,
+            'last_error': self._last_error,
+        }
+
+    def _run(self):
+        while True:
+            self._refresh()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _refresh(self):
+        with self._lock:
+            self._refreshing = True
+        try:
+            with metrics.timed(f'refresh:{self.name}'):
+                value = self.compute()
+            with self._lock:
+                self._value = value
+                self._refreshed_at = time.monotonic()
+                self._refreshed_wall = datetime.now().isoformat()
+                self._last_error = None
+        except Exception as e:
+            print(f"[CACHE] ⚠️ Refreshing {self.name} failed: {e}")
+            with self._lock:
+                self._last_error = str(e)
+        finally:
+            with self._lock:
+                self._refreshing = False
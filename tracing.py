@@ -0,0 +1,226 @@
+"""
+Sampled Request Tracing
+Opt-in (TRACE_SAMPLE_RATE > 0): a sampled request records a tree of timed
+spans - outbound HTTP attempts, rate-limit waits, retry backoff sleeps,
+data file loads, JSON serialization. Requests slower than
+TRACE_SLOW_SECONDS have their span tree printed and kept for
+/api/traces/slow.
+
+Turned off, no hooks are installed and span() returns a shared no-op
+context manager after one flag check.
+"""
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from typing import List, Optional
+
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))     # 0 = off, 1 = every request
+TRACE_SLOW_SECONDS = float(os.getenv('TRACE_SLOW_SECONDS', '5'))    # log requests slower than this
+TRACE_SLOW_KEEP = int(os.getenv('TRACE_SLOW_KEEP', '50'))           # slow traces kept in memory
+TRACE_HEADER = 'X-Trace'  # "X-Trace: 1" samples a request regardless of the rate (while tracing is on)
+TRACING_ENABLED = TRACE_SAMPLE_RATE > 0
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('trace_span', default=None)
+
+
+class _NoopSpan:
+    """What span() returns when the request isn't traced"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """One timed step; the root span of a trace is the request itself"""
+
+    __slots__ = ('name', 'attrs', 'trace_id', 'start', 'end', 'children', '_token')
+
+    def __init__(self, name: str, trace_id: str, attrs: Optional[dict] = None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.trace_id = trace_id
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: List['Span'] = []
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        _current_span.reset(self._token)
+        return False
+
+    def set(self, **attrs):
+        """Attach details found out while the span runs (status code, attempt, ...)"""
+        self.attrs.update(attrs)
+
+    @property
+    def seconds(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self, origin: Optional[float] = None) -> dict:
+        origin = self.start if origin is None else origin
+        return {
+            'name': self.name,
+            'offset': round(self.start - origin, 4),
+            'seconds': round(self.seconds, 4),
+            'attrs': self.attrs,
+            'children': [child.to_dict(origin) for child in list(self.children)],
+        }
+
+    def format_tree(self, depth: int = 0) -> List[str]:
+        attrs = ' '.join(f'{key}={value}' for key, value in self.attrs.items())
+        lines = [f"{'  ' * (depth + 1)}{self.seconds:8.3f}s  {self.name}{'  ' + attrs if attrs else ''}"]
+        for child in list(self.children):
+            lines.extend(child.format_tree(depth + 1))
+        return lines
+
+
+def span(name: str, **attrs):
+    """
+    with span('backoff', seconds=wait_time): time.sleep(wait_time)
+    Times the block as a child of the current span, if this request is traced
+    """
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    child = Span(name, parent.trace_id, attrs)
+    parent.children.append(child)
+    return child
+
+
+def current_span() -> Optional[Span]:
+    """The span this context is in (None if the request isn't traced) - for handing work to another thread"""
+    return _current_span.get() if TRACING_ENABLED else None
+
+
+def shared_span(name: str, parents: List[Optional[Span]], **attrs):
+    """
+    with shared_span('thumbnails_batch', waiting_spans): ...
+    Times work done once on behalf of several requests (e.g. on a background
+    thread) and records it in the trace of every traced one
+    """
+    parents = [parent for parent in parents if parent is not None]
+    if not parents:
+        return NOOP_SPAN
+    child = Span(name, parents[0].trace_id, attrs)
+    for parent in parents:
+        parent.children.append(child)
+    return child
+
+
+def dumps(obj, **kwargs) -> str:
+    """json.dumps inside a 'json_serialize' span"""
+    with span('json_serialize'):
+        return json.dumps(obj, **kwargs)
+
+
+class Tracer:
+    """Starts/finishes request traces and keeps the slow ones"""
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, slow_seconds: float = TRACE_SLOW_SECONDS,
+                 keep: int = TRACE_SLOW_KEEP):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self._slow = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self.sampled = 0
+        self.slow = 0
+
+    def start(self, name: str, force: bool = False) -> Optional[Span]:
+        """Root span for a request (entered), or None if it isn't sampled"""
+        if not TRACING_ENABLED or not (force or random.random() < self.sample_rate):
+            return None
+        root = Span(name, uuid.uuid4().hex[:16])
+        root.__enter__()
+        with self._lock:
+            self.sampled += 1
+        return root
+
+    def finish(self, root: Optional[Span], **attrs):
+        if root is None:
+            return
+        root.set(**attrs)
+        try:
+            root.__exit__(None, None, None)
+        except ValueError:
+            # Finished from another context than it started in - the timing is still right
+            root.end = time.perf_counter()
+        if root.seconds >= self.slow_seconds:
+            self._log_slow(root)
+
+    def _log_slow(self, root: Span):
+        with self._lock:
+            self.slow += 1
+            self._slow.append({'trace_id': root.trace_id, 'finished_at': time.time(), **root.to_dict()})
+        print(f"[TRACE] 🐢 Slow request {root.name} took {root.seconds:.2f}s (trace {root.trace_id})\n"
+              + '\n'.join(root.format_tree()))
+
+    def recent_slow(self) -> list:
+        with self._lock:
+            return list(self._slow)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': TRACING_ENABLED,
+                'sample_rate': self.sample_rate,
+                'slow_seconds': self.slow_seconds,
+                'sampled': self.sampled,
+                'slow': self.slow,
+            }
+
+
+tracer = Tracer()
+
+
+def install_flask(app):
+    """Trace sampled Flask requests (no-op while tracing is off)"""
+    if not TRACING_ENABLED:
+        return
+    from flask import g, request
+    from flask.json.provider import DefaultJSONProvider
+
+    class TracedJSONProvider(DefaultJSONProvider):
+        def response(self, *args, **kwargs):
+            with span('json_serialize'):
+                return super().response(*args, **kwargs)
+
+    app.json = TracedJSONProvider(app)
+
+    @app.before_request
+    def start_trace():
+        g.trace = tracer.start(f'{request.method} {request.path}', force=request.headers.get(TRACE_HEADER) == '1')
+
+    @app.after_request
+    def tag_trace(response):
+        root = g.get('trace')
+        if root is not None:
+            root.set(status=response.status_code)
+            response.headers['X-Trace-Id'] = root.trace_id
+        return response
+
+    @app.teardown_request
+    def finish_trace(exc):
+        tracer.finish(g.pop('trace', None))
@@ -0,0 +1,104 @@
+"""
+Cape Upload Deduplication Index
+Maps the SHA-256 of a normalized cape image to the Roblox asset it was
+uploaded as (and its image ID once known), persisted in SQLite. A repeat
+upload of the same image returns the existing IDs without calling Roblox.
+An upload with ?force=1 skips the lookup, and its record() replaces the
+entry - the way out when the stored asset was moderated or deleted.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from resolution_cache import get_resolution_cache
+
+INDEX_PATH = os.getenv('CAPE_UPLOAD_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cape_upload_index.db'))
+
+
+def content_hash(data: bytes) -> str:
+    """Dedup key for an upload - hash the NORMALIZED bytes, so metadata-only differences collapse"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class UploadIndex:
+    """content hash -> (asset_id, image_id)"""
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS uploads ('
+            ' content_hash TEXT PRIMARY KEY,'
+            ' asset_id TEXT NOT NULL,'
+            ' image_id TEXT,'
+            ' uploaded_at REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS idx_uploads_asset_id ON uploads (asset_id)')
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, digest: str) -> Optional[dict]:
+        """
+        Existing upload for a content hash
+
+        Returns:
+            {'asset_id', 'image_id'} (image_id None while unresolved), or None
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT asset_id, image_id FROM uploads WHERE content_hash = ?', (digest,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        asset_id, image_id = row
+        if not image_id:
+            # Resolved since the upload? The resolution cache has it then
+            image_id = get_resolution_cache().get(asset_id)
+            if image_id:
+                self.set_image_id(asset_id, image_id)
+        return {'asset_id': asset_id, 'image_id': image_id}
+
+    def record(self, digest: str, asset_id: str, image_id: Optional[str] = None):
+        """Remember a completed upload (replaces any earlier asset for the same image)"""
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO uploads (content_hash, asset_id, image_id, uploaded_at) VALUES (?, ?, ?, ?)',
+                (digest, str(asset_id), image_id, time.time())
+            )
+            self._db.commit()
+
+    def set_image_id(self, asset_id: str, image_id: str):
+        with self._lock:
+            self._db.execute('UPDATE uploads SET image_id = ? WHERE asset_id = ?', (str(image_id), str(asset_id)))
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'uploads': self._db.execute('SELECT COUNT(*) FROM uploads').fetchone()[0],
+            }
+
+
+_index: Optional[UploadIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_upload_index() -> UploadIndex:
+    """Get the process-wide upload index (opened on first use)"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = UploadIndex()
+    return _index
@@ -0,0 +1,113 @@
+"""
+Username Search Index
+In-memory n-gram index over the distinct usernames in the cape history,
+so substring and prefix searches don't scan every cape record
+"""
+import bisect
+import threading
+from typing import Dict, Iterable, List, Set
+
+GRAM_SIZE = 3
+
+
+def _grams(text: str, size: int) -> Set[str]:
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class UsernameIndex:
+    """
+    Case-insensitive substring/prefix index of usernames
+
+    Every 1-, 2- and 3-gram of each (upper-cased) username points at the
+    usernames containing it. Queries shorter than 3 characters are a single
+    posting lookup; longer ones intersect their trigram postings and verify.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}            # original username -> number of records
+        self._by_key: Dict[str, Set[str]] = {}       # upper-cased username -> original spellings
+        self._postings: Dict[str, Set[str]] = {}     # gram -> upper-cased usernames
+        self._sorted_keys: List[str] = []
+
+    def add(self, username: str, count: int = 1):
+        username = str(username)
+        with self._lock:
+            current = self._counts.get(username, 0)
+            self._counts[username] = current + count
+            if current:
+                return
+            key = username.upper()
+            spellings = self._by_key.setdefault(key, set())
+            spellings.add(username)
+            if len(spellings) == 1:
+                for size in range(1, GRAM_SIZE + 1):
+                    for gram in _grams(key, size):
+                        self._postings.setdefault(gram, set()).add(key)
+                bisect.insort(self._sorted_keys, key)
+
+    def remove(self, username: str, count: int = 1):
+        username = str(username)
+        with self._lock:
+            current = self._counts.get(username, 0)
+            if current > count:
+                self._counts[username] = current - count
+                return
+            self._counts.pop(username, None)
+            key = username.upper()
+            spellings = self._by_key.get(key)
+            if spellings is None:
+                return
+            spellings.discard(username)
+            if spellings:
+                return
+            del self._by_key[key]
+            for size in range(1, GRAM_SIZE + 1):
+                for gram in _grams(key, size):
+                    posting = self._postings.get(gram)
+                    if posting is not None:
+                        posting.discard(key)
+                        if not posting:
+                            del self._postings[gram]
+            position = bisect.bisect_left(self._sorted_keys, key)
+            if position < len(self._sorted_keys) and self._sorted_keys[position] == key:
+                del self._sorted_keys[position]
+
+    def update(self, added: Iterable[str], removed: Iterable[str]):
+        for username in removed:
+            self.remove(username)
+        for username in added:
+            self.add(username)
+
+    def search(self, query: str) -> Set[str]:
+        """Usernames (original spelling) containing query, case-insensitive"""
+        query = query.upper()
+        with self._lock:
+            if not query:
+                return set(self._counts)
+            if len(query) <= GRAM_SIZE:
+                keys = set(self._postings.get(query, ()))
+            else:
+                postings = [self._postings.get(gram) for gram in _grams(query, GRAM_SIZE)]
+                if not all(postings):
+                    return set()
+                postings.sort(key=len)
+                keys = set.intersection(*postings)
+                keys = {key for key in keys if query in key}
+            return {username for key in keys for username in self._by_key[key]}
+
+    def search_prefix(self, prefix: str) -> Set[str]:
+        """Usernames (original spelling) starting with prefix, case-insensitive"""
+        prefix = prefix.upper()
+        with self._lock:
+            start = bisect.bisect_left(self._sorted_keys, prefix)
+            matches = set()
+            for key in self._sorted_keys[start:]:
+                if not key.startswith(prefix):
+                    break
+                matches.update(self._by_key[key])
+            return matches
+
+    def __len__(self):
+        with self._lock:
+            return len(self._counts)